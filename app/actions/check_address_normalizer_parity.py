@@ -0,0 +1,71 @@
+"""
+Compare the offline address normalizer with pagc, on a sample of address records. pagc needs
+Postgres with PostGIS's address standardizer, e.g. the db service in docker-compose.yml:
+
+    DB_ENGINE=postgres POSTGRES_PORT=15432 python -m app.actions.check_address_normalizer_parity
+"""
+
+from typing import List, Tuple
+
+from sqlmodel import Session, select
+
+from app.address_normalizer import normalize_address_offline
+from app.db import get_engine
+from app.models.address_record import AddressRecord, pagc_normalize_addresses
+from app.models.dol_disclosure_job_order import DolDisclosureJobOrder  # noqa
+from app.models.employer_record_address_link import EmployerRecordAddressLink  # noqa
+from app.settings import DB_ENGINE
+
+
+def get_mismatches(
+    addresses: List[str], session: Session
+) -> List[Tuple[str, str, str]]:
+    """
+    :param addresses:
+    :param session:
+    :return: (address, pagc normalized address, offline normalized address) for each address the
+    two normalize differently
+    """
+    pagc_normalized = pagc_normalize_addresses(addresses, session)
+    mismatches = []
+    for address in addresses:
+        if address not in pagc_normalized:
+            continue
+        offline = normalize_address_offline(address)
+        if offline != pagc_normalized[address]:
+            mismatches.append((address, pagc_normalized[address], offline))
+    return mismatches
+
+
+def check_address_normalizer_parity(
+    sample_size: int = 1000, max_mismatches: int = 20
+) -> float:
+    """
+    :param sample_size: Number of address records to compare
+    :param max_mismatches: Number of mismatches to print
+    :return: Fraction of the sampled addresses normalized the same way by both
+    """
+    if DB_ENGINE != "postgres":
+        raise Exception("Comparing with pagc needs DB_ENGINE=postgres")
+
+    session = Session(get_engine())
+    records = session.exec(
+        select(AddressRecord).order_by(AddressRecord.id).limit(sample_size)
+    ).all()
+    addresses = sorted({str(record) for record in records if not record.is_null()})
+    mismatches = get_mismatches(addresses, session)
+    # Nothing is saved, the sample is only read.
+    session.rollback()
+    session.close()
+
+    for address, pagc, offline in mismatches[:max_mismatches]:
+        print(f"{address}\n  pagc:    {pagc}\n  offline: {offline}")
+    matched = 1 - len(mismatches) / len(addresses) if addresses else 1.0
+    print(
+        f"Offline normalizer matched pagc for {matched:.1%} of {len(addresses)} addresses"
+    )
+    return matched
+
+
+if __name__ == "__main__":
+    check_address_normalizer_parity()
@@ -0,0 +1,160 @@
+import sys
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+
+import requests
+import rollbar
+from sqlmodel import Session, select
+
+from app import settings
+from app.db import get_engine
+from app.db.bulk import bulk_upsert
+from app.http_client import get_http_session, log_request_metrics
+from app.models.dol_disclosure_job_order import DolDisclosureJobOrder  # noqa
+from app.models.seasonal_jobs_job_order import (
+    NEW_LISTING_DEFAULTS,
+    SeasonalJobsJobOrder,
+)
+
+# The search API won't skip past this many results, so date windows must hold fewer listings.
+SEARCH_API_MAX_SKIP = 100000
+
+
+def get_discovery_payload(window_start: date, window_end: date, skip: int) -> dict:
+    """
+    Search API request body for a page of the listings in a date window.
+    :param window_start:
+    :param window_end: exclusive
+    :param skip:
+    :return:
+    """
+    field = settings.JOBS_API_DATE_FIELD
+    return {
+        "search": "*",
+        "filter": f"{field} ge {window_start.isoformat()}T00:00:00Z and {field} lt {window_end.isoformat()}T00:00:00Z",
+        "select": "case_number,job_title",
+        "orderby": f"{field},case_number",
+        "top": settings.DISCOVER_PAGE_SIZE,
+        "skip": skip,
+    }
+
+
+def save_discovered_listings(session: Session, results: List[dict]) -> int:
+    """
+    Insert listings which aren't already known, as unscraped. Known listings are left as they are.
+    :param session:
+    :param results: search API results
+    :return: number of new listings
+    """
+    titles = {
+        result["case_number"]: result.get("job_title") or ""
+        for result in results
+        if result.get("case_number")
+    }
+    if not titles:
+        return 0
+
+    existing = set(
+        session.exec(
+            select(SeasonalJobsJobOrder.dol_id).where(
+                SeasonalJobsJobOrder.dol_id.in_(list(titles.keys()))  # type: ignore
+            )
+        ).all()
+    )
+    now = datetime.utcnow()
+    rows = [
+        {
+            **NEW_LISTING_DEFAULTS,
+            "dol_id": dol_id,
+            "title": title,
+            "first_seen": now,
+            # last_seen is when a listing was last in the RSS feed, which these haven't been.
+            "last_seen": None,
+        }
+        for dol_id, title in titles.items()
+        if dol_id not in existing
+    ]
+    # Listings the RSS scraper adds in the meantime are skipped by the conflict clause.
+    bulk_upsert(
+        session.connection(),
+        SeasonalJobsJobOrder.__table__,  # type: ignore
+        rows,
+        index_elements=["dol_id"],
+        update_columns=[],
+    )
+    session.commit()
+    return len(rows)
+
+
+def discover_listings(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    window_days: Optional[int] = None,
+) -> int:
+    """
+    Page through the search API for every listing in a date range, DISCOVER_PAGE_SIZE at a time, and
+    add any which aren't known yet as unscraped listings. This catches listings which came and went
+    from the RSS feed between scrapes.
+
+    The range is split into windows of `window_days`, so no window needs more than
+    SEARCH_API_MAX_SKIP results skipping.
+    :param start: defaults to DISCOVER_LOOKBACK_DAYS ago
+    :param end: exclusive, defaults to tomorrow
+    :param window_days: defaults to DISCOVER_WINDOW_DAYS
+    :return: number of new listings
+    """
+    if not settings.JOBS_API_URL:
+        raise Exception("JOBS_API_URL must be set")
+
+    end = end or date.today() + timedelta(days=1)
+    start = start or end - timedelta(days=settings.DISCOVER_LOOKBACK_DAYS + 1)
+    window = timedelta(days=window_days or settings.DISCOVER_WINDOW_DAYS)
+
+    session = Session(get_engine())
+    http = get_http_session()
+    found_count = 0
+    new_count = 0
+    window_start = start
+    while window_start < end:
+        window_end = min(window_start + window, end)
+        skip = 0
+        while True:
+            try:
+                response = http.post(
+                    settings.JOBS_API_URL,
+                    json=get_discovery_payload(window_start, window_end, skip),
+                    headers={"Content-Type": "application/json"},
+                    timeout=30,
+                )
+                if response.status_code != 200:
+                    raise requests.HTTPError(f"status code {response.status_code}")
+                results = response.json()["value"]
+            except (requests.RequestException, ValueError, KeyError) as e:
+                msg = f"Search API call failed for listings from {window_start} to {window_end}, {e!r}"
+                rollbar.report_message(msg, "error")
+                sys.stderr.write(msg)
+                break
+
+            found_count += len(results)
+            new_count += save_discovered_listings(session, results)
+            if len(results) < settings.DISCOVER_PAGE_SIZE:
+                break
+            skip += len(results)
+            if skip >= SEARCH_API_MAX_SKIP:
+                msg = f"Too many listings from {window_start} to {window_end} to page through, use smaller windows"
+                rollbar.report_message(msg, "error")
+                sys.stderr.write(msg)
+                break
+
+        print(
+            f"Discovered listings from {window_start} to {window_end}: {found_count} found, {new_count} new so far"
+        )
+        window_start = window_end
+
+    session.close()
+    log_request_metrics()
+    return new_count
+
+
+if __name__ == "__main__":
+    discover_listings()
@@ -1,16 +1,56 @@
-import io
+import codecs
+import csv
+import hashlib
+import multiprocessing
+import os
+import threading
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from enum import Enum
+from itertools import islice
 from sys import stderr
-from typing import List, Union
+from typing import (
+    IO,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+)
 
 import boto3
+import pyarrow as pa
+import pyarrow.parquet as pq
+import rollbar
 from openpyxl import load_workbook
-from sqlalchemy import func
+from sqlalchemy import and_, bindparam, delete, func, or_, update
 from sqlmodel import Session, select
 
 from app import settings
 from app.db import get_engine
+from app.db.bulk import bulk_insert, bulk_upsert
+from app.db.decoder import RowDecoder
+from app.files import download_s3_object, hash_file, log_peak_rss, spool_s3_object
+from app.files.row_cache import (
+    RowCache,
+    fetch_row_cache,
+    get_row_cache_path,
+    store_row_cache,
+    write_row_cache,
+)
 from app.models.base import DoLDataSource
 from app.models.dol_disclosure_job_order import DolDisclosureJobOrder
+from app.models.dol_disclosure_job_order_address_record_link import (
+    DolDisclosureJobOrderAddressRecordLink,
+)
 from app.models.imported_dataset import ImportedDataset, ImportStatus
 
 valid_col_names = (
@@ -172,10 +212,30 @@ alternate_col_names = {
     "basic_unit_of_pay": "per",
 }
 
+# Rows are merged into existing job orders on this key.
+MERGE_KEY = ("case_number", "visa_class")
+# Columns which record where and when a row was imported, rather than its data, so are left out of
+# its row_hash.
+ROW_HASH_EXCLUDED_COLUMNS = (
+    "id",
+    "employer_record_id",
+    "source",
+    "file_name",
+    "file_row",
+    "first_seen",
+    "last_seen",
+    "row_hash",
+)
+ROW_HASH_COLUMNS = [
+    c.name
+    for c in DolDisclosureJobOrder.__table__.columns  # type: ignore
+    if c.name not in ROW_HASH_EXCLUDED_COLUMNS
+]
+
 s3_client = boto3.client("s3")
 
 
-def row_to_dict(header_row: List[str], row: List) -> dict:
+def row_to_dict(header_row: List[Union[str, None]], row: List) -> dict:
     output_dict = {}
     for i, k in enumerate(header_row):
         if k:
@@ -183,14 +243,732 @@ def row_to_dict(header_row: List[str], row: List) -> dict:
     return output_dict
 
 
+def iter_batches(rows: Iterable, batch_size: int) -> Iterator[List]:
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def map_col_names(raw_col_names: Iterable) -> List[Union[str, None]]:
+    """
+    Map a file's header row onto DolDisclosureJobOrder field names, using alternate_col_names for
+    columns which have been renamed over the years. Unknown columns are mapped to None and ignored.
+    :param raw_col_names:
+    :return:
+    """
+    col_names: List[Union[str, None]] = [str(c).lower() for c in raw_col_names]
+    for i, name in enumerate(col_names):
+        if name not in valid_col_names:
+            if name not in alternate_col_names:
+                print("Missing column names:")
+                print(f"'{name}': '',")
+            col_names[i] = alternate_col_names.get(name)
+    return col_names
+
+
+class DisclosureSource:
+    """
+    Streaming source of rows from a disclosure file.
+
+    Subclasses implement read_header, and iter_rows to yield raw rows (in col_names order) for a given
+    file format.
+    """
+
+    # Number of data rows (excluding the header), or None if the format can't tell up front.
+    row_count: Union[int, None] = None
+    # Whether row_count is exact, rather than an estimate which the file may have more rows than.
+    row_count_exact = True
+    # Whether to convert the file to a row cache before importing, for formats which can only be read
+    # from the start.
+    use_row_cache = False
+
+    def __init__(self, file: Union[str, IO[bytes]]):
+        self.file = file
+        self.header = self.read_header()
+        self.col_names = map_col_names(self.header)
+
+    def read_header(self) -> List:
+        raise NotImplementedError
+
+    def iter_rows(self, start_row: int = 0) -> Iterator[Sequence]:
+        """
+        Iterate over raw data rows.
+        :param start_row: Number of data rows to skip
+        :return:
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class XlsxSource(DisclosureSource):
+    use_row_cache = True
+    row_count_exact = False
+
+    def __init__(self, file: Union[str, IO[bytes]]):
+        self.workbook = load_workbook(
+            filename=file, read_only=True, keep_links=False, data_only=True
+        )
+        self.worksheet = self.workbook.active
+        # In read-only mode max_row comes from the sheet's stored dimensions, which may be missing.
+        if self.worksheet.max_row:
+            self.row_count = self.worksheet.max_row - 1
+        super().__init__(file)
+
+    def read_header(self) -> List:
+        return [c.value for c in self.worksheet[1]]
+
+    def iter_rows(self, start_row: int = 0) -> Iterator[Sequence]:
+        # Row 1 is the header, so data row n is worksheet row n + 1.
+        return self.worksheet.iter_rows(min_row=start_row + 2, values_only=True)
+
+    def close(self) -> None:
+        self.workbook.close()
+
+
+class CsvSource(DisclosureSource):
+    use_row_cache = True
+
+    def __init__(self, file: Union[str, IO[bytes]]):
+        if isinstance(file, str):
+            file = open(file, "rb")  # pylint: disable=consider-using-with
+        # A StreamReader rather than TextIOWrapper, since SpooledTemporaryFile isn't a full IOBase
+        # until Python 3.11. It keeps line endings, so quoted multi-line cells parse correctly.
+        self.text_file = codecs.getreader("utf-8-sig")(file)
+        self.reader = csv.reader(self.text_file)
+        super().__init__(file)
+
+    def read_header(self) -> List:
+        return next(self.reader)
+
+    def iter_rows(self, start_row: int = 0) -> Iterator[Sequence]:
+        # CSV has no nulls, so map empty cells to None to match spreadsheet cells.
+        for row in islice(self.reader, start_row, None):
+            yield [v if v != "" else None for v in row]
+
+    def close(self) -> None:
+        self.text_file.close()
+
+
+class ParquetSource(DisclosureSource):
+    def __init__(self, file: Union[str, IO[bytes]]):
+        self.parquet_file = pq.ParquetFile(file)
+        self.row_count = self.parquet_file.metadata.num_rows
+        super().__init__(file)
+
+    def read_header(self) -> List:
+        return self.parquet_file.schema_arrow.names
+
+    def iter_rows(self, start_row: int = 0) -> Iterator[Sequence]:
+        # Skip whole row groups before start_row without decoding them.
+        row_groups: List[int] = []
+        skip = start_row
+        for i in range(self.parquet_file.num_row_groups):
+            num_rows = self.parquet_file.metadata.row_group(i).num_rows
+            if not row_groups and skip >= num_rows:
+                skip -= num_rows
+                continue
+            row_groups.append(i)
+
+        if not row_groups:
+            return
+
+        for record_batch in self.parquet_file.iter_batches(
+            batch_size=settings.BULK_IMPORT_BATCH_SIZE, row_groups=row_groups
+        ):
+            columns = [c.to_pylist() for c in record_batch.columns]
+            rows: Iterator[tuple] = zip(*columns)
+            if skip:
+                rows = islice(rows, skip, None)
+                skip = max(0, skip - record_batch.num_rows)
+            yield from rows
+
+
+class RowCacheSource(DisclosureSource):
+    """
+    Reads rows back from a row cache file (see app.files.row_cache), which has an exact row count and
+    can start from any row without reading the earlier ones.
+    """
+
+    def __init__(self, file: str):
+        self.row_cache = RowCache(file)
+        self.row_count = self.row_cache.row_count
+        super().__init__(file)
+
+    def read_header(self) -> List:
+        return self.row_cache.header
+
+    def iter_rows(self, start_row: int = 0) -> Iterator[Sequence]:
+        return self.row_cache.iter_rows(start_row)
+
+    def close(self) -> None:
+        self.row_cache.close()
+
+
+disclosure_sources: Dict[str, Type[DisclosureSource]] = {
+    ".xlsx": XlsxSource,
+    ".xlsm": XlsxSource,
+    ".csv": CsvSource,
+    ".parquet": ParquetSource,
+    ".pq": ParquetSource,
+}
+
+
+def get_source_class(file_id: str) -> Union[Type[DisclosureSource], None]:
+    """
+    Choose the source adapter for a file based on its extension.
+    :param file_id: filename or S3 object name
+    :return:
+    """
+    return disclosure_sources.get(os.path.splitext(file_id.lower())[1])
+
+
+def open_row_cache(
+    source_class: Type[DisclosureSource],
+    file: Union[str, IO[bytes]],
+    file_id: str,
+    content_hash: str,
+) -> RowCacheSource:
+    """
+    Open the row cache for a file, converting the file first if it hasn't been cached yet.
+    :param source_class:
+    :param file: path or file object of the original file
+    :param file_id:
+    :param content_hash: sha256 of the file, which the cache is stored under
+    :return:
+    """
+    path = fetch_row_cache(s3_client, content_hash)
+    if path is None:
+        print(f"Caching rows of {file_id}")
+        source = source_class(file)
+        path = get_row_cache_path(content_hash)
+        try:
+            row_count = write_row_cache(path, source.header, source.iter_rows())
+        finally:
+            source.close()
+        store_row_cache(s3_client, path)
+        print(f"Cached {row_count} rows of {file_id}")
+    return RowCacheSource(path)
+
+
+def job_order_to_row(job_order: DolDisclosureJobOrder) -> dict:
+    """
+    Convert a cleaned job order into a plain dict of column values for a Core insert.
+    :param job_order:
+    :return:
+    """
+    return {
+        c.name: getattr(job_order, c.name)
+        for c in DolDisclosureJobOrder.__table__.columns  # type: ignore
+        if c.name != "id"
+    }
+
+
+def clean_rows(rows: List[dict]) -> List[dict]:
+    """
+    Clean a batch of row dicts column-by-column, see DolDisclosureJobOrder.clean_columns.
+    :param rows:
+    :return:
+    """
+    if not rows:
+        return rows
+    columns = DolDisclosureJobOrder.clean_columns(
+        {k: [r[k] for r in rows] for k in rows[0].keys()}
+    )
+    return [dict(zip(columns.keys(), values)) for values in zip(*columns.values())]
+
+
+def report_rejects(file_id: str, decoder: RowDecoder) -> None:
+    """
+    Report values which couldn't be coerced to their column's type, and so were imported as null.
+    :param file_id:
+    :param decoder:
+    :return:
+    """
+    if not decoder.reject_count:
+        return
+
+    msg = f"{decoder.reject_count} values in {file_id} failed validation and were imported as null"
+    stderr.write(f"{msg}\n")
+    for reject in decoder.rejects:
+        stderr.write(
+            f"Row {reject.row}, {reject.column}: {reject.value!r} ({reject.error})\n"
+        )
+    rollbar.report_message(
+        msg,
+        "warning",
+        extra_data={
+            "file_id": file_id,
+            "rejects": [reject._asdict() for reject in decoder.rejects[:100]],
+        },
+    )
+
+
+def find_duplicate_import(
+    session: Session, imported_dataset: ImportedDataset
+) -> Union[ImportedDataset, None]:
+    """
+    Find another import of a file with the same contents. An earlier upload takes precedence, unless
+    a later one has already been imported.
+    :param session:
+    :param imported_dataset:
+    :return:
+    """
+    return session.exec(
+        select(ImportedDataset)
+        .where(
+            ImportedDataset.content_hash == imported_dataset.content_hash,
+            ImportedDataset.id != imported_dataset.id,
+            ImportedDataset.import_status != ImportStatus.duplicate,
+            or_(
+                ImportedDataset.id < imported_dataset.id,  # type: ignore
+                ImportedDataset.import_status == ImportStatus.finished,
+            ),
+        )
+        .order_by(ImportedDataset.id)
+    ).first()
+
+
+def record_content_hash(imported_dataset: ImportedDataset, content_hash: str) -> bool:
+    """
+    Store the content hash of an import, and mark it as a duplicate if the same file has already
+    been imported under another name.
+    :param imported_dataset:
+    :param content_hash:
+    :return: True if the import is a duplicate
+    """
+    session = Session(get_engine())
+    imported_dataset.content_hash = content_hash
+    session.add(imported_dataset)
+    # Commit the hash first, so that concurrent imports of the same file can see each other.
+    session.commit()
+
+    duplicate_of = find_duplicate_import(session, imported_dataset)
+    if duplicate_of is not None:
+        print(
+            f"{imported_dataset.object_name} has the same contents as {duplicate_of.object_name}, skipping."
+        )
+        imported_dataset.import_status = ImportStatus.duplicate
+        imported_dataset.duplicate_of_id = duplicate_of.id
+        session.add(imported_dataset)
+        session.commit()
+
+    session.refresh(imported_dataset)
+    session.close()
+    return duplicate_of is not None
+
+
+def record_import_counts(imported_dataset: ImportedDataset, counts: Counter) -> None:
+    """
+    Add the number of rows inserted, updated and skipped by an import to its ImportedDataset. Counts
+    accumulate across resumed imports of the same file.
+    :param imported_dataset:
+    :param counts:
+    :return:
+    """
+    session = Session(get_engine())
+    imported_dataset.rows_inserted = (imported_dataset.rows_inserted or 0) + counts[
+        "inserted"
+    ]
+    imported_dataset.rows_updated = (imported_dataset.rows_updated or 0) + counts[
+        "updated"
+    ]
+    imported_dataset.rows_skipped = (imported_dataset.rows_skipped or 0) + counts[
+        "skipped"
+    ]
+    session.add(imported_dataset)
+    session.commit()
+    session.refresh(imported_dataset)
+    session.close()
+
+
+def get_partitions(row_count: int) -> List[Tuple[int, int]]:
+    """
+    Split a file's data rows into ranges of IMPORT_PARTITION_SIZE rows. The ranges only depend on the
+    row count, so a partially imported file can be resumed with any number of workers.
+    :param row_count:
+    :return: list of (start_row, end_row) ranges, each covering file_rows start_row + 1 to end_row
+    """
+    size = settings.IMPORT_PARTITION_SIZE
+    return [
+        (start_row, min(start_row + size, row_count))
+        for start_row in range(0, row_count, size)
+    ]
+
+
+def get_checkpoint(
+    session: Session, file_id: str, start_row: int, end_row: Union[int, None]
+) -> int:
+    """
+    Rows within a partition are written in order and committed in batches, so the highest file_row
+    already imported within it is the point to resume the partition from. Merged rows which were
+    skipped as unchanged still have their file_name and file_row updated, so they count too.
+    :param session:
+    :param file_id:
+    :param start_row:
+    :param end_row: end of the partition, or None for a partition running to the end of the file
+    :return: number of data rows to skip when resuming
+    """
+    query = select(func.max(DolDisclosureJobOrder.file_row)).where(
+        DolDisclosureJobOrder.file_name == file_id,
+        DolDisclosureJobOrder.file_row > start_row,  # type: ignore
+    )
+    if end_row is not None:
+        query = query.where(DolDisclosureJobOrder.file_row <= end_row)  # type: ignore
+    return session.exec(query).first() or start_row
+
+
+def get_row_hash_value(value):
+    """
+    Put a value in the same form whichever file format (or the DB) it came from, e.g. Decimal("12.50")
+    from a CSV and Decimal("12.5") from an XLSX float both become "12.5".
+    :param value:
+    :return:
+    """
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float, Decimal)):
+        return format(Decimal(str(value)).normalize(), "f")
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, str):
+        # e.g. AnyHttpUrl, whose repr differs from a plain str's.
+        return str(value)
+    return value
+
+
+def get_row_hash(row: Mapping[str, Any]) -> str:
+    """
+    Hash of a job order row's data from the disclosure file, ignoring which file it came from and when.
+    :param row: dict of column values
+    :return:
+    """
+    values = repr(tuple(get_row_hash_value(row[c]) for c in ROW_HASH_COLUMNS))
+    return hashlib.blake2b(values.encode(), digest_size=16).hexdigest()
+
+
+def merge_job_orders(session: Session, rows: List[dict]) -> Counter:
+    """
+    Upsert a batch of cleaned job order rows on (case_number, visa_class), or on case_number alone for
+    rows without a visa class. Rows which haven't changed since they were last imported are skipped,
+    apart from recording the file and row they were last seen in (and their row_hash, if they were
+    imported before it was added). Changed rows are updated in place, and have their employer record
+    and address links reset so that they're matched again downstream.
+    Rows without a case number can't be matched to an existing row, so are inserted as they are.
+    :param session:
+    :param rows:
+    :return: counts of rows inserted, updated and skipped
+    """
+    counts: Counter = Counter()
+    rows_by_key: Dict[Tuple[str, Union[str, None]], dict] = {}
+    unmatched: List[dict] = []
+    for row in rows:
+        row["row_hash"] = get_row_hash(row)
+        if row["case_number"] is None:
+            unmatched.append(row)
+            continue
+        key = (row["case_number"], row["visa_class"])
+        if key in rows_by_key:
+            # Superseded by a later row for the same case in this batch.
+            counts["skipped"] += 1
+        rows_by_key[key] = row
+
+    existing = {}
+    if rows_by_key:
+        existing = {
+            (case_number, visa_class): (id, row_hash)
+            for id, case_number, visa_class, row_hash in session.exec(
+                select(
+                    DolDisclosureJobOrder.id,
+                    DolDisclosureJobOrder.case_number,
+                    DolDisclosureJobOrder.visa_class,
+                    DolDisclosureJobOrder.row_hash,
+                ).where(
+                    DolDisclosureJobOrder.case_number.in_(  # type: ignore
+                        {case_number for case_number, _ in rows_by_key}
+                    )
+                )
+            )
+        }
+
+    table = DolDisclosureJobOrder.__table__  # type: ignore
+    connection = session.connection()
+    # Rows imported before row_hash was added don't have one, so hash their stored columns instead.
+    unhashed = {id: key for key, (id, row_hash) in existing.items() if row_hash is None}
+    if unhashed:
+        for stored in connection.execute(
+            select(table.c.id, *[table.c[c] for c in ROW_HASH_COLUMNS]).where(
+                table.c.id.in_(unhashed)
+            )
+        ):
+            existing[unhashed[stored.id]] = (stored.id, get_row_hash(stored._mapping))
+
+    rows_to_write = []
+    updated_ids = []
+    seen_rows = []
+    for key, row in rows_by_key.items():
+        if key not in existing:
+            counts["inserted"] += 1
+            rows_to_write.append(row)
+        elif existing[key][1] == row["row_hash"]:
+            counts["skipped"] += 1
+            seen_rows.append(
+                {
+                    "job_order_id": existing[key][0],
+                    "seen_file_name": row["file_name"],
+                    "seen_file_row": row["file_row"],
+                    "seen_row_hash": row["row_hash"],
+                }
+            )
+        else:
+            counts["updated"] += 1
+            updated_ids.append(existing[key][0])
+            rows_to_write.append(row)
+
+    if seen_rows:
+        # So that get_checkpoint finds this file's progress even where none of its rows were written.
+        connection.execute(
+            update(table)
+            .where(table.c.id == bindparam("job_order_id"))
+            .values(
+                file_name=bindparam("seen_file_name"),
+                file_row=bindparam("seen_file_row"),
+                row_hash=bindparam("seen_row_hash"),
+                last_seen=table.c.last_seen,
+            ),
+            seen_rows,
+        )
+    if updated_ids:
+        connection.execute(
+            delete(DolDisclosureJobOrderAddressRecordLink).where(
+                DolDisclosureJobOrderAddressRecordLink.dol_disclosure_job_order_id.in_(  # type: ignore
+                    updated_ids
+                )
+            )
+        )
+    if rows_to_write:
+        update_columns = [
+            c
+            for c in rows_to_write[0].keys()
+            if c not in MERGE_KEY and c not in ("id", "first_seen")
+        ]
+        bulk_upsert(
+            connection,
+            table,
+            [row for row in rows_to_write if row["visa_class"] is not None],
+            index_elements=list(MERGE_KEY),
+            update_columns=update_columns,
+        )
+        bulk_upsert(
+            connection,
+            table,
+            [row for row in rows_to_write if row["visa_class"] is None],
+            index_elements=["case_number"],
+            update_columns=update_columns,
+            index_where=table.c.visa_class.is_(None),
+        )
+    if unmatched:
+        counts["inserted"] += len(unmatched)
+        bulk_insert(connection, table, unmatched)
+    return counts
+
+
+def import_ranges(
+    source: DisclosureSource,
+    file_id: str,
+    visa_class: Union[str, None],
+    ranges: List[Tuple[int, Union[int, None]]],
+    bulk: bool = True,
+    merge: bool = True,
+) -> Counter:
+    """
+    Import the data rows in each (start_row, end_row) range of a source, in a single pass through the
+    file. Rows between the ranges are read but skipped.
+    :param source:
+    :param file_id:
+    :param visa_class:
+    :param ranges: sorted, non-overlapping ranges. end_row may be None to import to the end of the file.
+    :param bulk: see import_disclosure
+    :param merge: see import_disclosure
+    :return: counts of rows inserted, updated and skipped
+    """
+    session = Session(get_engine())
+    batch_size = (
+        settings.BULK_IMPORT_BATCH_SIZE if bulk else settings.ROWS_BEFORE_COMMIT
+    )
+    decoder = RowDecoder(
+        DolDisclosureJobOrder,
+        source.col_names,
+        max_rejects=settings.IMPORT_MAX_REJECTS,
+    )
+
+    counts: Counter = Counter()
+    position = ranges[0][0]
+    rows = source.iter_rows(start_row=position)
+    for start_row, end_row in ranges:
+        # Consume the rows between the last range and this one.
+        next(islice(rows, start_row - position, start_row - position), None)
+        range_rows = islice(rows, None if end_row is None else end_row - start_row)
+        file_row = start_row
+
+        for batch in iter_batches(range_rows, batch_size):
+            if bulk:
+                job_orders = []
+                for raw_row in batch:
+                    file_row += 1
+                    job_order = decoder.decode(raw_row, file_row)
+                    job_order.update(
+                        source=DoLDataSource.dol_disclosure,
+                        file_name=file_id,
+                        file_row=file_row,
+                        first_seen=job_order["received_date"],
+                        last_seen=job_order["received_date"],
+                        visa_class=visa_class,
+                    )
+                    job_orders.append(job_order)
+
+                job_orders = clean_rows(job_orders)
+                if merge:
+                    counts.update(merge_job_orders(session, job_orders))
+                else:
+                    for job_order in job_orders:
+                        job_order["row_hash"] = get_row_hash(job_order)
+                    bulk_insert(
+                        session.connection(),
+                        DolDisclosureJobOrder.__table__,  # type: ignore
+                        job_orders,
+                    )
+                    counts["inserted"] += len(job_orders)
+
+            else:
+                validated_job_orders = []
+                for raw_row in batch:
+                    file_row += 1
+                    values = row_to_dict(source.col_names, raw_row)
+                    validated_job_orders.append(
+                        DolDisclosureJobOrder(
+                            source=DoLDataSource.dol_disclosure,
+                            file_name=file_id,
+                            file_row=file_row,
+                            first_seen=values.get("received_date"),
+                            last_seen=values.get("received_date"),
+                            visa_class=visa_class,
+                            **values,
+                        ).clean()
+                    )
+
+                if merge:
+                    counts.update(
+                        merge_job_orders(
+                            session,
+                            [job_order_to_row(j) for j in validated_job_orders],
+                        )
+                    )
+                else:
+                    for validated_job_order in validated_job_orders:
+                        validated_job_order.row_hash = get_row_hash(
+                            job_order_to_row(validated_job_order)
+                        )
+                        session.add(validated_job_order)
+                    counts["inserted"] += len(batch)
+
+            session.commit()
+            print(f"{file_row} listings imported from file {file_id}")
+
+        if end_row is None:
+            break
+        position = end_row
+
+    session.close()
+    if bulk:
+        report_rejects(file_id, decoder)
+    return counts
+
+
+def import_partitions(
+    source_class: Type[DisclosureSource],
+    path: str,
+    file_id: str,
+    visa_class: Union[str, None],
+    ranges: List[Tuple[int, Union[int, None]]],
+    bulk: bool = True,
+    merge: bool = True,
+) -> Counter:
+    """
+    Import worker process entry point: opens its own source and engine, then imports its ranges.
+    :param source_class:
+    :param path: local path of the file
+    :param file_id:
+    :param visa_class:
+    :param ranges:
+    :param bulk:
+    :param merge:
+    :return: counts of rows inserted, updated and skipped
+    """
+    # Drop the connections inherited from the parent process without closing them, as its other
+    # threads (e.g. the lease heartbeat) may still be using them.
+    get_engine().dispose(close=False)  # type: ignore
+    get_engine(refresh=True)
+    source = source_class(path)
+    counts = import_ranges(source, file_id, visa_class, ranges, bulk, merge)
+    source.close()
+    return counts
+
+
+def split_ranges(
+    ranges: List[Tuple[int, Union[int, None]]], num_groups: int
+) -> List[List[Tuple[int, Union[int, None]]]]:
+    """
+    Split ranges into num_groups groups of adjacent ranges, as evenly as possible. Each worker then
+    reads one stretch of the file, rather than re-reading from the start for every range.
+    :param ranges:
+    :param num_groups:
+    :return:
+    """
+    size, remainder = divmod(len(ranges), num_groups)
+    groups = []
+    start = 0
+    for i in range(num_groups):
+        end = start + size + (1 if i < remainder else 0)
+        groups.append(ranges[start:end])
+        start = end
+    return groups
+
+
 def import_disclosure(
     filename: Union[str, None] = None,
     bucket_name: Union[str, None] = None,
     object_name: Union[str, None] = None,
+    bulk: bool = True,
+    workers: Union[int, None] = None,
+    use_row_cache: bool = True,
+    imported_dataset: Union[ImportedDataset, None] = None,
+    merge: bool = True,
 ) -> bool:
     """
-    Import a DoL disclosure file spreadsheet
+    Import a DoL disclosure file (xlsx, csv or parquet)
+
+    When the row count is known up front, the file is split into partitions of IMPORT_PARTITION_SIZE
+    rows, each of which is resumed from its own checkpoint, and with more than one worker the partitions
+    are imported by a pool of processes.
     :param filename: Filename to import
+    :param bulk: Decode rows with RowDecoder and write them in batches of BULK_IMPORT_BATCH_SIZE using
+        COPY (Postgres) or executemany, rather than validating each row as an ORM object.
+    :param workers: Number of worker processes, defaults to IMPORT_WORKERS
+    :param use_row_cache: Import xlsx and csv files via a row cache, which is built on the first import
+        of a file and lets later resumes and re-imports start at any row.
+    :param imported_dataset: Queued import this file is for. Its content hash is recorded, and if the
+        same file has already been imported it's marked as a duplicate and skipped without being parsed.
+        The number of rows inserted, updated and skipped are recorded against it.
+    :param merge: Merge rows into existing job orders with the same case number and visa class, as
+        quarterly and annual disclosure files overlap. Unchanged rows are skipped. Only set this to
+        False for a load which can't overlap existing data, e.g. into an empty table.
     :return:
     """
     if not filename and (not bucket_name or not object_name):
@@ -203,8 +981,12 @@ def import_disclosure(
         stderr.write("No valid parameters specified.")
         return False
 
-    # Check if this has already been imported and exit if it has been.
-    session = Session(get_engine())
+    source_class = get_source_class(file_id)
+    if source_class is None:
+        stderr.write(f"Unsupported file format for {file_id}.")
+        return False
+
+    workers = workers or settings.IMPORT_WORKERS
 
     visa_class = None
     if "h-2a" in file_id.lower() and "h-2b" not in file_id.lower():
@@ -213,110 +995,334 @@ def import_disclosure(
         visa_class = "H-2B"
     # TODO: other visa types.
 
-    if not filename:
-        f = io.BytesIO()
-        s3_client.download_fileobj(Bucket=bucket_name, Key=object_name, Fileobj=f)
-        wb = load_workbook(filename=f, read_only=True, keep_links=False, data_only=True)
-
-    else:
-        wb = load_workbook(
-            filename=filename, read_only=True, keep_links=False, data_only=True
+    use_row_cache = use_row_cache and source_class.use_row_cache
+    downloaded_path = None
+    spooled_file = None
+    # S3 objects are hashed as they're downloaded.
+    digest = hashlib.sha256()
+    if not filename and workers > 1 and not use_row_cache:
+        # Worker processes each open the file themselves, so it needs to be on disk.
+        downloaded_path = download_s3_object(
+            s3_client, bucket_name, object_name, digest=digest  # type: ignore
         )
-
-    worksheet = wb.active
-
-    import_count = session.exec(
-        select(func.max(DolDisclosureJobOrder.file_row)).where(
-            DolDisclosureJobOrder.file_name == file_id
+    elif not filename:
+        spooled_file = spool_s3_object(
+            s3_client, bucket_name, object_name, digest=digest  # type: ignore
         )
-    ).first()
+    file = filename or downloaded_path or spooled_file
 
-    if import_count and import_count + 1 >= worksheet.max_row:
-        print(f"File {file_id} has already been imported! Quitting.")
+    content_hash = None
+    if imported_dataset is not None or use_row_cache:
+        content_hash = hash_file(filename) if filename else digest.hexdigest()
+
+    if imported_dataset is not None and record_content_hash(
+        imported_dataset, content_hash  # type: ignore
+    ):
+        if spooled_file:
+            spooled_file.close()
+        if downloaded_path:
+            os.remove(downloaded_path)
         return True
 
-    if import_count:
-        print(
-            f"File {file_id} has already been started, continuing partial import with row {import_count + 1}"
+    source: Union[DisclosureSource, None] = None
+    if use_row_cache:
+        try:
+            source = open_row_cache(source_class, file, file_id, content_hash)  # type: ignore
+        except (KeyError, OverflowError, pa.ArrowException) as e:
+            stderr.write(
+                f"Couldn't cache rows of {file_id}, importing directly: {e!r}\n"
+            )
+            if spooled_file:
+                spooled_file.seek(0)
+    if source is None:
+        source = source_class(file)  # type: ignore
+    # Path for worker processes to open, if the source is on disk.
+    path = source.file if isinstance(source.file, str) else None
+
+    # Check if this has already been imported and exit if it has been.
+    session = Session(get_engine())
+    if source.row_count is None:
+        ranges: List[Tuple[int, Union[int, None]]] = [
+            (get_checkpoint(session, file_id, 0, None), None)
+        ]
+    else:
+        partitions: List[Tuple[int, Union[int, None]]] = list(
+            get_partitions(source.row_count)
         )
+        if not source.row_count_exact:
+            # Run the last partition to the end of the file, in case the row count is short.
+            partitions[-1:] = [(partitions[-1][0] if partitions else 0, None)]
+        ranges = []
+        for start_row, end_row in partitions:
+            checkpoint = get_checkpoint(session, file_id, start_row, end_row)
+            if end_row is None or checkpoint < end_row:
+                ranges.append((checkpoint, end_row))
+    session.close()
+
+    if not ranges:
+        print(f"File {file_id} has already been imported! Quitting.")
+        counts: Counter = Counter()
 
     else:
-        import_count = 0
+        if ranges[0][0]:
+            print(
+                f"File {file_id} has already been started, continuing partial import with row {ranges[0][0] + 1}"
+            )
+        print(f"Importing {file_id}")
 
-    print(f"Importing {file_id}")
+        if workers > 1 and len(ranges) > 1 and path:
+            source.close()
+            groups = split_ranges(ranges, min(workers, len(ranges)))
+            with multiprocessing.Pool(len(groups)) as pool:
+                counts = sum(
+                    pool.starmap(
+                        import_partitions,
+                        [
+                            (
+                                type(source),
+                                path,
+                                file_id,
+                                visa_class,
+                                group,
+                                bulk,
+                                merge,
+                            )
+                            for group in groups
+                        ],
+                    ),
+                    Counter(),
+                )
+        else:
+            counts = import_ranges(source, file_id, visa_class, ranges, bulk, merge)
 
-    # Process header row and filter out for only valid column names.
-    header_row = worksheet[1]
-    col_names = [str(c.value).lower() for c in header_row]
-    for i, name in enumerate(col_names):
-        if name not in valid_col_names:
-            if name not in alternate_col_names:
-                print("Missing column names:")
-                print(f"'{name}': '',")
-            col_names[i] = alternate_col_names.get(name)
+    source.close()
+    if spooled_file:
+        spooled_file.close()
+    if downloaded_path:
+        os.remove(downloaded_path)
+    if isinstance(source, RowCacheSource):
+        # Only needed to resume this import, and stored in S3 for re-imports if a bucket is set.
+        os.remove(source.file)  # type: ignore
+    if imported_dataset is not None:
+        record_import_counts(imported_dataset, counts)
+    print(
+        f"{sum(counts.values())} listings imported from file {file_id}: "
+        f"{counts['inserted']} inserted, {counts['updated']} updated, {counts['skipped']} skipped"
+    )
+    log_peak_rss(f"after importing {file_id}")
+    return True
 
-    count = import_count
 
-    for row in worksheet.iter_rows(
-        min_row=(import_count + 2 if import_count else 2), values_only=True
-    ):
-        values = row_to_dict(col_names, row)
-
-        session.add(
-            DolDisclosureJobOrder(
-                source=DoLDataSource.dol_disclosure,
-                file_name=file_id,
-                file_row=count + 1,
-                first_seen=values["received_date"],
-                last_seen=values["received_date"],
-                visa_class=visa_class,
-                **values,
-            ).clean()
+def claim_import(worker_id: str) -> Union[ImportedDataset, None]:
+    """
+    Claim the next queued import, or a running import whose lease has expired (i.e. whose worker
+    crashed), and lease it to worker_id for IMPORT_LEASE_SECONDS. Imports which another worker is in
+    the middle of claiming are skipped rather than waited for.
+    :param worker_id:
+    :return: the claimed import, or None if there's nothing to import
+    """
+    session = Session(get_engine())
+    now = datetime.utcnow()
+    imported_dataset = session.exec(
+        select(ImportedDataset)
+        .where(
+            or_(
+                ImportedDataset.import_status == ImportStatus.needs_importing,
+                and_(
+                    ImportedDataset.import_status == ImportStatus.import_running,
+                    or_(
+                        ImportedDataset.lease_expires_at == None,  # noqa: E711
+                        ImportedDataset.lease_expires_at < now,  # type: ignore
+                    ),
+                ),
+            )
         )
-        count += 1
+        .order_by(ImportedDataset.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    ).first()
 
-        if count % settings.ROWS_BEFORE_COMMIT == 0:
-            print(f"{count} listings imported from file {file_id}")
-            session.commit()
+    if imported_dataset is not None:
+        if imported_dataset.import_status == ImportStatus.import_running:
+            print(
+                f"Reclaiming import of {imported_dataset.object_name} from {imported_dataset.lease_owner}, "
+                f"whose lease expired at {imported_dataset.lease_expires_at}"
+            )
+        imported_dataset.import_status = ImportStatus.import_running
+        imported_dataset.lease_owner = worker_id
+        imported_dataset.lease_expires_at = now + timedelta(
+            seconds=settings.IMPORT_LEASE_SECONDS
+        )
+        imported_dataset.heartbeat_at = now
+        session.add(imported_dataset)
+        session.commit()
+        session.refresh(imported_dataset)
+
+    session.close()
+    return imported_dataset
 
+
+def renew_lease(imported_dataset_id: int, worker_id: str) -> bool:
+    """
+    :param imported_dataset_id:
+    :param worker_id:
+    :return: False if worker_id no longer holds the lease, because it expired and was reclaimed
+    """
+    now = datetime.utcnow()
+    session = Session(get_engine())
+    result = session.execute(
+        update(ImportedDataset)
+        .where(
+            ImportedDataset.id == imported_dataset_id,
+            ImportedDataset.lease_owner == worker_id,
+        )
+        .values(
+            lease_expires_at=now + timedelta(seconds=settings.IMPORT_LEASE_SECONDS),
+            heartbeat_at=now,
+        )
+    )
     session.commit()
     session.close()
-    print(f"{count} listings imported from file {file_id}")
-    return True
+    return result.rowcount > 0  # type: ignore
 
 
-def process_imports() -> bool:
+def release_import(
+    imported_dataset: ImportedDataset, worker_id: str, finished: bool
+) -> None:
     """
-    Query the DB to see if there are any imports which need to be processed; and call import_disclosure if so.
+    Release a claimed import, marking it finished (unless it was skipped as a duplicate) or, if it
+    didn't finish, queueing it again. Does nothing if the lease has been lost to another worker.
+    :param imported_dataset:
+    :param worker_id:
+    :param finished:
     :return:
     """
+    if not finished:
+        imported_dataset.import_status = ImportStatus.needs_importing
+    elif imported_dataset.import_status != ImportStatus.duplicate:
+        imported_dataset.import_status = ImportStatus.finished
+    imported_dataset.lease_owner = None
+    imported_dataset.lease_expires_at = None
+
     session = Session(get_engine())
-    import_to_do = session.exec(
-        select(ImportedDataset).where(
-            ImportedDataset.import_status == ImportStatus.needs_importing
+    session.execute(
+        update(ImportedDataset)
+        .where(
+            ImportedDataset.id == imported_dataset.id,
+            ImportedDataset.lease_owner == worker_id,
         )
-    ).first()
+        .values(
+            import_status=imported_dataset.import_status,
+            lease_owner=None,
+            lease_expires_at=None,
+        )
+    )
+    session.commit()
     session.close()
 
-    finished = False
 
-    if import_to_do is None:
+class LeaseHeartbeat(threading.Thread):
+    """
+    Renews the lease on a claimed import every IMPORT_HEARTBEAT_SECONDS until stopped.
+    """
+
+    def __init__(self, imported_dataset: ImportedDataset, worker_id: str):
+        super().__init__(daemon=True)
+        self.imported_dataset = imported_dataset
+        self.worker_id = worker_id
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self.stopped.wait(settings.IMPORT_HEARTBEAT_SECONDS):
+            if not renew_lease(self.imported_dataset.id, self.worker_id):  # type: ignore
+                # The rows merge idempotently, so the import is left to finish rather than aborted.
+                msg = f"Lost the lease on import of {self.imported_dataset.object_name} to another worker"
+                stderr.write(f"{msg}\n")
+                rollbar.report_message(
+                    msg, "warning", extra_data={"worker_id": self.worker_id}
+                )
+                return
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.join()
+
+
+def run_import(
+    imported_dataset: ImportedDataset, worker_id: str, workers: Union[int, None] = None
+) -> bool:
+    """
+    Import a claimed file, renewing its lease until the import returns.
+    :param imported_dataset:
+    :param worker_id:
+    :param workers: see import_disclosure
+    :return: True if the import finished
+    """
+    heartbeat = LeaseHeartbeat(imported_dataset, worker_id)
+    heartbeat.start()
+    try:
+        if imported_dataset.bucket_name:
+            return import_disclosure(
+                bucket_name=imported_dataset.bucket_name,
+                object_name=imported_dataset.object_name,
+                imported_dataset=imported_dataset,
+                workers=workers,
+            )
+        return import_disclosure(
+            filename=imported_dataset.object_name,
+            imported_dataset=imported_dataset,
+            workers=workers,
+        )
+    finally:
+        heartbeat.stop()
+
+
+def process_imports(max_concurrent: Union[int, None] = None) -> bool:
+    """
+    Claim up to max_concurrent queued imports and import them concurrently. Each claim is a lease,
+    kept alive by a heartbeat while the import runs, so that overlapping invocations never import
+    the same file and an import whose worker crashed is picked up again once its lease runs out.
+    :param max_concurrent: defaults to IMPORT_MAX_CONCURRENT
+    :return: False if there was nothing to import
+    """
+    max_concurrent = max_concurrent or settings.IMPORT_MAX_CONCURRENT
+    worker_id = uuid.uuid4().hex
+
+    claimed: List[ImportedDataset] = []
+    while len(claimed) < max_concurrent:
+        imported_dataset = claim_import(worker_id)
+        if imported_dataset is None:
+            break
+        claimed.append(imported_dataset)
+
+    if not claimed:
         return False
 
-    if import_to_do.bucket_name:
-        finished = import_disclosure(
-            bucket_name=import_to_do.bucket_name, object_name=import_to_do.object_name
+    # Don't fork worker processes from one import thread while the others are using the engine.
+    workers = 1 if len(claimed) > 1 else None
+    if len(claimed) > 1 and settings.IMPORT_WORKERS > 1:
+        print(
+            f"Importing {len(claimed)} files concurrently, with one worker process each"
         )
-    else:
-        finished = import_disclosure(filename=import_to_do.object_name)
 
-    if finished:
-        session = Session(get_engine())
-        import_to_do.import_status = ImportStatus.finished
-        session.add(import_to_do)
-        session.commit()
-        session.close()
+    errors = []
+    with ThreadPoolExecutor(len(claimed)) as executor:
+        futures = {
+            executor.submit(
+                run_import, imported_dataset, worker_id, workers
+            ): imported_dataset
+            for imported_dataset in claimed
+        }
+        for future in as_completed(futures):
+            try:
+                finished = future.result()
+            except Exception as e:  # pylint: disable=broad-except
+                finished = False
+                errors.append(e)
+            release_import(futures[future], worker_id, finished)
 
+    if errors:
+        raise errors[0]
     return True
 
 
@@ -3,6 +3,7 @@ from sqlalchemy.future import Engine
 from sqlmodel import Session, SQLModel
 
 from app.db import get_engine
+from app.models.address_normalization_cache import AddressNormalizationCache  # noqa
 from app.models.address_record import AddressRecord  # noqa
 from app.models.dedupe_blocking_map import DedupeBlockingMap  # noqa
 from app.models.dedupe_entity_map import DedupeEntityMap  # noqa
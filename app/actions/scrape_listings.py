@@ -1,181 +1,655 @@
-import io
+import asyncio
+import hashlib
+import json
+import os
 import random
 import sys
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+from tempfile import mkstemp
+from typing import Any, Callable, Dict, List, Sequence, Set, Tuple, Union
+from urllib.parse import urlparse
 
 import boto3
 import requests
 import rollbar
-from sqlalchemy import false
-from sqlalchemy.exc import MultipleResultsFound, NoResultFound
+from sqlalchemy import false, or_, true, update
 from sqlmodel import Session, select
 
 from app import settings
-from app.constants import USER_AGENT_STRING
 from app.db import get_engine
+from app.files import HashingWriter, SpooledFile, get_transfer_config, s3_object_exists
+from app.http_client import get_http_session, log_request_metrics
 from app.models.dol_disclosure_job_order import DolDisclosureJobOrder  # noqa
 from app.models.seasonal_jobs_job_order import SeasonalJobsJobOrder
 
 s3_client = boto3.client("s3")
 
 
-def scrape_listings(max_records: int = 1) -> bool:
+class RateLimiter:
+    """
+    Spaces out the start of requests so that no more than `rate` start per second.
     """
-    Scrape a detailed listing from SeasonalJobs azure server.
 
-    :param max_records: Number of records to scrape, defaults to 1
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate else 0
+        self.next_start = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        async with self.lock:
+            now = asyncio.get_running_loop().time()
+            delay = self.next_start - now
+            self.next_start = max(now, self.next_start) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class AsyncScraper:
+    """
+    Runs blocking HTTP requests from coroutines, on a thread pool using the shared HTTP session.
+    At most `concurrency` requests are in flight at once, and requests to each host are rate limited
+    to `rate_limit` per second.
+
+    Must be created inside the running event loop.
+    """
+
+    def __init__(self, concurrency: int, rate_limit: float):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.executor = ThreadPoolExecutor(concurrency)
+        self.rate_limiters: Dict[str, RateLimiter] = defaultdict(
+            lambda: RateLimiter(rate_limit)
+        )
+        self.http = get_http_session()
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Run a blocking function on the thread pool.
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, partial(func, *args, **kwargs)
+        )
+
+    async def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        async with self.semaphore:
+            await self.rate_limiters[urlparse(url).netloc].wait()
+            return await self.run(getattr(self.http, method), url, **kwargs)
+
+    async def stream(
+        self, url: str, consume: Callable[[requests.Response], Any], **kwargs
+    ) -> Any:
+        """
+        GET url with a streamed body, which is read by consume on the thread pool. The request counts
+        towards the concurrency limit until consume returns.
+        :param url:
+        :param consume: function of the response
+        :return: consume's return value
+        """
+        async with self.semaphore:
+            await self.rate_limiters[urlparse(url).netloc].wait()
+            return await self.run(self._stream, url, consume, **kwargs)
+
+    def _stream(
+        self, url: str, consume: Callable[[requests.Response], Any], **kwargs
+    ) -> Any:
+        response = self.http.get(url, stream=True, **kwargs)
+        try:
+            return consume(response)
+        finally:
+            response.close()
+
+    def close(self) -> None:
+        self.executor.shutdown()
+
+
+class ListingWriter:
+    """
+    Collects scraped listings and commits them to the DB in batches of SCRAPE_COMMIT_BATCH_SIZE.
+    """
+
+    def __init__(self, session: Session):
+        self.session = session
+        self.pending = 0
+        self.scraped_count = 0
+
+    def add(self, listing: SeasonalJobsJobOrder) -> None:
+        keep_last_seen(listing)
+        self.session.add(listing)
+        self.pending += 1
+        if self.pending >= settings.SCRAPE_COMMIT_BATCH_SIZE:
+            self.commit()
+
+    def add_unchanged(self, listings: List[SeasonalJobsJobOrder]) -> None:
+        """
+        Record that listings were re-scraped and their data hasn't changed, with one UPDATE rather
+        than writing each listing.
+        :param listings:
+        :return:
+        """
+        self.session.execute(
+            update(SeasonalJobsJobOrder)
+            .where(SeasonalJobsJobOrder.id.in_([listing.id for listing in listings]))  # type: ignore
+            .values(
+                last_scraped_at=datetime.utcnow(),
+                scrape_attempts=0,
+                scrape_error=None,
+                scrape_next_attempt_at=None,
+                last_seen=SeasonalJobsJobOrder.last_seen,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        self.pending += len(listings)
+        if self.pending >= settings.SCRAPE_COMMIT_BATCH_SIZE:
+            self.commit()
+
+    def commit(self) -> None:
+        self.session.commit()
+        self.pending = 0
+
+    def defer(self, listings: List[SeasonalJobsJobOrder], error: str) -> None:
+        """
+        Put off the next attempt to scrape listings by SCRAPE_BACKOFF_SECONDS, after a failure which
+        wasn't down to the listings themselves (e.g. the search API being down), so it doesn't count
+        towards their failed attempts.
+        :param listings:
+        :param error:
+        :return:
+        """
+        self.session.execute(
+            update(SeasonalJobsJobOrder)
+            .where(SeasonalJobsJobOrder.id.in_([listing.id for listing in listings]))  # type: ignore
+            .values(
+                scrape_error=error,
+                scrape_next_attempt_at=datetime.utcnow()
+                + timedelta(seconds=settings.SCRAPE_BACKOFF_SECONDS),
+                last_seen=SeasonalJobsJobOrder.last_seen,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        self.pending += len(listings)
+        if self.pending >= settings.SCRAPE_COMMIT_BATCH_SIZE:
+            self.commit()
+
+    def record_failure(self, listing: SeasonalJobsJobOrder, error: str) -> None:
+        """
+        Record a failed scrape of a listing, and put off its next attempt with exponential backoff,
+        or dead letter it after SCRAPE_MAX_ATTEMPTS failures. Only for failures specific to the
+        listing, see defer for others.
+        :param listing:
+        :param error:
+        :return:
+        """
+        listing.scrape_attempts = (listing.scrape_attempts or 0) + 1
+        listing.scrape_error = error
+        if listing.scrape_attempts >= settings.SCRAPE_MAX_ATTEMPTS:
+            listing.scrape_dead_letter = True
+            listing.scrape_next_attempt_at = None
+            print(
+                f"Dead lettered listing ID {listing.dol_id} after {listing.scrape_attempts} failed scrapes"
+            )
+        else:
+            backoff = min(
+                settings.SCRAPE_BACKOFF_SECONDS * 2 ** (listing.scrape_attempts - 1),
+                settings.SCRAPE_MAX_BACKOFF_SECONDS,
+            )
+            listing.scrape_next_attempt_at = datetime.utcnow() + timedelta(
+                seconds=backoff
+            )
+        self.add(listing)
+
+
+def keep_last_seen(listing: SeasonalJobsJobOrder) -> None:
+    """
+    last_seen is when the listing was last in the RSS feed, so scraping mustn't bump it (as updating
+    the row otherwise would), or write back the value loaded when the listing was claimed, which the
+    RSS feed may have updated since.
+    :param listing:
     :return:
     """
+    listing.last_seen = SeasonalJobsJobOrder.last_seen  # type: ignore
 
-    if not (settings.JOBS_API_URL and settings.JOB_ORDER_BASE_URL):
-        raise Exception("JOBS_API_URL and JOB_ORDER_BASE_URL must be set")
-    if not settings.JOBS_API_KEY:
-        raise Exception("Jobs API Key must be set")
 
-    session = Session(get_engine())
+# Content hashes of PDFs known to be in JOB_ORDER_PDF_DESTINATION, which don't need uploading again.
+stored_pdf_hashes: Set[str] = set()
 
-    unscraped_listings = session.exec(
-        select(SeasonalJobsJobOrder)
-        .where(SeasonalJobsJobOrder.scraped == false())
-        .order_by(SeasonalJobsJobOrder.first_seen.desc())
-        .limit(max_records)
-    ).all()
 
-    if len(unscraped_listings) == 0:
-        print("No listings left to scrape!")
-        return False
+def save_pdf(job_order_pdf: requests.Response) -> str:
+    """
+    Stream a job order PDF to local storage or the JOB_ORDER_PDF_DESTINATION bucket, hashing it as
+    it's downloaded. PDFs are stored under the sha256 of their contents, so identical PDFs are only
+    stored once.
+    :param job_order_pdf: response, requested with stream=True
+    :return: location of the saved PDF
+    """
+    digest = hashlib.sha256()
+    chunks = job_order_pdf.iter_content(chunk_size=settings.JOB_ORDER_PDF_CHUNK_SIZE)
 
-    scraped_count = 0
-    for listing in unscraped_listings:
-        if scraped_count >= max_records:
-            break
-
-        payload = {
-            "searchFields": "case_number",
-            "orderby": "search.score() desc",
-            "search": f'"{listing.dol_id}"',
-            "top": 1,
-        }
-        api_response = requests.post(
+    if settings.JOB_ORDER_PDF_DESTINATION == "local":
+        pdf_dir = f"{settings.BASE_DIR}/job-order-pdfs"
+        os.makedirs(pdf_dir, exist_ok=True)
+        fd, tmp_path = mkstemp(dir=pdf_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                writer = HashingWriter(f, digest)
+                for chunk in chunks:
+                    writer.write(chunk)
+        except:  # noqa
+            os.remove(tmp_path)
+            raise
+        saved_pdf = f"{pdf_dir}/{digest.hexdigest()}.pdf"
+        # An existing file with this name has the same contents, so it's fine to replace it.
+        os.replace(tmp_path, saved_pdf)
+        return saved_pdf
+
+    bucket_name = settings.JOB_ORDER_PDF_DESTINATION
+    with SpooledFile(max_size=settings.S3_SPOOL_MAX_SIZE, dir=settings.TMP_DIR) as f:
+        writer = HashingWriter(f, digest)
+        for chunk in chunks:
+            writer.write(chunk)
+        content_hash = digest.hexdigest()
+        object_name = f"{content_hash}.pdf"
+
+        if content_hash not in stored_pdf_hashes:
+            if not s3_object_exists(s3_client, bucket_name, object_name):
+                f.seek(0)
+                s3_client.upload_fileobj(
+                    f, bucket_name, object_name, Config=get_transfer_config()
+                )
+            stored_pdf_hashes.add(content_hash)
+
+    return f"https://{bucket_name}.s3.us-east-2.amazonaws.com/{object_name}"
+
+
+def get_search_payload(dol_ids: Sequence[str]) -> dict:
+    """
+    Search API request body which looks up the listings for several case numbers at once.
+    :param dol_ids:
+    :return:
+    """
+    # search.in takes a delimited list of values, quoted as an OData string literal.
+    values = ",".join(dol_ids).replace("'", "''")
+    return {
+        "search": "*",
+        "filter": f"search.in(case_number, '{values}', ',')",
+        "top": len(dol_ids),
+    }
+
+
+def get_scraped_data_hash(scraped_data: dict) -> str:
+    """
+    Hash of a listing's search result, ignoring the search service's own fields (e.g. @search.score),
+    which can change without the listing changing.
+    :param scraped_data:
+    :return:
+    """
+    normalized = {k: v for k, v in scraped_data.items() if not k.startswith("@")}
+    return hashlib.blake2b(
+        json.dumps(normalized, sort_keys=True, default=str).encode(), digest_size=16
+    ).hexdigest()
+
+
+async def scrape_batch(
+    scraper: AsyncScraper, writer: ListingWriter, listings: List[SeasonalJobsJobOrder]
+) -> None:
+    """
+    Scrape a batch of listings' data with a single search API request, matching the results back to
+    the listings by case number, then fetch each listing's job order PDF.
+    :param scraper:
+    :param writer:
+    :param listings:
+    :return:
+    """
+    listings_by_dol_id: Dict[str, List[SeasonalJobsJobOrder]] = defaultdict(list)
+    for listing in listings:
+        listings_by_dol_id[listing.dol_id].append(listing)  # type: ignore
+    dol_ids = list(listings_by_dol_id.keys())
+
+    try:
+        api_response = await scraper.request(
+            "post",
             settings.JOBS_API_URL,
-            json=payload,
-            headers={
-                "User-Agent": USER_AGENT_STRING,
-                "Content-Type": "application/json",
-            },
+            json=get_search_payload(dol_ids),
+            headers={"Content-Type": "application/json"},
             timeout=30,
         )
-        if api_response.status_code != 200:
-            msg = f"API call failed for listing, status code {api_response.status_code}"
-            rollbar.report_message(
-                msg,
-                "error",
-                extra_data={
-                    "dol_id": listing.dol_id,
-                },
-            )
-            sys.stderr.write(msg)
-            continue
+    except requests.RequestException as e:
+        msg = f"API call failed for listings, {e!r}"
+        rollbar.report_message(msg, "error", extra_data={"dol_ids": dol_ids})
+        sys.stderr.write(msg)
+        writer.defer(listings, msg)
+        return
 
-        try:
-            scraped_data = api_response.json()["value"][0]
-        except ValueError:
-            msg = "Invalid JSON"
-            sys.stderr.write(msg)
-            rollbar.report_message(
-                msg,
-                "error",
-                extra_data={"dol_id": listing.dol_id, "response": api_response},
-            )
-            continue
+    if api_response.status_code != 200:
+        msg = f"API call failed for listings, status code {api_response.status_code}"
+        rollbar.report_message(
+            msg,
+            "error",
+            extra_data={
+                "dol_ids": dol_ids,
+            },
+        )
+        sys.stderr.write(msg)
+        writer.defer(listings, msg)
+        return
+
+    try:
+        results = api_response.json()["value"]
+    except ValueError:
+        msg = "Invalid JSON"
+        sys.stderr.write(msg)
+        rollbar.report_message(
+            msg,
+            "error",
+            extra_data={"dol_ids": dol_ids, "response": api_response},
+        )
+        writer.defer(listings, msg)
+        return
+
+    found: Set[str] = set()
+    unchanged: List[SeasonalJobsJobOrder] = []
+    changed_ids: Set[int] = set()
+    for scraped_data in results:
+        data_hash = get_scraped_data_hash(scraped_data)
+        for listing in listings_by_dol_id.get(scraped_data.get("case_number"), []):
+            found.add(listing.dol_id)  # type: ignore
+            if listing.scraped:
+                previous_hash = listing.scraped_data_hash or (
+                    get_scraped_data_hash(listing.scraped_data)
+                    if listing.scraped_data
+                    else None
+                )
+                if data_hash == previous_hash:
+                    unchanged.append(listing)
+                    continue
+                changed_ids.add(listing.id)  # type: ignore
 
-        scrape_successful = True
-        if scraped_data["case_number"] != listing.dol_id:
-            msg = (
-                f"Case number mismatch between scraped data for DOL ID {listing.dol_id}. "
-                f"Scraped URL {settings.JOBS_API_URL}"
-            )
-            print(msg)
-
-            # Try to parse the data anyway.
-            original_listing = listing
-            try:
-                listing = session.exec(
-                    select(SeasonalJobsJobOrder).where(
-                        SeasonalJobsJobOrder.dol_id == scraped_data["case_number"],
-                        SeasonalJobsJobOrder.scraped == false(),
-                    )
-                ).one()
-
-            except (NoResultFound, MultipleResultsFound):
-                listing = original_listing  # Save this value so we can check for a PDF
-                scrape_successful = False
-
-        if scrape_successful:
             listing.scraped = True
             listing.scraped_data = scraped_data
+            listing.scraped_data_hash = data_hash
+            listing.last_scraped_at = datetime.utcnow()
+            listing.scrape_attempts = 0
+            listing.scrape_error = None
+            listing.scrape_next_attempt_at = None
             listing.clean()
 
-            session.add(listing)
-            scraped_count += 1
-            print(f"{scraped_count} - Saved data for listing ID {listing.dol_id}")
-            session.commit()
-
-        if listing.pdf:
-            continue
-
-        headers = {
-            "User-Agent": USER_AGENT_STRING,
-        }
-        pdf_url = f"{settings.JOB_ORDER_BASE_URL}{listing.dol_id}"
-        job_order_pdf = requests.get(
-            pdf_url,
-            headers=headers,
-            timeout=30,
+            writer.scraped_count += 1
+            writer.add(listing)
+            print(
+                f"{writer.scraped_count} - Saved data for listing ID {listing.dol_id}"
+            )
+
+    if unchanged:
+        writer.add_unchanged(unchanged)
+        print(
+            f"Data unchanged for listing IDs {', '.join(listing.dol_id for listing in unchanged)}"  # type: ignore
         )
 
+    not_found = [dol_id for dol_id in listings_by_dol_id if dol_id not in found]
+    if not_found:
+        sys.stderr.write(
+            f"No search results for listing IDs {', '.join(not_found)}, url {settings.JOBS_API_URL}"
+        )
+        for dol_id in not_found:
+            for listing in listings_by_dol_id[dol_id]:
+                writer.record_failure(listing, "No search result")
+
+    # A re-scraped listing whose data has changed has probably been amended, so fetch its PDF again.
+    await asyncio.gather(
+        *(
+            scrape_pdf(scraper, writer, listing)
+            for listing in listings
+            if not listing.pdf or listing.id in changed_ids
+        )
+    )
+
+
+async def scrape_pdf(
+    scraper: AsyncScraper, writer: ListingWriter, listing: SeasonalJobsJobOrder
+) -> None:
+    """
+    Fetch and save a listing's job order PDF.
+    :param scraper:
+    :param writer:
+    :param listing:
+    :return:
+    """
+    pdf_url = f"{settings.JOB_ORDER_BASE_URL}{listing.dol_id}"
+
+    def consume(
+        job_order_pdf: requests.Response,
+    ) -> Tuple[requests.Response, Union[str, None]]:
         if (
             job_order_pdf.status_code in (200, 301)
             and job_order_pdf.url != "https://seasonaljobs.dol.gov/system/404"
             and settings.JOB_ORDER_PDF_DESTINATION
         ):
-            saved_pdf = None
-            if settings.JOB_ORDER_PDF_DESTINATION == "local":
-                saved_pdf = f"{settings.BASE_DIR}/job-order-pdfs/{listing.dol_id}.pdf"
-                with open(saved_pdf, "wb") as outfile:
-                    outfile.write(job_order_pdf.content)
-            else:
-                saved_pdf = f"https://{settings.JOB_ORDER_PDF_DESTINATION}.s3.us-east-2.amazonaws.com/{listing.dol_id}.pdf"
-                s3_client.upload_fileobj(
-                    io.BytesIO(job_order_pdf.content),
-                    settings.JOB_ORDER_PDF_DESTINATION,
-                    f"{listing.dol_id}.pdf",
-                )
+            return job_order_pdf, save_pdf(job_order_pdf)
+        return job_order_pdf, None
 
-            listing.pdf = saved_pdf
-            session.add(listing)
-            session.commit()
-            print(
-                f"{scraped_count} - Saved job order PDF for listing ID {listing.dol_id}"
+    try:
+        job_order_pdf, saved_pdf = await scraper.stream(pdf_url, consume, timeout=30)
+    except requests.RequestException as e:
+        job_order_pdf, saved_pdf = None, None
+        error = f"PDF request failed, {e!r}"
+    else:
+        error = f"PDF request failed, status code {job_order_pdf.status_code}"
+
+    if saved_pdf:
+        listing.pdf = saved_pdf
+        writer.add(listing)
+        print(
+            f"{writer.scraped_count} - Saved job order PDF for listing ID {listing.dol_id}"
+        )
+
+    else:
+        # We want to track in rollbar if there's a spike in this error because maybe then
+        # PDF scraping is broken entirely, but don't need to track every single occurance,
+        # so throttling to only log 1/10 of the occurrences.
+        if random.randint(0, 10) == 0:
+            rollbar.report_message(
+                "Failed job order PDF request for listing ID",
+                "warning",
+                extra_data={
+                    "dol_id": listing.dol_id,
+                    "pdf_request": job_order_pdf,
+                    "pdf_url": pdf_url,
+                },
             )
+        sys.stderr.write(
+            f"{writer.scraped_count} - Failed job order PDF request for listing ID {listing.dol_id}, url {pdf_url}"
+        )
+        # A listing missing from the search results has already had its failure recorded, and a
+        # request which didn't get a response is likely to be a problem with the site rather than
+        # the listing.
+        if (
+            job_order_pdf is not None
+            and listing.scraped
+            and settings.JOB_ORDER_PDF_DESTINATION
+        ):
+            writer.record_failure(listing, error)
 
-        else:
-            # We want to track in rollbar if there's a spike in this error because maybe then
-            # PDF scraping is broken entirely, but don't need to track every single occurance,
-            # so throttling to only log 1/10 of the occurrences.
-            if random.randint(0, 10) == 0:
-                rollbar.report_message(
-                    "Failed job order PDF request for listing ID",
-                    "warning",
-                    extra_data={
-                        "dol_id": listing.dol_id,
-                        "pdf_request": job_order_pdf,
-                        "pdf_url": pdf_url,
-                    },
-                )
-            sys.stderr.write(
-                f"{scraped_count} - Failed job order PDF request for listing ID {listing.dol_id}, url {pdf_url}"
+
+def claim_listings(
+    session: Session, max_records: int, worker_id: str
+) -> List[SeasonalJobsJobOrder]:
+    """
+    Claim the newest unscraped listings, then if there's room the newest scraped listings due a
+    re-scrape: those still active (seen in the RSS feed in the last SCRAPE_ACTIVE_SECONDS) and last
+    scraped over SCRAPE_REFRESH_SECONDS ago. Only listings due to be scraped (i.e. not backing off
+    after a failed scrape, or dead lettered) and not claimed by another scraper are claimed, for
+    SCRAPE_LEASE_SECONDS. Listings which another scraper is in the middle of claiming are skipped
+    rather than waited for, so concurrent scrapers split the backlog between them.
+    :param session:
+    :param max_records:
+    :param worker_id:
+    :return:
+    """
+    now = datetime.utcnow()
+    claimable = (
+        SeasonalJobsJobOrder.scrape_dead_letter == false(),
+        SeasonalJobsJobOrder.dol_id != None,  # noqa: E711
+        or_(  # type: ignore
+            SeasonalJobsJobOrder.scrape_next_attempt_at == None,  # noqa: E711
+            SeasonalJobsJobOrder.scrape_next_attempt_at <= now,  # type: ignore
+        ),
+        or_(  # type: ignore
+            SeasonalJobsJobOrder.scrape_lease_expires_at == None,  # noqa: E711
+            SeasonalJobsJobOrder.scrape_lease_expires_at < now,  # type: ignore
+        ),
+    )
+    listings = session.exec(
+        select(SeasonalJobsJobOrder)
+        .where(SeasonalJobsJobOrder.scraped == false(), *claimable)
+        .order_by(SeasonalJobsJobOrder.first_seen.desc())  # type: ignore
+        .limit(max_records)
+        .with_for_update(skip_locked=True)
+    ).all()
+
+    if len(listings) < max_records:
+        # last_seen is set from the RSS feed in local time.
+        active_since = datetime.now() - timedelta(
+            seconds=settings.SCRAPE_ACTIVE_SECONDS
+        )
+        listings += session.exec(
+            select(SeasonalJobsJobOrder)
+            .where(
+                SeasonalJobsJobOrder.scraped == true(),
+                SeasonalJobsJobOrder.last_seen >= active_since,  # type: ignore
+                or_(
+                    SeasonalJobsJobOrder.last_scraped_at == None,  # noqa: E711
+                    SeasonalJobsJobOrder.last_scraped_at  # type: ignore
+                    < now - timedelta(seconds=settings.SCRAPE_REFRESH_SECONDS),
+                ),
+                *claimable,
             )
+            .order_by(SeasonalJobsJobOrder.first_seen.desc())  # type: ignore
+            .limit(max_records - len(listings))
+            .with_for_update(skip_locked=True)
+        ).all()
+
+    for listing in listings:
+        keep_last_seen(listing)
+        listing.scrape_lease_owner = worker_id
+        listing.scrape_lease_expires_at = now + timedelta(
+            seconds=settings.SCRAPE_LEASE_SECONDS
+        )
+        session.add(listing)
+    session.commit()
+    return listings
+
+
+def release_listings(
+    session: Session, listings: List[SeasonalJobsJobOrder], worker_id: str
+) -> None:
+    """
+    Release the claim on listings, so any which weren't scraped can be claimed again straight away.
+    :param session:
+    :param listings:
+    :param worker_id:
+    :return:
+    """
+    session.execute(
+        update(SeasonalJobsJobOrder)
+        .where(
+            SeasonalJobsJobOrder.id.in_([listing.id for listing in listings]),  # type: ignore
+            SeasonalJobsJobOrder.scrape_lease_owner == worker_id,
+        )
+        .values(
+            scrape_lease_owner=None,
+            scrape_lease_expires_at=None,
+            last_seen=SeasonalJobsJobOrder.last_seen,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    session.commit()
+
+
+def retry_dead_letters(dol_ids: Union[List[str], None] = None) -> int:
+    """
+    Take listings out of the dead letter state, e.g. once whatever was failing their scrapes has been
+    fixed, so they're scraped again.
+    :param dol_ids: listings to retry, defaults to all dead lettered listings
+    :return: number of listings retried
+    """
+    session = Session(get_engine())
+    stmt = (
+        update(SeasonalJobsJobOrder)
+        .where(SeasonalJobsJobOrder.scrape_dead_letter == true())
+        .values(
+            scrape_dead_letter=False,
+            scrape_attempts=0,
+            scrape_next_attempt_at=None,
+            last_seen=SeasonalJobsJobOrder.last_seen,
+        )
+    )
+    if dol_ids:
+        stmt = stmt.where(SeasonalJobsJobOrder.dol_id.in_(dol_ids))  # type: ignore
+    retried = session.execute(stmt).rowcount  # type: ignore
+    session.commit()
     session.close()
+    print(f"Retrying {retried} dead lettered listings")
+    return retried
+
+
+async def scrape_all(
+    listings: List[SeasonalJobsJobOrder], writer: ListingWriter, concurrency: int
+) -> None:
+    scraper = AsyncScraper(concurrency, settings.SCRAPE_RATE_LIMIT)
+    batch_size = settings.SCRAPE_SEARCH_BATCH_SIZE
+    try:
+        await asyncio.gather(
+            *(
+                scrape_batch(scraper, writer, listings[i : i + batch_size])
+                for i in range(0, len(listings), batch_size)
+            )
+        )
+    finally:
+        scraper.close()
+
+
+def scrape_listings(max_records: int = 1, concurrency: Union[int, None] = None) -> bool:
+    """
+    Scrape detailed listings from SeasonalJobs azure server.
+
+    Listings are claimed for the duration of the scrape (see claim_listings), looked up
+    SCRAPE_SEARCH_BATCH_SIZE at a time, and scraped concurrently, with at most `concurrency` requests
+    in flight at once and requests to each host limited to SCRAPE_RATE_LIMIT per second. Scraped
+    listings are committed in batches of SCRAPE_COMMIT_BATCH_SIZE as they complete. Re-scraped
+    listings whose data hasn't changed (by scraped_data_hash) aren't rewritten or cleaned again, and
+    their PDFs aren't fetched again.
+    :param max_records: Number of records to scrape, defaults to 1
+    :param concurrency: defaults to SCRAPE_CONCURRENCY
+    :return:
+    """
+
+    if not (settings.JOBS_API_URL and settings.JOB_ORDER_BASE_URL):
+        raise Exception("JOBS_API_URL and JOB_ORDER_BASE_URL must be set")
+    if not settings.JOBS_API_KEY:
+        raise Exception("Jobs API Key must be set")
+
+    # Listings are committed in batches while others are still being scraped, so don't expire them.
+    session = Session(get_engine(), expire_on_commit=False)
+    worker_id = uuid.uuid4().hex
+    listings = claim_listings(session, max_records, worker_id)
+
+    if len(listings) == 0:
+        print("No listings left to scrape!")
+        session.close()
+        return False
+
+    writer = ListingWriter(session)
+    try:
+        asyncio.run(
+            scrape_all(listings, writer, concurrency or settings.SCRAPE_CONCURRENCY)
+        )
+    finally:
+        writer.commit()
+        release_listings(session, listings, worker_id)
+        session.close()
+    log_request_metrics()
     return True
 
 
@@ -1,28 +1,250 @@
 import sys
-from datetime import datetime
+from collections import Counter
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from itertools import islice
 from time import strftime
+from typing import IO, Dict, Iterator, List, Optional
+from xml.etree import ElementTree
 
 import feedparser
+import requests
 import rollbar
 from sqlmodel import Session, select
 
-from app.constants import USER_AGENT_STRING
 from app.db import get_engine
-from app.models.base import DoLDataSource
+from app.db.bulk import bulk_upsert
+from app.http_client import get_http_session
 from app.models.dol_disclosure_job_order import DolDisclosureJobOrder  # noqa
-from app.models.seasonal_jobs_job_order import SeasonalJobsJobOrder
+from app.models.seasonal_jobs_job_order import (
+    NEW_LISTING_DEFAULTS,
+    SeasonalJobsJobOrder,
+)
 from app.models.static_value import StaticValue
-from app.settings import DOL_ID_REGEX, ETAG_KEY, JOBS_RSS_FEED_URL, MODIFIED_KEY
+from app.settings import (
+    DOL_ID_REGEX,
+    ETAG_KEY,
+    JOBS_RSS_FEED_URL,
+    MODIFIED_KEY,
+    RSS_STREAMING,
+    RSS_UPSERT_BATCH_SIZE,
+)
 
+# Columns of a listing which come from the feed, and are updated (along with last_seen) for existing
+# listings.
+FEED_COLUMNS = ("link", "title", "description", "pub_date")
+# RSS item elements, and the feedparser entry keys they're read into.
+RSS_ITEM_FIELDS = {
+    "link": "link",
+    "title": "title",
+    "description": "description",
+    "pubDate": "published",
+}
 
-def scrape_rss(max_records: int = -1, skip_update: bool = False) -> bool:
+
+def get_listing_row(entry: dict) -> Optional[dict]:
+    """
+    Extract a listing from an RSS feed entry.
+    :param entry: feedparser entry, or one from iter_feed_entries
+    :return: listing attributes, or None (reporting why) if the entry doesn't have a single Dol ID
+    """
+    link = entry.get("link", "")
+    dol_ids = DOL_ID_REGEX.findall(link)
+
+    if len(dol_ids) == 0:
+        msg = f'No Dol ID found in RSS listing, with link="{link}"'
+        rollbar.report_message(msg, "error")
+        return None
+    if len(dol_ids) > 1:
+        msg = f'Multiple Dol IDs found in RSS listing, with link="{link}"'
+        rollbar.report_message(msg, "error")
+        return None
+
+    dol_id = dol_ids[0]
+    published = entry.get("published_parsed")
+    pub_date = strftime("%Y-%m-%d", published) if published else None
+    if not dol_id:
+        sys.stderr.write(f"Invalid entry with link {entry.get('link', 'N/A')}")
+        return None
+
+    return {
+        "dol_id": dol_id,
+        "link": entry.get("link", ""),
+        "title": entry.get("title", ""),
+        "description": entry.get("description", ""),
+        "pub_date": pub_date,
+        "last_seen": datetime.now(),
+    }
+
+
+class NotAnRssFeed(ValueError):
+    pass
+
+
+def iter_feed_entries(stream: IO[bytes]) -> Iterator[dict]:
+    """
+    Parse an RSS feed incrementally, yielding each item as soon as it has been read, in the same
+    form as feedparser's entries. Items are discarded once yielded, so memory use doesn't grow with
+    the size of the feed.
+    :param stream: file-like object the feed is read from
+    :return:
+    :raises ElementTree.ParseError: if the feed isn't well formed
+    :raises NotAnRssFeed:
+    """
+    channel = None
+    for event, element in ElementTree.iterparse(stream, events=("start", "end")):
+        if event == "start":
+            if channel is None:
+                if element.tag == "channel":
+                    channel = element
+                elif element.tag != "rss":
+                    raise NotAnRssFeed(f"Unexpected element {element.tag}")
+            continue
+        if element.tag != "item":
+            continue
+
+        entry = {
+            RSS_ITEM_FIELDS[child.tag]: (child.text or "").strip()
+            for child in element
+            if child.tag in RSS_ITEM_FIELDS
+        }
+        published = entry.pop("published", None)
+        if published:
+            try:
+                entry["published_parsed"] = (
+                    parsedate_to_datetime(published)
+                    .astimezone(timezone.utc)
+                    .timetuple()
+                )
+            except (TypeError, ValueError):
+                pass
+        yield entry
+        if channel is not None:
+            channel.remove(element)
+
+
+def upsert_listings(
+    session: Session, listings: List[dict], skip_update: bool
+) -> Counter:
+    """
+    Insert new listings and update existing ones from the feed, with one query to find which
+    listings already exist and one INSERT ... ON CONFLICT (dol_id) DO UPDATE.
+    :param session:
+    :param listings: listing attributes, from get_listing_row, with no two for the same Dol ID
+    :param skip_update: Skip updating existing records if found?
+    :return: counts of listings created, and existing listings changed and unchanged in the feed
+    """
+    existing = {
+        row[0]: tuple(row[1:])
+        for row in session.exec(
+            select(
+                SeasonalJobsJobOrder.dol_id,
+                *[getattr(SeasonalJobsJobOrder, c) for c in FEED_COLUMNS],
+            ).where(
+                SeasonalJobsJobOrder.dol_id.in_([l["dol_id"] for l in listings])  # type: ignore
+            )
+        ).all()
+    }
+
+    counts: Counter = Counter()
+    rows = []
+    for listing in listings:
+        if listing["dol_id"] in existing:
+            if existing[listing["dol_id"]] == tuple(listing[c] for c in FEED_COLUMNS):
+                counts["unchanged"] += 1
+            else:
+                counts["changed"] += 1
+            if skip_update:
+                print(
+                    f"skipped updating entry with title {listing['title']} and id {listing['dol_id']}"
+                )
+                continue
+            operation = "Updated"
+        else:
+            operation = "Created"
+            counts["created"] += 1
+        print(
+            f"{operation} entry with title {listing['title']} and id {listing['dol_id']}"
+        )
+        # New rows are inserted without the ORM, so need the model's defaults filling in.
+        rows.append(
+            {**NEW_LISTING_DEFAULTS, "first_seen": datetime.utcnow(), **listing}
+        )
+
+    if rows:
+        bulk_upsert(
+            session.connection(),
+            SeasonalJobsJobOrder.__table__,  # type: ignore
+            rows,
+            index_elements=["dol_id"],
+            update_columns=[*FEED_COLUMNS, "last_seen"],
+        )
+    return counts
+
+
+def stream_listings(
+    session: Session,
+    response: requests.Response,
+    max_records: int,
+    skip_update: bool,
+    stop_at_known: bool,
+) -> None:
+    """
+    Read listings from a streamed feed response, upserting and committing them in batches of
+    RSS_UPSERT_BATCH_SIZE as they arrive.
+    :param session:
+    :param response: response, requested with stream=True
+    :param max_records: Max number of entries to process, -1 for all
+    :param skip_update: Skip updating existing records if found?
+    :param stop_at_known: Stop after a batch with no new or changed listings
+    :return:
+    """
+    # Let urllib3 undo the gzip transfer encoding as the feed is read.
+    response.raw.decode_content = True
+    entries = iter_feed_entries(response.raw)  # type: ignore
+    if max_records > 0:
+        entries = islice(entries, max_records)
+
+    batch: Dict[str, dict] = {}
+    for entry in entries:
+        listing = get_listing_row(entry)
+        if listing:
+            batch[listing["dol_id"]] = listing
+        if len(batch) >= RSS_UPSERT_BATCH_SIZE:
+            counts = upsert_listings(session, list(batch.values()), skip_update)
+            session.commit()
+            batch = {}
+            if stop_at_known and not counts["created"] and not counts["changed"]:
+                print("Reached listings which are already known and unchanged")
+                return
+
+    if batch:
+        upsert_listings(session, list(batch.values()), skip_update)
+        session.commit()
+
+
+def scrape_rss(
+    max_records: int = -1,
+    skip_update: bool = False,
+    streaming: Optional[bool] = None,
+    stop_at_known: bool = False,
+) -> bool:
     """
     Scrape Seasonaljobs.dol.gov RSS feed for new job listings.
 
+    In streaming mode the feed is parsed as it's downloaded and its listings are written in batches
+    as they arrive, rather than the whole feed being downloaded and parsed first.
     :param max_records: Max number of entries to process, defaults to -1 (all)
     :param skip_update: Skip updating existing records if found?
+    :param streaming: defaults to RSS_STREAMING
+    :param stop_at_known: In streaming mode, stop reading the feed after a batch of listings which
+        are all already known and unchanged. Listings further down the feed won't have last_seen
+        updated, which is how re-scrapes tell which listings are still active, so only use this
+        between full scrapes.
     :return:
     """
+    if streaming is None:
+        streaming = RSS_STREAMING
     if not JOBS_RSS_FEED_URL:
         raise Exception("RSS feed URL must be set")
 
@@ -47,100 +269,84 @@ def scrape_rss(max_records: int = -1, skip_update: bool = False) -> bool:
         modified_obj = StaticValue(key=MODIFIED_KEY)
         modified = None
 
-    rss_entries = feedparser.parse(
-        JOBS_RSS_FEED_URL,
-        etag=etag,
-        modified=modified,
-        agent=USER_AGENT_STRING,
-    )
-
-    if rss_entries.get("bozo", False):
-        # Error code from feed scraper
-        msg = f"Error pulling RSS Feed {rss_entries.get('bozo_exception', '')}"
-
-        sys.stderr.write(msg)
-        rollbar.report_message(msg, "error")
-        return False
-
-    if rss_entries.get("status", False) not in [200, 301]:
-        # Error code from feed scraper
-        msg = f"RSS Feed status code: {rss_entries.get('status', False)}, not 200"
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if modified:
+        headers["If-Modified-Since"] = modified
+    if streaming:
+        headers["Accept-Encoding"] = "gzip"
+    try:
+        response = get_http_session().get(
+            JOBS_RSS_FEED_URL, headers=headers, timeout=30, stream=streaming
+        )
+    except requests.RequestException as e:
+        msg = f"Error pulling RSS Feed {e!r}"
         sys.stderr.write(msg)
         rollbar.report_message(msg, "error")
         return False
 
-    if rss_entries.get("version", "") == "":
+    if response.status_code == 304:
         print("RSS fetched, but no new entries")
         return False
 
-    processed_count = 0
-    for entry in rss_entries.get("entries", []):
-        processed_count += 1
-        if processed_count > max_records > 0:
-            break
-
-        link = entry.get("link", "")
-        dol_ids = DOL_ID_REGEX.findall(link)
+    if response.status_code not in [200, 301]:
+        # Error code from feed server
+        msg = f"RSS Feed status code: {response.status_code}, not 200"
+        sys.stderr.write(msg)
+        rollbar.report_message(msg, "error")
+        return False
 
-        if len(dol_ids) == 0:
-            msg = f'No Dol ID found in RSS listing, with link="{link}"'
-            rollbar.report_message(msg, "error")
-            continue
-        if len(dol_ids) > 1:
-            msg = f'Multiple Dol IDs found in RSS listing, with link="{link}"'
+    if streaming:
+        try:
+            stream_listings(session, response, max_records, skip_update, stop_at_known)
+        except NotAnRssFeed:
+            print("RSS fetched, but no new entries")
+            return False
+        except (ElementTree.ParseError, requests.RequestException) as e:
+            msg = f"Error pulling RSS Feed {e!r}"
+            sys.stderr.write(msg)
             rollbar.report_message(msg, "error")
-            continue
+            return False
+        finally:
+            response.close()
 
-        dol_id = dol_ids[0]
-        pub_date = strftime("%Y-%m-%d", entry.get("published_parsed", ""))
-        if not dol_id:
-            sys.stderr.write(f"Invalid entry with link {entry.get('link', 'N/A')}")
-            continue
+    else:
+        rss_entries = feedparser.parse(response.content)
 
-        listing_attributes = {
-            "link": entry.get("link", ""),
-            "title": entry.get("title", ""),
-            "description": entry.get("description", ""),
-            "pub_date": pub_date,
-            "last_seen": datetime.now(),
-        }
+        if rss_entries.get("bozo", False):
+            # Error code from feed scraper
+            msg = f"Error pulling RSS Feed {rss_entries.get('bozo_exception', '')}"
 
-        existing_listing = session.exec(
-            select(SeasonalJobsJobOrder).where(SeasonalJobsJobOrder.dol_id == dol_id)
-        ).first()
+            sys.stderr.write(msg)
+            rollbar.report_message(msg, "error")
+            return False
 
-        if existing_listing and skip_update:
-            print(
-                f"{processed_count} skipped updating entry with title {listing_attributes['title']} and id {dol_id}"
-            )
-            continue
+        if rss_entries.get("version", "") == "":
+            print("RSS fetched, but no new entries")
+            return False
 
-        operation = None
-        if not existing_listing:
-            operation = "Created"
-            session.add(
-                SeasonalJobsJobOrder(
-                    source=DoLDataSource.scraper, dol_id=dol_id, **listing_attributes
-                )
+        listings: Dict[str, dict] = {}
+        entries = rss_entries.get("entries", [])
+        for entry in entries[:max_records] if max_records > 0 else entries:
+            listing = get_listing_row(entry)
+            if listing:
+                listings[listing["dol_id"]] = listing
+        dol_ids = list(listings.keys())
+        for i in range(0, len(dol_ids), RSS_UPSERT_BATCH_SIZE):
+            upsert_listings(
+                session,
+                [listings[dol_id] for dol_id in dol_ids[i : i + RSS_UPSERT_BATCH_SIZE]],
+                skip_update,
             )
 
-        else:
-            operation = "Updated"
-            for k, v in listing_attributes.items():
-                setattr(existing_listing, k, v)
-            session.add(existing_listing)
-
-        print(
-            f"{processed_count} - {operation} entry with title {listing_attributes['title']} and id {dol_id}"
-        )
-
     # Assuming scrape was successful, save etag and last_modified.
-    if rss_entries.get("etag", False):
-        etag_obj.value = rss_entries.get("etag", "")
+    if response.headers.get("ETag"):
+        etag_obj.value = response.headers["ETag"]
         session.add(etag_obj)
 
-    if rss_entries.get("modified", False):
-        modified_obj.value = rss_entries.get("modified", "")
+    if response.headers.get("Last-Modified"):
+        modified_obj.value = response.headers["Last-Modified"]
         session.add(modified_obj)
 
     session.commit()
@@ -1,17 +1,24 @@
 from datetime import datetime
+from itertools import islice
 from typing import Dict, List, Tuple, Union
 
-from sqlalchemy import null
+from sqlalchemy import func, null
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlmodel import Session, select
 
 from app.db import get_engine
-from app.models.address_record import AddressRecord, normalize_address
-from app.models.base import DoLDataSource
+from app.db.bulk import bulk_upsert, is_postgres, on_conflict
+from app.models.address_record import (
+    AddressRecord,
+    address_cache,
+    normalize_address,
+    normalize_addresses,
+)
 from app.models.dol_disclosure_job_order import DolDisclosureJobOrder
 from app.models.dol_disclosure_job_order_address_record_link import (
     DolDisclosureJobOrderAddressRecordLink,
 )
-from app.models.employer_record import EmployerRecord
+from app.models.employer_record import EmployerRecord  # noqa
 from app.models.employer_record_address_link import (
     AddressType,
     EmployerRecordAddressLink,
@@ -21,116 +28,126 @@ from app.settings import ROWS_BEFORE_COMMIT
 address_normalize_session = Session(get_engine())
 
 
-def link_address_to_employer(
-    session: Session,
-    address_id: int,
-    employer: EmployerRecord,
-    address_type: AddressType,
-    first_seen: Union[datetime, None],
-    last_seen: Union[datetime, None],
-    source: DoLDataSource,
-) -> None:
-    """
-    Link a single address to a single employer record, or update existing link if it exists.
-    :param session
-    :param address_id:
-    :param employer:
-    :param address_type: type of address for the linkage
-    :param first_seen
-    :param last_seen
-    :param source
-    :return:
-    """
+def earliest(*dates: Union[datetime, None]) -> Union[datetime, None]:
+    return min((d for d in dates if d), default=None)
 
-    # First, check for existing links.
-    existing_links = session.exec(
-        select(EmployerRecordAddressLink)
-        .where(EmployerRecordAddressLink.employer_record == employer)
-        .where(EmployerRecordAddressLink.address_record_id == address_id)
-        .where(EmployerRecordAddressLink.address_type == address_type)
-    ).all()
-    if len(existing_links) > 1:
-        print(
-            f"Error! Multiple address - employer record links found for {address_type} {address_id} <-> {employer.name}"
-        )
-        return
 
-    save_record = False
-    if len(existing_links) == 1:
-        if not existing_links[0].first_seen or (
-            first_seen and existing_links[0].first_seen > first_seen
-        ):
-            existing_links[0].first_seen = first_seen
-            save_record = True
-        if not existing_links[0].last_seen or (
-            last_seen and existing_links[0].last_seen < last_seen
-        ):
-            existing_links[0].last_seen = last_seen
-            save_record = True
+def latest(*dates: Union[datetime, None]) -> Union[datetime, None]:
+    return max((d for d in dates if d), default=None)
 
-        if save_record:
-            session.add(existing_links[0])
 
-    else:
-        session.add(
-            EmployerRecordAddressLink(
-                employer_record=employer,
-                address_record_id=address_id,
-                address_type=address_type,
-                first_seen=first_seen,
-                last_seen=last_seen,
-                source=source,
+def save_addresses(session: Session, addresses: List[AddressRecord]) -> Dict[str, int]:
+    """
+    Create address records for the addresses which don't have one yet, one per normalized address,
+    in a single insert.
+    :param session:
+    :param addresses: normalized addresses
+    :return: normalized address => address record id, for each of the addresses
+    """
+    new_addresses: Dict[str, AddressRecord] = {}
+    for address in addresses:
+        new_addresses.setdefault(address.normalized_address, address)  # type: ignore
+
+    address_ids: Dict[str, int] = dict(
+        session.exec(  # type: ignore
+            select(AddressRecord.normalized_address, AddressRecord.id).where(
+                AddressRecord.normalized_address.in_(new_addresses)  # type: ignore
             )
+        ).all()
+    )
+    rows = [
+        address.dict(exclude={"id"})
+        for normalized_address, address in new_addresses.items()
+        if normalized_address not in address_ids
+    ]
+    if not rows:
+        return address_ids
+
+    # Another worker may have created some of them since, which are left as they are.
+    table = AddressRecord.__table__  # type: ignore
+    connection = session.connection()
+    if is_postgres(connection):
+        stmt = on_conflict(
+            postgresql.insert(table).values(rows), ["normalized_address"], []
+        ).returning(table.c.normalized_address, table.c.id)
+        address_ids.update(dict(connection.execute(stmt).all()))  # type: ignore
+    else:
+        connection.execute(
+            on_conflict(sqlite.insert(table), ["normalized_address"], []), rows
+        )
+    missing = [address for address in new_addresses if address not in address_ids]
+    if missing:
+        address_ids.update(
+            session.exec(  # type: ignore
+                select(AddressRecord.normalized_address, AddressRecord.id).where(
+                    AddressRecord.normalized_address.in_(missing)  # type: ignore
+                )
+            ).all()
         )
+    return address_ids
 
 
-def check_for_matching_addresses(
-    address: AddressRecord,
-    session: Session,
-    local_addresses: Union[Dict[str, int], None] = None,
-) -> List[int]:
+def link_addresses_to_employers(session: Session, links: List[Dict]) -> None:
     """
-    Checks the DB for addresses matching a given address.
-    :param address_attributes:
-    :param local_addresses: Addresses which haven't yet been committed to the DB
+    Link addresses to employer records, or widen the first seen / last seen dates of the existing
+    links, in one upsert. As it's a single statement, concurrent workers can't create duplicate links
+    or overwrite each other's dates.
     :param session:
+    :param links: employer_record_id, address_record_id, address_type, first_seen, last_seen and source
+    of each link. There may be several for the same employer, address and address type.
     :return:
     """
+    # One row per link, as an upsert can't change the same row twice.
+    merged_links: Dict[Tuple[int, int, AddressType], Dict] = {}
+    for link in links:
+        key = (
+            link["employer_record_id"],
+            link["address_record_id"],
+            link["address_type"],
+        )
+        if key not in merged_links:
+            merged_links[key] = dict(link)
+            continue
+        merged_link = merged_links[key]
+        merged_link["first_seen"] = earliest(
+            merged_link["first_seen"], link["first_seen"]
+        )
+        merged_link["last_seen"] = latest(merged_link["last_seen"], link["last_seen"])
+    if not merged_links:
+        return
 
-    if local_addresses is None:
-        local_addresses = {}
-    if address.normalized_address is None:
-        return []
-
-    if len(local_addresses) > 0:
-        # First, search through local addresses.
-        matching_local_addresses = local_addresses.get(address.normalized_address)
-        if matching_local_addresses:
-            return [
-                matching_local_addresses,
-            ]
-
-    statement = select(AddressRecord.id).where(
-        AddressRecord.normalized_address == address.normalized_address
+    table = EmployerRecordAddressLink.__table__  # type: ignore
+    connection = session.connection()
+    if is_postgres(connection):
+        stmt, least, greatest = postgresql.insert(table), func.least, func.greatest
+    else:
+        stmt, least, greatest = sqlite.insert(table), func.min, func.max
+    # LEAST/GREATEST of the two dates, where either may be null.
+    first_seen, new_first_seen = table.c.first_seen, stmt.excluded.first_seen
+    last_seen, new_last_seen = table.c.last_seen, stmt.excluded.last_seen
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["address_type", "employer_record_id", "address_record_id"],
+        set_={
+            "first_seen": least(
+                func.coalesce(first_seen, new_first_seen),
+                func.coalesce(new_first_seen, first_seen),
+            ),
+            "last_seen": greatest(
+                func.coalesce(last_seen, new_last_seen),
+                func.coalesce(new_last_seen, last_seen),
+            ),
+        },
     )
-    return session.exec(statement).all()
+    connection.execute(stmt, list(merged_links.values()))
 
 
-def process_job_order(
+def get_job_order_addresses(
     job_order: DolDisclosureJobOrder,
-    session: Session,
-    local_addresses: Union[Dict[str, AddressRecord], None] = None,
-) -> Tuple[DolDisclosureJobOrder, List[AddressRecord]]:
+) -> Tuple[AddressRecord, AddressRecord]:
     """
-    Process addresses from a single job order.
-
     :param job_order:
-    :param session:
-    :return:
+    :return: office and jobsite addresses, cleaned but not yet normalized
     """
-    # First, check for matching office addresses.
-    if local_addresses is None:
-        local_addresses = {}
     office_address = AddressRecord(
         address_1=job_order.employer_address_1,
         address_2=job_order.employer_address_2,
@@ -139,99 +156,90 @@ def process_job_order(
         postal_code=job_order.employer_postal_code,
         country=job_order.employer_country,
     ).clean()
-    office_address.normalized_address = normalize_address(
-        str(office_address), address_normalize_session
-    )
-
-    if not office_address.is_null():
-        matching_addresses = check_for_matching_addresses(
-            office_address, session, local_addresses=local_addresses
-        )
-        if len(matching_addresses) == 0:
-            # Create a new address record if none exists.
-            session.add(office_address)
-            session.commit()
-            session.refresh(office_address)
-            local_addresses[office_address.normalized_address] = office_address.id
-            matching_addresses = [
-                office_address.id,
-            ]
-
-        if len(matching_addresses) > 1:
-            print(
-                f"Error -- more than one address found matching {office_address.normalized_address}"
-            )
-
-        link_address_to_employer(
-            session,
-            matching_addresses[0],
-            job_order.employer_record,
-            AddressType.office,
-            job_order.first_seen,
-            job_order.last_seen,
-            job_order.source,
-        )
-        session.add(
-            DolDisclosureJobOrderAddressRecordLink(
-                dol_disclosure_job_order_id=job_order.id,
-                address_record_id=matching_addresses[0],
-            )
-        )
-        office_address_id = matching_addresses[0]
-
-    # Then do the same for matching jobsite addresses.
-    # First create a new address and check if it is null and/or if it is the same as the previously created address.
     jobsite_address = AddressRecord(
         address_1=job_order.worksite_address,
         city=job_order.worksite_city,
         state=job_order.worksite_state,
         postal_code=job_order.worksite_postal_code,
     ).clean()
+    return office_address, jobsite_address
+
+
+def get_normalized_address(
+    address: AddressRecord, normalized_addresses: Union[Dict[str, str], None]
+) -> str:
+    if normalized_addresses and str(address) in normalized_addresses:
+        return normalized_addresses[str(address)]
+    return normalize_address(str(address), address_normalize_session)
+
 
-    if jobsite_address.is_null():
-        return (job_order, local_addresses)
-    jobsite_address.normalized_address = normalize_address(
-        str(jobsite_address), address_normalize_session
+def process_job_orders(
+    job_orders: List[DolDisclosureJobOrder],
+    session: Session,
+    normalized_addresses: Union[Dict[str, str], None] = None,
+) -> None:
+    """
+    Process addresses from a chunk of job orders: create address records for new addresses, and
+    link the addresses to the job orders and to their employer records.
+
+    :param job_orders:
+    :param session:
+    :param normalized_addresses: Addresses already normalized by normalize_addresses
+    :return:
+    """
+    job_order_addresses: List[
+        Tuple[DolDisclosureJobOrder, AddressType, AddressRecord]
+    ] = []
+    for job_order in job_orders:
+        office_address, jobsite_address = get_job_order_addresses(job_order)
+        for address_type, address in (
+            (AddressType.office, office_address),
+            (AddressType.jobsite, jobsite_address),
+        ):
+            if address.is_null():
+                continue
+            address.normalized_address = get_normalized_address(
+                address, normalized_addresses
+            )
+            job_order_addresses.append((job_order, address_type, address))
+
+    address_ids = save_addresses(
+        session, [address for _, _, address in job_order_addresses]
     )
 
-    matching_addresses = check_for_matching_addresses(
-        jobsite_address, session, local_addresses=local_addresses
+    job_order_links = {
+        (job_order.id, address_ids[address.normalized_address])  # type: ignore
+        for job_order, _, address in job_order_addresses
+    }
+    bulk_upsert(
+        session.connection(),
+        DolDisclosureJobOrderAddressRecordLink.__table__,  # type: ignore
+        [
+            {
+                "dol_disclosure_job_order_id": job_order_id,
+                "address_record_id": address_id,
+            }
+            for job_order_id, address_id in sorted(job_order_links)
+        ],
+        ["dol_disclosure_job_order_id", "address_record_id"],
+        [],
     )
-    if len(matching_addresses) == 0:
-        # Create a new address record if none exists.
-        session.add(jobsite_address)
-        session.commit()
-        session.refresh(jobsite_address)
-        local_addresses[jobsite_address.normalized_address] = jobsite_address.id
-        matching_addresses = [
-            jobsite_address.id,
-        ]
-
-    if len(matching_addresses) > 1:
-        print(
-            f"Error -- more than one address found matching {jobsite_address.normalized_address}"
-        )
 
-    link_address_to_employer(
+    link_addresses_to_employers(
         session,
-        matching_addresses[0],
-        job_order.employer_record,
-        AddressType.jobsite,
-        job_order.first_seen,
-        job_order.last_seen,
-        job_order.source,
+        [
+            {
+                "employer_record_id": job_order.employer_record_id,
+                "address_record_id": address_ids[address.normalized_address],  # type: ignore
+                "address_type": address_type,
+                "first_seen": job_order.first_seen,
+                "last_seen": job_order.last_seen,
+                "source": job_order.source,
+            }
+            for job_order, address_type, address in job_order_addresses
+            if job_order.employer_record_id is not None
+        ],
     )
-    if matching_addresses[0] != office_address_id:
-        session.add(
-            DolDisclosureJobOrderAddressRecordLink(
-                dol_disclosure_job_order_id=job_order.id,
-                address_record_id=matching_addresses[0],
-            )
-        )
-
-    session.commit()
-
-    return (job_order, local_addresses)
 
 
 def update_addresses(max_records: int = -1) -> None:
@@ -254,21 +262,42 @@ def update_addresses(max_records: int = -1) -> None:
     if max_records > 0:
         statement = statement.limit(max_records)
 
-    job_orders_to_process = session.exec(statement)
+    job_orders_to_process = iter(session.exec(statement))
 
-    local_addresses: Dict[str, int] = {}
     i = 0
-    for job_order in job_orders_to_process:
-        job_order, local_addresses = process_job_order(
-            job_order, session, local_addresses=local_addresses
+    while True:
+        job_orders = list(islice(job_orders_to_process, ROWS_BEFORE_COMMIT))
+        if not job_orders:
+            break
+
+        # Normalize the whole chunk's addresses at once.
+        normalized_addresses = normalize_addresses(
+            (
+                str(address)
+                for job_order in job_orders
+                for address in get_job_order_addresses(job_order)
+            ),
+            address_normalize_session,
         )
-        i += 1
-        if i % ROWS_BEFORE_COMMIT == 0:
-            print(f"Processed {i} job orders for addresses")
-            session.commit()
+        process_job_orders(job_orders, session, normalized_addresses)
+        i += len(job_orders)
+        print(f"Processed {i} job orders for addresses")
+        session.commit()
+        # Save newly cached normalized addresses.
+        address_normalize_session.commit()
 
     session.commit()
+    address_normalize_session.commit()
     session.close()
+    log_address_cache_stats()
+
+
+def log_address_cache_stats() -> None:
+    stats = address_cache.get_stats()
+    print(
+        f"Address normalization cache: {stats['memory_hits']} memory hits, "
+        f"{stats['table_hits']} table hits, {stats['misses']} misses"
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,255 @@
+"""
+Pure-Python address normalizer, which reproduces the parts of the pagc standardization (as printed
+by pprint_addy) that matter for matching addresses: upper case, USPS street suffix, directional
+and unit designator abbreviations, state codes and 5 digit ZIP codes, formatted as
+
+    1 MAIN ST APT 4, RALEIGH, NC 27601
+
+It needs no database round trip, so it's used on SQLite, when pagc fails, and for backfills with
+ADDRESS_NORMALIZER=offline. check_address_normalizer_parity compares it with pagc.
+"""
+
+import re
+from typing import List, Optional, Tuple
+
+from app.constants import US_STATE_ABBREVIATIONS, US_STATES_TO_ABBREV
+
+COUNTRY_NAMES = (
+    "UNITED STATES OF AMERICA",
+    "UNITED STATES",
+    "USA",
+    "US",
+)
+
+DIRECTIONALS = {
+    "NORTH": "N",
+    "SOUTH": "S",
+    "EAST": "E",
+    "WEST": "W",
+    "NORTHEAST": "NE",
+    "NORTHWEST": "NW",
+    "SOUTHEAST": "SE",
+    "SOUTHWEST": "SW",
+    "N": "N",
+    "S": "S",
+    "E": "E",
+    "W": "W",
+    "NE": "NE",
+    "NW": "NW",
+    "SE": "SE",
+    "SW": "SW",
+}
+
+# USPS Publication 28 suffix abbreviations, for the suffixes (and common variants) seen in job orders.
+STREET_SUFFIXES = {
+    "ALLEY": "ALY",
+    "ALY": "ALY",
+    "AVENUE": "AVE",
+    "AVEN": "AVE",
+    "AV": "AVE",
+    "AVE": "AVE",
+    "BEND": "BND",
+    "BND": "BND",
+    "BOULEVARD": "BLVD",
+    "BOUL": "BLVD",
+    "BLVD": "BLVD",
+    "BRANCH": "BR",
+    "BR": "BR",
+    "BRIDGE": "BRG",
+    "BRG": "BRG",
+    "BYPASS": "BYP",
+    "BYP": "BYP",
+    "CIRCLE": "CIR",
+    "CIRCL": "CIR",
+    "CIR": "CIR",
+    "COURT": "CT",
+    "CRT": "CT",
+    "CT": "CT",
+    "COVE": "CV",
+    "CV": "CV",
+    "CREEK": "CRK",
+    "CRK": "CRK",
+    "CROSSING": "XING",
+    "XING": "XING",
+    "DRIVE": "DR",
+    "DRV": "DR",
+    "DR": "DR",
+    "EXPRESSWAY": "EXPY",
+    "EXPY": "EXPY",
+    "EXTENSION": "EXT",
+    "EXT": "EXT",
+    "FREEWAY": "FWY",
+    "FWY": "FWY",
+    "GROVE": "GRV",
+    "GRV": "GRV",
+    "HEIGHTS": "HTS",
+    "HTS": "HTS",
+    "HIGHWAY": "HWY",
+    "HIWAY": "HWY",
+    "HWY": "HWY",
+    "HOLLOW": "HOLW",
+    "HOLW": "HOLW",
+    "LANE": "LN",
+    "LN": "LN",
+    "LOOP": "LOOP",
+    "MANOR": "MNR",
+    "MNR": "MNR",
+    "MOUNTAIN": "MTN",
+    "MTN": "MTN",
+    "PARKWAY": "PKWY",
+    "PKY": "PKWY",
+    "PKWY": "PKWY",
+    "PIKE": "PIKE",
+    "PLACE": "PL",
+    "PL": "PL",
+    "PLAZA": "PLZ",
+    "PLZ": "PLZ",
+    "POINT": "PT",
+    "PT": "PT",
+    "RIDGE": "RDG",
+    "RDG": "RDG",
+    "ROAD": "RD",
+    "RD": "RD",
+    "ROUTE": "RTE",
+    "RTE": "RTE",
+    "RUN": "RUN",
+    "SQUARE": "SQ",
+    "SQ": "SQ",
+    "STREET": "ST",
+    "STR": "ST",
+    "ST": "ST",
+    "TERRACE": "TER",
+    "TER": "TER",
+    "TRACE": "TRCE",
+    "TRCE": "TRCE",
+    "TRAIL": "TRL",
+    "TRL": "TRL",
+    "TURNPIKE": "TPKE",
+    "TPKE": "TPKE",
+    "VALLEY": "VLY",
+    "VLY": "VLY",
+    "VIEW": "VW",
+    "VW": "VW",
+    "VILLAGE": "VLG",
+    "VLG": "VLG",
+    "WAY": "WAY",
+}
+
+UNIT_DESIGNATORS = {
+    "APARTMENT": "APT",
+    "APT": "APT",
+    "BUILDING": "BLDG",
+    "BLDG": "BLDG",
+    "DEPARTMENT": "DEPT",
+    "DEPT": "DEPT",
+    "FLOOR": "FL",
+    "FL": "FL",
+    "LOT": "LOT",
+    "OFFICE": "OFC",
+    "OFC": "OFC",
+    "ROOM": "RM",
+    "RM": "RM",
+    "SPACE": "SPC",
+    "SPC": "SPC",
+    "SUITE": "STE",
+    "STE": "STE",
+    "UNIT": "UNIT",
+    "#": "#",
+}
+
+ZIP_CODE = re.compile(r"^(\d{5})(?:-?\d{4})?$")
+MAX_STATE_NAME_WORDS = max(len(name.split()) for name in US_STATES_TO_ABBREV)
+
+
+def split_state_zip(words: List[str]) -> Tuple[List[str], Optional[str], Optional[str]]:
+    """
+    Take the country, ZIP code and state off the end of the last part of an address.
+    :param words:
+    :return: remaining words, state code, ZIP code
+    """
+    text = " ".join(words)
+    for country in COUNTRY_NAMES:
+        if text == country or text.endswith(f" {country}"):
+            words = text[: -len(country)].split()
+            break
+
+    zip_code = None
+    if words and ZIP_CODE.match(words[-1]):
+        zip_code = ZIP_CODE.match(words.pop())[1]  # type: ignore
+
+    state = None
+    for length in range(min(MAX_STATE_NAME_WORDS, len(words)), 0, -1):
+        name = " ".join(words[-length:]).lower()
+        if name in US_STATES_TO_ABBREV:
+            state = US_STATES_TO_ABBREV[name].upper()
+            words = words[:-length]
+            break
+    if state is None and words and words[-1].lower() in US_STATE_ABBREVIATIONS:
+        state = words.pop()
+    return words, state, zip_code
+
+
+def normalize_street(street: str) -> str:
+    """
+    :param street: e.g. 123 NORTH MAIN STREET SUITE 4
+    :return: e.g. 123 N MAIN ST STE 4
+    """
+    words = street.replace("#", " # ").split()
+
+    unit: List[str] = []
+    for i, word in enumerate(words):
+        if i > 0 and word in UNIT_DESIGNATORS:
+            unit = [UNIT_DESIGNATORS[word]] + words[i + 1 :]
+            words = words[:i]
+            break
+
+    # The house number, if any, isn't part of the street name.
+    start = 1 if words and words[0][0].isdigit() else 0
+    # A directional followed only by a suffix is the street name, e.g. EAST ST.
+    if (
+        len(words) - start > 1
+        and words[start] in DIRECTIONALS
+        and (len(words) - start > 2 or words[start + 1] not in STREET_SUFFIXES)
+    ):
+        words[start] = DIRECTIONALS[words[start]]
+        start += 1
+    end = len(words) - 1
+    if end - start > 0 and words[end] in DIRECTIONALS:
+        words[end] = DIRECTIONALS[words[end]]
+        end -= 1
+    if end - start > 0 and words[end] in STREET_SUFFIXES:
+        words[end] = STREET_SUFFIXES[words[end]]
+    # A type before the name, e.g. HIGHWAY 17 or COUNTY ROAD 12.
+    for i in range(start, end):
+        if words[i] in STREET_SUFFIXES and words[i + 1][0].isdigit():
+            words[i] = STREET_SUFFIXES[words[i]]
+
+    return " ".join(words + unit)
+
+
+def normalize_address_offline(address_str: Optional[str]) -> str:
+    """
+    :param address_str: e.g. 123 North Main Street Suite 4, Raleigh, North Carolina 27601-1234 USA
+    :return: e.g. 123 N MAIN ST STE 4, RALEIGH, NC 27601
+    """
+    if not address_str:
+        return ""
+
+    text = re.sub(r"[^\w#,\- ]", " ", address_str.upper().replace(".", ""))
+    parts = [" ".join(part.split()) for part in text.split(",")]
+    parts = [part for part in parts if part]
+    if not parts:
+        return ""
+
+    words, state, zip_code = split_state_zip(parts[-1].split())
+    if len(parts) == 1:
+        street, city = " ".join(words), None
+    elif words:
+        street, city = ", ".join(parts[:-1]), " ".join(words)
+    elif len(parts) > 2:
+        street, city = ", ".join(parts[:-2]), parts[-2]
+    else:
+        street, city = parts[0], None
+
+    normalized = ", ".join(v for v in (normalize_street(street), city, state) if v)
+    return " ".join(v for v in (normalized, zip_code) if v)
@@ -59,6 +59,7 @@ def get_engine(echo=False, yield_per=False, refresh=False) -> Engine:
 
 
 def get_mock_engine() -> Engine:
+    from app.models.address_normalization_cache import AddressNormalizationCache  # noqa
     from app.models.address_record import AddressRecord  # noqa
     from app.models.dedupe_entity_map import DedupeEntityMap  # noqa
     from app.models.dol_disclosure_job_order import DolDisclosureJobOrder  # noqa
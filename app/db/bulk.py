@@ -0,0 +1,172 @@
+"""
+Bulk write helpers which bypass the ORM unit of work.
+
+On Postgres rows are streamed in with `COPY ... FROM STDIN`, other engines (i.e. SQLite in tests
+and local runs) fall back to a batched executemany insert. Upserts on Postgres COPY into a temporary
+staging table and merge from there with `INSERT ... ON CONFLICT DO UPDATE`.
+"""
+
+import io
+from datetime import date, datetime, time
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional
+
+import sqlalchemy as sa
+from sqlalchemy import Table, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
+
+
+def is_postgres(connection: Connection) -> bool:
+    return connection.dialect.name == "postgresql"
+
+
+def _copy_value(value: Any, processor: Optional[Callable]) -> str:
+    """
+    Format a single value for Postgres COPY text format.
+    :param value:
+    :param processor: SQLAlchemy bind processor for the column type, if any
+    :return:
+    """
+    if processor is not None:
+        value = processor(value)
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, Enum):
+        # As psycopg2 adapts str enums, rather than str(), which gives e.g. "DoLDataSource.scraper".
+        value = value.value
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def copy_rows(
+    connection: Connection,
+    table: Table,
+    rows: List[Dict[str, Any]],
+    table_name: Optional[str] = None,
+) -> None:
+    """
+    Stream rows into a Postgres table using COPY FROM STDIN.
+
+    All rows must have the same keys.
+    :param connection: SQLAlchemy connection, the copy runs inside its current transaction
+    :param table:
+    :param rows:
+    :param table_name: table to copy into instead of table, e.g. a staging table with the same columns
+    :return:
+    """
+    if not rows:
+        return
+
+    table_name = table_name or table.name
+    columns = [table.c[k] for k in rows[0].keys()]
+    processors = [c.type.bind_processor(connection.dialect) for c in columns]
+
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(
+            "\t".join(_copy_value(row[c.name], p) for c, p in zip(columns, processors))
+        )
+        buffer.write("\n")
+    buffer.seek(0)
+
+    column_list = ", ".join(f'"{c.name}"' for c in columns)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(
+            f'COPY "{table_name}" ({column_list}) FROM STDIN WITH (FORMAT text)',
+            buffer,
+        )
+    finally:
+        cursor.close()
+
+
+def bulk_insert(
+    connection: Connection, table: Table, rows: List[Dict[str, Any]]
+) -> None:
+    """
+    Insert a batch of rows, using COPY on Postgres and executemany elsewhere.
+    :param connection:
+    :param table:
+    :param rows:
+    :return:
+    """
+    if not rows:
+        return
+
+    if is_postgres(connection):
+        copy_rows(connection, table, rows)
+    else:
+        connection.execute(insert(table), rows)
+
+
+def on_conflict(
+    stmt, index_elements: List[str], update_columns: List[str], index_where=None
+):
+    if not update_columns:
+        return stmt.on_conflict_do_nothing(
+            index_elements=index_elements, index_where=index_where
+        )
+    return stmt.on_conflict_do_update(
+        index_elements=index_elements,
+        index_where=index_where,
+        set_={c: stmt.excluded[c] for c in update_columns},
+    )
+
+
+def bulk_upsert(
+    connection: Connection,
+    table: Table,
+    rows: List[Dict[str, Any]],
+    index_elements: List[str],
+    update_columns: List[str],
+    index_where=None,
+) -> None:
+    """
+    Insert a batch of rows, updating update_columns of the existing row instead where a row with the
+    same index_elements (which must have a unique index) already exists. With no update_columns,
+    existing rows are left as they are.
+
+    All rows must have the same keys, and no two rows may have the same index_elements.
+    :param connection:
+    :param table:
+    :param rows:
+    :param index_elements:
+    :param update_columns:
+    :param index_where: WHERE clause of the unique index, if it's a partial index
+    :return:
+    """
+    if not rows:
+        return
+
+    column_names = list(rows[0].keys())
+    if is_postgres(connection):
+        staging_name = f"{table.name}_staging"
+        column_list = ", ".join(f'"{c}"' for c in column_names)
+        connection.execute(sa.text(f'DROP TABLE IF EXISTS "{staging_name}"'))
+        connection.execute(
+            sa.text(
+                f'CREATE TEMPORARY TABLE "{staging_name}" ON COMMIT DROP AS '
+                f'SELECT {column_list} FROM "{table.name}" WITH NO DATA'
+            )
+        )
+        copy_rows(connection, table, rows, table_name=staging_name)
+        staging = sa.table(staging_name, *[sa.column(c) for c in column_names])
+        stmt = postgresql.insert(table).from_select(column_names, sa.select(staging))
+        connection.execute(
+            on_conflict(stmt, index_elements, update_columns, index_where)
+        )
+    else:
+        stmt = sqlite.insert(table)
+        connection.execute(
+            on_conflict(stmt, index_elements, update_columns, index_where), rows
+        )
@@ -0,0 +1,122 @@
+"""
+Compiled row decoder for bulk imports.
+
+Constructing a SQLModel instance per row validates every field through pydantic and then sets each
+attribute through SQLAlchemy's instrumentation, which dominates import time for wide tables. The
+decoder instead looks up the coercion steps for each column once, from the model's pydantic fields,
+and applies them directly to raw row tuples to produce plain dicts for a Core insert.
+
+The coercers are the same validator functions pydantic would run, so decoded values match what the
+model would hold. Like a table model (which doesn't raise on invalid data), a value which fails
+coercion is stored as None; the decoder also records it in a reject list so it can be reported.
+"""
+
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Type
+
+from pydantic import ValidationError
+from pydantic.fields import SHAPE_SINGLETON, ModelField
+from sqlmodel import SQLModel
+
+
+class RejectedValue(NamedTuple):
+    row: int
+    column: str
+    value: Any
+    error: str
+
+
+def compile_coercer(model: Type[SQLModel], field: ModelField) -> Callable[[Any], Any]:
+    """
+    Build a function which coerces a raw value for field, raising ValueError, TypeError or
+    AssertionError (pydantic's validation errors) if it can't.
+    :param model:
+    :param field:
+    :return:
+    """
+    if field.shape != SHAPE_SINGLETON or field.pre_validators or field.post_validators:
+        # Not a plain scalar field, so go through pydantic's full field validation.
+        def coerce_field(value: Any) -> Any:
+            value, errors = field.validate(value, {}, loc=field.name, cls=model)
+            if errors:
+                raise ValidationError([errors], model)
+            return value
+
+        return coerce_field
+
+    config = model.__config__
+    validators = field.validators
+    type_ = field.type_
+
+    def coerce(value: Any) -> Any:
+        # The common case, e.g. a text cell for a str column, needs no conversion.
+        if type(value) is type_:
+            return value
+        for validator in validators:
+            value = validator(model, value, {}, field, config)
+        return value
+
+    return coerce
+
+
+class RowDecoder:
+    """
+    Decodes raw rows, in the column order given by col_names, into dicts of column values for a Core
+    insert into model's table. Columns not in col_names are filled with the model's defaults, and
+    header columns which aren't table columns of the model are ignored.
+
+    Values which fail coercion are counted in reject_count, and the first max_rejects of them are
+    kept in rejects for reporting.
+    """
+
+    def __init__(
+        self,
+        model: Type[SQLModel],
+        col_names: Sequence[Optional[str]],
+        max_rejects: int = 1000,
+    ):
+        self.model = model
+        self.max_rejects = max_rejects
+        self.rejects: List[RejectedValue] = []
+        self.reject_count = 0
+        table_columns = [
+            c.name
+            for c in model.__table__.columns  # type: ignore
+            if not (c.primary_key and c.autoincrement)
+        ]
+        self.defaults: Dict[str, Any] = {
+            name: (
+                model.__fields__[name].get_default()
+                if name in model.__fields__
+                else None
+            )
+            for name in table_columns
+        }
+
+        # If a column name appears more than once in the header the last one wins, as with a dict.
+        indexes = {name: i for i, name in enumerate(col_names) if name in self.defaults}
+        self.columns = [
+            (i, name, compile_coercer(model, model.__fields__[name]))
+            for name, i in indexes.items()
+            if name in model.__fields__
+        ]
+
+    def decode(self, row: Sequence, row_number: int) -> Dict[str, Any]:
+        """
+        Decode a single row.
+        :param row: raw values, as read from the file
+        :param row_number: row number to record against any rejected values
+        :return: dict of column name => value
+        """
+        output = self.defaults.copy()
+        for i, name, coerce in self.columns:
+            value = row[i]
+            if value is None:
+                output[name] = None
+                continue
+            try:
+                output[name] = coerce(value)
+            except (ValueError, TypeError, AssertionError) as e:
+                self.reject_count += 1
+                if len(self.rejects) < self.max_rejects:
+                    self.rejects.append(RejectedValue(row_number, name, value, str(e)))
+        return output
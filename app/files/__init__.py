@@ -0,0 +1,146 @@
+import hashlib
+import os
+import resource
+import sys
+from tempfile import SpooledTemporaryFile, mkstemp
+from typing import IO, Union
+
+import botocore.exceptions
+from boto3.s3.transfer import TransferConfig
+
+from app import settings
+
+
+class SpooledFile(SpooledTemporaryFile):
+    """
+    SpooledTemporaryFile only implements the full IOBase interface from Python 3.11, and zipfile
+    (and so openpyxl) needs seekable() when reading a workbook.
+    """
+
+    def readable(self) -> bool:
+        return self._file.readable()  # type: ignore
+
+    def seekable(self) -> bool:
+        return self._file.seekable()  # type: ignore
+
+    def writable(self) -> bool:
+        return self._file.writable()  # type: ignore
+
+
+class HashingWriter:
+    """
+    Write-only wrapper around a file which hashes everything written to it. As it can't seek,
+    s3transfer writes the parts of a concurrent download to it in order.
+    """
+
+    def __init__(self, file: IO[bytes], digest):
+        self.file = file
+        self.digest = digest
+
+    def write(self, data: bytes) -> int:
+        self.digest.update(data)
+        return self.file.write(data)
+
+
+def hash_file(file: Union[str, IO[bytes]]) -> str:
+    """
+    sha256 of a file's contents. File objects are read from the start and left at the start.
+    :param file: path or binary file object
+    :return: hex digest
+    """
+    digest = hashlib.sha256()
+    f = (
+        open(file, "rb") if isinstance(file, str) else file
+    )  # pylint: disable=consider-using-with
+    f.seek(0)
+    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+        digest.update(chunk)
+    if isinstance(file, str):
+        f.close()
+    else:
+        f.seek(0)
+    return digest.hexdigest()
+
+
+def get_transfer_config() -> TransferConfig:
+    return TransferConfig(
+        multipart_threshold=settings.S3_MULTIPART_CHUNKSIZE,
+        multipart_chunksize=settings.S3_MULTIPART_CHUNKSIZE,
+        max_concurrency=settings.S3_MAX_CONCURRENCY,
+    )
+
+
+def spool_s3_object(
+    s3_client, bucket_name: str, object_name: str, digest=None
+) -> SpooledFile:
+    """
+    Download an S3 object into a temporary file which is held in memory up to S3_SPOOL_MAX_SIZE
+    bytes and rolls over to disk (in TMP_DIR) after that, so memory use doesn't grow with the file size.
+
+    The object is fetched using ranged multipart GETs of S3_MULTIPART_CHUNKSIZE bytes.
+    :param s3_client:
+    :param bucket_name:
+    :param object_name:
+    :param digest: hashlib object to update with the contents as they're downloaded
+    :return: file object, positioned at the start of the file
+    """
+    f = SpooledFile(  # pylint: disable=consider-using-with
+        max_size=settings.S3_SPOOL_MAX_SIZE, dir=settings.TMP_DIR
+    )
+    s3_client.download_fileobj(
+        Bucket=bucket_name,
+        Key=object_name,
+        Fileobj=HashingWriter(f, digest) if digest else f,
+        Config=get_transfer_config(),
+    )
+    f.seek(0)
+    return f
+
+
+def download_s3_object(
+    s3_client, bucket_name: str, object_name: str, digest=None
+) -> str:
+    """
+    Download an S3 object to a temporary file in TMP_DIR, for when the file needs to be opened by path
+    (e.g. by several processes). The caller is responsible for removing it.
+    :param s3_client:
+    :param bucket_name:
+    :param object_name:
+    :param digest: hashlib object to update with the contents as they're downloaded
+    :return: path of the downloaded file
+    """
+    fd, path = mkstemp(dir=settings.TMP_DIR, suffix=os.path.splitext(object_name)[1])
+    with os.fdopen(fd, "wb") as f:
+        s3_client.download_fileobj(
+            Bucket=bucket_name,
+            Key=object_name,
+            Fileobj=HashingWriter(f, digest) if digest else f,
+            Config=get_transfer_config(),
+        )
+    return path
+
+
+def s3_object_exists(s3_client, bucket_name: str, object_name: str) -> bool:
+    try:
+        s3_client.head_object(Bucket=bucket_name, Key=object_name)
+    except botocore.exceptions.ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+            return False
+        raise
+    return True
+
+
+def get_peak_rss_mb() -> float:
+    """
+    Peak resident set size of the current process, in megabytes.
+    :return:
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and kilobytes on Linux.
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def log_peak_rss(label: str) -> None:
+    print(f"Peak RSS {label}: {get_peak_rss_mb():.1f} MB")
@@ -0,0 +1,214 @@
+"""
+Row-indexed cache of a disclosure file's raw rows, as an Arrow IPC file.
+
+Spreadsheets and CSVs can only be read from the start, so resuming an import part way through
+means re-parsing every earlier row. The first import of a file converts it into an Arrow IPC file
+of fixed-size record batches, which is memory-mapped on later reads and lets any row be reached
+by jumping straight to its batch. The exact row count is known up front as well.
+
+Spreadsheet columns often mix types (e.g. postal codes as numbers and strings), so each column is
+stored as a dense union over the Python types a source can produce. Values come back with exactly
+the type they were read with.
+"""
+
+import json
+import os
+from datetime import date, datetime, time, timedelta
+from itertools import islice
+from typing import Iterable, Iterator, List, Sequence, Union
+
+import botocore.exceptions
+import pyarrow as pa
+
+from app import settings
+from app.files import get_transfer_config
+
+# Bump when the cache layout changes, so old cache files are ignored.
+ROW_CACHE_VERSION = 1
+ROW_CACHE_BATCH_SIZE = 10000
+
+# Python type => Arrow type for each member of the union. None is stored as a null str.
+VALUE_TYPES = (
+    (str, pa.string()),
+    (int, pa.int64()),
+    (float, pa.float64()),
+    (bool, pa.bool_()),
+    (datetime, pa.timestamp("us")),
+    (date, pa.date32()),
+    (time, pa.time64("us")),
+    (timedelta, pa.duration("us")),
+)
+TYPE_CODES = {t: i for i, (t, _) in enumerate(VALUE_TYPES)}
+UNION_FIELD_NAMES = [t.__name__ for t, _ in VALUE_TYPES]
+UNION_TYPE = pa.dense_union(
+    [pa.field(name, a) for name, (_, a) in zip(UNION_FIELD_NAMES, VALUE_TYPES)],
+    type_codes=list(range(len(VALUE_TYPES))),
+)
+
+
+def encode_column(values: Sequence) -> pa.UnionArray:
+    """
+    :param values:
+    :return: dense union array holding values
+    :raises KeyError: for a value of a type which can't be cached
+    """
+    children: List[list] = [[] for _ in VALUE_TYPES]
+    type_codes = []
+    offsets = []
+    for value in values:
+        code = 0 if value is None else TYPE_CODES[type(value)]
+        child = children[code]
+        type_codes.append(code)
+        offsets.append(len(child))
+        child.append(value)
+
+    return pa.UnionArray.from_dense(
+        pa.array(type_codes, pa.int8()),
+        pa.array(offsets, pa.int32()),
+        [pa.array(c, a) for c, (_, a) in zip(children, VALUE_TYPES)],
+        UNION_FIELD_NAMES,
+        list(range(len(VALUE_TYPES))),
+    )
+
+
+def decode_column(array: pa.UnionArray) -> list:
+    children = [array.field(i) for i in range(len(VALUE_TYPES))]
+    # Most columns hold a single type, in which case that child is the whole column.
+    for child in children:
+        if len(child) == len(array):
+            return child.to_pylist()
+
+    values = [c.to_pylist() for c in children]
+    return [
+        values[code][offset]
+        for code, offset in zip(array.type_codes.to_pylist(), array.offsets.to_pylist())
+    ]
+
+
+def write_row_cache(path: str, header: Sequence, rows: Iterable[Sequence]) -> int:
+    """
+    Write rows to a new cache file. The file is written under a temporary name and moved into place
+    once complete, so a partial cache is never read.
+    :param path:
+    :param header: raw header row, stored in the schema metadata
+    :param rows: data rows, each the same length as header
+    :return: number of rows written
+    """
+    schema = pa.schema(
+        [pa.field(f"c{i}", UNION_TYPE) for i in range(len(header))],
+        metadata={"header": json.dumps(list(header), default=str)},
+    )
+    options = pa.ipc.IpcWriteOptions(compression="zstd")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+
+    row_count = 0
+    rows = iter(rows)
+    try:
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, schema, options=options) as writer:
+                while True:
+                    batch = list(islice(rows, ROW_CACHE_BATCH_SIZE))
+                    if not batch:
+                        break
+                    columns = [
+                        # Pad short rows, which CSV files can have.
+                        encode_column([r[i] if i < len(r) else None for r in batch])
+                        for i in range(len(header))
+                    ]
+                    writer.write_batch(pa.record_batch(columns, schema=schema))
+                    row_count += len(batch)
+    except:  # noqa
+        os.remove(tmp_path)
+        raise
+
+    os.replace(tmp_path, path)
+    return row_count
+
+
+class RowCache:
+    """
+    Reader for a cache file written by write_row_cache.
+    """
+
+    def __init__(self, path: str):
+        self.source = pa.memory_map(path)
+        self.reader = pa.ipc.open_file(self.source)
+        self.header = json.loads(self.reader.schema.metadata[b"header"])
+        # All batches but the last are ROW_CACHE_BATCH_SIZE rows.
+        num_batches = self.reader.num_record_batches
+        self.row_count = (
+            (num_batches - 1) * ROW_CACHE_BATCH_SIZE
+            + self.reader.get_batch(num_batches - 1).num_rows
+            if num_batches
+            else 0
+        )
+
+    def iter_rows(self, start_row: int = 0) -> Iterator[tuple]:
+        """
+        :param start_row: Number of data rows to skip
+        :return:
+        """
+        first_batch, offset = divmod(start_row, ROW_CACHE_BATCH_SIZE)
+        for i in range(first_batch, self.reader.num_record_batches):
+            batch = self.reader.get_batch(i)
+            rows: Iterator[tuple] = zip(*(decode_column(c) for c in batch.columns))
+            if offset:
+                rows = islice(rows, offset, None)
+                offset = 0
+            yield from rows
+
+    def close(self) -> None:
+        self.source.close()
+
+
+def get_row_cache_path(content_hash: str) -> str:
+    return os.path.join(
+        settings.IMPORT_ROW_CACHE_DIR, f"{content_hash}.v{ROW_CACHE_VERSION}.arrow"
+    )
+
+
+def fetch_row_cache(s3_client, content_hash: str) -> Union[str, None]:
+    """
+    Find a cache file for content_hash locally, or download it from IMPORT_ROW_CACHE_BUCKET if set.
+    :param s3_client:
+    :param content_hash:
+    :return: local path, or None if there's no cache for this file yet
+    """
+    path = get_row_cache_path(content_hash)
+    if os.path.exists(path):
+        return path
+    if not settings.IMPORT_ROW_CACHE_BUCKET:
+        return None
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        s3_client.download_file(
+            settings.IMPORT_ROW_CACHE_BUCKET,
+            os.path.basename(path),
+            tmp_path,
+            Config=get_transfer_config(),
+        )
+    except botocore.exceptions.ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+            return None
+        raise
+    os.replace(tmp_path, path)
+    return path
+
+
+def store_row_cache(s3_client, path: str) -> None:
+    """
+    Upload a cache file to IMPORT_ROW_CACHE_BUCKET, if set, so it outlives this machine's TMP_DIR.
+    :param s3_client:
+    :param path:
+    :return:
+    """
+    if settings.IMPORT_ROW_CACHE_BUCKET:
+        s3_client.upload_file(
+            path,
+            settings.IMPORT_ROW_CACHE_BUCKET,
+            os.path.basename(path),
+            Config=get_transfer_config(),
+        )
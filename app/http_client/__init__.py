@@ -0,0 +1,127 @@
+"""
+Shared HTTP client for the scraping actions.
+
+All requests go through one requests.Session, so connections (and their TLS sessions) are kept
+alive between requests and, on Lambda, between invocations of a warm container, rather than
+re-established through the NAT gateway for every request.
+
+Connection errors and 429/5xx responses are retried with exponential backoff and full jitter,
+waiting for the Retry-After header instead where the server sends one. Request counts, retries,
+error responses and time spent are recorded per host.
+"""
+
+import random
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from app import settings
+from app.constants import USER_AGENT_STRING
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+metrics_lock = threading.Lock()
+request_metrics: Dict[str, Counter] = defaultdict(Counter)
+
+
+def record_metric(host: str, **counts: float) -> None:
+    with metrics_lock:
+        request_metrics[host].update(counts)
+
+
+class JitteredRetry(Retry):
+    """
+    Retry whose backoff is a random time between zero and the usual exponential backoff, so that
+    clients which failed together don't retry together. Retry-After is capped at HTTP_MAX_BACKOFF,
+    so a long one can't hold a Lambda until it times out.
+    """
+
+    def get_backoff_time(self) -> float:
+        return random.uniform(0, super().get_backoff_time())
+
+    def parse_retry_after(self, retry_after: str) -> float:
+        return min(super().parse_retry_after(retry_after), settings.HTTP_MAX_BACKOFF)
+
+    def increment(self, *args, **kwargs):  # type: ignore
+        pool = kwargs.get("_pool")
+        if pool is not None:
+            # Same form as the response URL's netloc, which the other metrics are recorded under.
+            host = (
+                pool.host
+                if pool.port in (None, 80, 443)
+                else f"{pool.host}:{pool.port}"
+            )
+            record_metric(host, retries=1)
+        return super().increment(*args, **kwargs)
+
+
+def get_retry() -> JitteredRetry:
+    return JitteredRetry(
+        total=settings.HTTP_MAX_RETRIES,
+        backoff_factor=settings.HTTP_BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUSES,
+        # The search API is queried with POST, which is safe to repeat.
+        allowed_methods=frozenset(("HEAD", "GET", "POST")),
+        respect_retry_after_header=True,
+        # Return the last response once retries run out, and leave handling its status to the caller.
+        raise_on_status=False,
+    )
+
+
+def record_response(response: requests.Response, *args, **kwargs) -> None:
+    record_metric(
+        urlparse(response.url).netloc,
+        requests=1,
+        errors=int(response.status_code >= 400),
+        elapsed_ms=response.elapsed.total_seconds() * 1000,
+    )
+
+
+def get_http_session(refresh: bool = False) -> requests.Session:
+    """
+    The shared session, created on first use.
+    :param refresh: Create a new session, e.g. in a forked process
+    :return:
+    """
+    if refresh or not hasattr(get_http_session, "session"):
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=settings.HTTP_POOL_CONNECTIONS,
+            pool_maxsize=settings.HTTP_POOL_MAXSIZE,
+            max_retries=get_retry(),
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers["User-Agent"] = USER_AGENT_STRING
+        session.hooks["response"].append(record_response)
+        get_http_session.session = session  # type: ignore
+    return get_http_session.session  # type: ignore
+
+
+def get_request_metrics(host: Optional[str] = None) -> Dict[str, Counter]:
+    """
+    :param host: Only return metrics for this host
+    :return: host => counts of requests, retries, error responses and elapsed_ms
+    """
+    with metrics_lock:
+        return {
+            h: Counter(c)
+            for h, c in request_metrics.items()
+            if host is None or h == host
+        }
+
+
+def log_request_metrics() -> None:
+    for host, counts in sorted(get_request_metrics().items()):
+        average_ms = (
+            counts["elapsed_ms"] / counts["requests"] if counts["requests"] else 0
+        )
+        print(
+            f"HTTP {host}: {counts['requests']} requests, {counts['retries']} retries, "
+            f"{counts['errors']} errors, {average_ms:.0f} ms average"
+        )
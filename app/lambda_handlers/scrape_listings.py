@@ -1,5 +1,5 @@
 from app.actions import scrape_listings
-from app.settings import ROLLBAR_ENABLED
+from app.settings import ROLLBAR_ENABLED, SCRAPE_MAX_RECORDS
 
 if ROLLBAR_ENABLED:
     from app.settings import rollbar
@@ -9,7 +9,7 @@ def lambda_handler(event, context=None):
     result = None
 
     try:
-        result = scrape_listings.scrape_listings(max_records=10)
+        result = scrape_listings.scrape_listings(max_records=SCRAPE_MAX_RECORDS)
 
         if ROLLBAR_ENABLED:
             return rollbar.wait(lambda: result)
@@ -17,6 +17,7 @@ if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
 # Model / Schema imports
+from app.models.address_normalization_cache import AddressNormalizationCache  # noqa
 from app.models.address_record import AddressRecord  # noqa
 from app.models.dedupe_blocking_map import DedupeBlockingMap  # noqa
 from app.models.dedupe_entity_map import DedupeEntityMap  # noqa
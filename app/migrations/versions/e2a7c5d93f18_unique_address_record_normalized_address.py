@@ -0,0 +1,69 @@
+"""Unique address record normalized_address
+
+Revision ID: e2a7c5d93f18
+Revises: 9d1e5b7f3a62
+Create Date: 2026-10-17 22:04:31.382916
+
+"""
+import sqlalchemy as sa
+import sqlmodel
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'e2a7c5d93f18'
+down_revision = '9d1e5b7f3a62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Keep the first address record for each normalized address, and move the duplicates' links to it.
+    op.execute("""
+        CREATE TEMPORARY TABLE address_record_duplicate ON COMMIT DROP AS
+        SELECT id, keep_id FROM (
+            SELECT id, MIN(id) OVER (PARTITION BY normalized_address) AS keep_id
+            FROM address_record
+            WHERE normalized_address IS NOT NULL
+        ) addresses
+        WHERE id <> keep_id
+    """)
+    op.execute("""
+        INSERT INTO dol_disclosure_job_order_address_record_link (dol_disclosure_job_order_id, address_record_id)
+        SELECT DISTINCT l.dol_disclosure_job_order_id, d.keep_id
+        FROM dol_disclosure_job_order_address_record_link l
+        JOIN address_record_duplicate d ON d.id = l.address_record_id
+        ON CONFLICT DO NOTHING
+    """)
+    op.execute("""
+        DELETE FROM dol_disclosure_job_order_address_record_link
+        WHERE address_record_id IN (SELECT id FROM address_record_duplicate)
+    """)
+    # The kept address may already be linked to the same employer, so merge the links' dates into it.
+    op.execute("""
+        INSERT INTO employer_record_address_link
+            (address_type, employer_record_id, address_record_id, first_seen, last_seen, source)
+        SELECT l.address_type, l.employer_record_id, d.keep_id, MIN(l.first_seen), MAX(l.last_seen), MIN(l.source)
+        FROM employer_record_address_link l
+        JOIN address_record_duplicate d ON d.id = l.address_record_id
+        GROUP BY l.address_type, l.employer_record_id, d.keep_id
+        ON CONFLICT (address_type, employer_record_id, address_record_id) DO UPDATE
+        SET first_seen = LEAST(employer_record_address_link.first_seen, excluded.first_seen),
+            last_seen = GREATEST(employer_record_address_link.last_seen, excluded.last_seen)
+    """)
+    op.execute("""
+        DELETE FROM employer_record_address_link
+        WHERE address_record_id IN (SELECT id FROM address_record_duplicate)
+    """)
+    op.execute("DELETE FROM address_record WHERE id IN (SELECT id FROM address_record_duplicate)")
+
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.drop_index('ix_address_record_normalized_address', table_name='address_record')
+    op.create_index(op.f('ix_address_record_normalized_address'), 'address_record', ['normalized_address'], unique=True)
+    # ### end Alembic commands ###
+
+
+def downgrade() -> None:
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.drop_index(op.f('ix_address_record_normalized_address'), table_name='address_record')
+    op.create_index('ix_address_record_normalized_address', 'address_record', ['normalized_address'], unique=False)
+    # ### end Alembic commands ###
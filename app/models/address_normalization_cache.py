@@ -0,0 +1,107 @@
+from collections import Counter, OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Field, Session, select
+
+from app.db.bulk import is_postgres
+from app.models.base import SQLModelWithSnakeTableName
+
+
+class AddressNormalizationCache(SQLModelWithSnakeTableName, table=True):
+    """
+    pagc normalized version of each raw address string which has been normalized.
+    """
+
+    address: str = Field(primary_key=True)
+    normalized_address: str
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class AddressCache:
+    """
+    Two-tier cache of normalized addresses keyed by the raw address string: an in-process LRU of up
+    to `max_size` addresses, in front of the address_normalization_cache table. Cache rows are
+    written in the session's transaction, so are saved when it's committed.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.entries: "OrderedDict[str, str]" = OrderedDict()
+        self.stats: Counter = Counter()
+
+    def remember(self, address: str, normalized_address: str) -> None:
+        self.entries[address] = normalized_address
+        self.entries.move_to_end(address)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def get(self, session: Session, address: str) -> Optional[str]:
+        return self.get_many(session, [address]).get(address)
+
+    def get_many(self, session: Session, addresses: Iterable[str]) -> Dict[str, str]:
+        """
+        Look up addresses in memory, then any not found there in the table with one query.
+        :param session:
+        :param addresses:
+        :return: address => normalized address, for the addresses which are cached
+        """
+        found: Dict[str, str] = {}
+        missing = []
+        for address in addresses:
+            normalized_address = self.entries.get(address)
+            if normalized_address is None:
+                missing.append(address)
+                continue
+            self.entries.move_to_end(address)
+            self.stats["memory_hits"] += 1
+            found[address] = normalized_address
+
+        if missing:
+            table_hits = 0
+            for cached in session.exec(
+                select(AddressNormalizationCache).where(
+                    AddressNormalizationCache.address.in_(missing)  # type: ignore
+                )
+            ):
+                self.remember(cached.address, cached.normalized_address)
+                found[cached.address] = cached.normalized_address
+                table_hits += 1
+            self.stats["table_hits"] += table_hits
+            self.stats["misses"] += len(missing) - table_hits
+        return found
+
+    def set(self, session: Session, address: str, normalized_address: str) -> None:
+        self.set_many(session, {address: normalized_address})
+
+    def set_many(self, session: Session, normalized_addresses: Dict[str, str]) -> None:
+        if not normalized_addresses:
+            return
+        insert = (
+            postgresql.insert if is_postgres(session.connection()) else sqlite.insert
+        )
+        now = datetime.utcnow()
+        session.execute(
+            insert(AddressNormalizationCache.__table__)  # type: ignore
+            .values(
+                [
+                    {
+                        "address": address,
+                        "normalized_address": normalized_address,
+                        "created_at": now,
+                    }
+                    for address, normalized_address in normalized_addresses.items()
+                ]
+            )
+            .on_conflict_do_nothing(index_elements=["address"])
+        )
+        for address, normalized_address in normalized_addresses.items():
+            self.remember(address, normalized_address)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {k: self.stats[k] for k in ("memory_hits", "table_hits", "misses")}
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.stats.clear()
@@ -1,17 +1,19 @@
 import hashlib
 from datetime import datetime
-from typing import TYPE_CHECKING, List, Optional, Union
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Union
 
 import rollbar
 from sqlalchemy import exc, text
 from sqlmodel import Field, Relationship, Session
 
+from app.address_normalizer import normalize_address_offline
 from app.constants import US_STATE_ABBREVIATIONS, US_STATES_TO_ABBREV
+from app.models.address_normalization_cache import AddressCache
 from app.models.base import SQLModelWithSnakeTableName, clean_string_field
 from app.models.dol_disclosure_job_order_address_record_link import (
     DolDisclosureJobOrderAddressRecordLink,
 )
-from app.settings import DB_ENGINE
+from app.settings import ADDRESS_CACHE_SIZE, ADDRESS_NORMALIZER, DB_ENGINE
 
 # Technique to avoid circular imports, see https://sqlmodel.tiangolo.com/tutorial/code-structure/
 if TYPE_CHECKING:
@@ -19,9 +21,32 @@ if TYPE_CHECKING:
     from app.models.employer_record_address_link import EmployerRecordAddressLink
 
 
-def title_case_or_none(obj: Union[str, None]) -> Union[str, object]:
-    if obj is not None:
-        return str(obj).title()
+# Addresses are normalized with pagc through the DB, so normalized addresses are cached. Without the
+# DB, or if pagc fails, they're normalized offline instead.
+address_cache = AddressCache(ADDRESS_CACHE_SIZE)
+
+
+def pagc_normalize_address(address_str: str, session: Session) -> Union[str, None]:
+    """
+    :param address_str:
+    :param session:
+    :return: pagc normalized address, or None if normalization failed
+    """
+    try:
+        with session.begin_nested():
+            result = session.exec(
+                text(
+                    "select coalesce("
+                    "nullif("
+                    "pprint_addy("
+                    "pagc_normalize_address(cast(:address1 as varchar))), ''), :address2) "
+                    "as address"
+                ).bindparams(address1=address_str, address2=address_str)
+            )
+            return result.first()[0]
+    except exc.DBAPIError as e:
+        rollbar.report_exc_info(e)
+        print(e)
     return None
 
 
@@ -31,24 +56,79 @@ def normalize_address(
     if not address_str:
         return ""
 
-    if session and DB_ENGINE == "postgres":
-        try:
-            with session.begin_nested():
-                result = session.exec(
-                    text(
-                        "select coalesce("
-                        "nullif("
-                        "pprint_addy("
-                        "pagc_normalize_address(cast(:address1 as varchar))), ''), :address2) "
-                        "as address"
-                    ).bindparams(address1=address_str, address2=address_str)
-                )
-                return result.first()[0]
-        except exc.DBAPIError as e:
-            rollbar.report_exc_info(e)
-            print(e)
+    if session and DB_ENGINE == "postgres" and ADDRESS_NORMALIZER == "pagc":
+        normalized = address_cache.get(session, address_str)
+        if normalized is None:
+            normalized = pagc_normalize_address(address_str, session)
+            if normalized is not None:
+                address_cache.set(session, address_str, normalized)
+        if normalized is not None:
+            return normalized
+
+    return normalize_address_offline(address_str)
 
-    return title_case_or_none(address_str)
+
+def pagc_normalize_addresses(
+    address_strs: List[str], session: Session
+) -> Dict[str, str]:
+    """
+    Normalize a batch of addresses with pagc in one statement. If the batch fails, addresses are
+    normalized one at a time instead, so one bad address doesn't fail the rest.
+    :param address_strs:
+    :param session:
+    :return: address => pagc normalized address, for the addresses normalized successfully
+    """
+    try:
+        with session.begin_nested():
+            return dict(
+                session.exec(  # type: ignore
+                    text(
+                        "select a.address, coalesce(nullif(n.address, ''), a.address) "
+                        "from unnest(cast(:addresses as varchar[])) as a(address) "
+                        "cross join lateral ("
+                        "select pprint_addy(pagc_normalize_address(a.address)) as address"
+                        ") n"
+                    ).bindparams(addresses=address_strs)
+                ).all()
+            )
+    except exc.DBAPIError:
+        normalized = {}
+        for address_str in address_strs:
+            normalized_address = pagc_normalize_address(address_str, session)
+            if normalized_address is not None:
+                normalized[address_str] = normalized_address
+        return normalized
+
+
+def normalize_addresses(
+    address_strs: Iterable[Union[str, None]], session: Union[Session, None] = None
+) -> Dict[str, str]:
+    """
+    Batch version of normalize_address, which looks up the whole batch in the cache at once and
+    normalizes the misses together.
+    :param address_strs:
+    :param session:
+    :return: address => normalized address, for each non-empty address
+    """
+    addresses = sorted({address_str for address_str in address_strs if address_str})
+    normalized: Dict[str, str] = {}
+    if (
+        session
+        and DB_ENGINE == "postgres"
+        and ADDRESS_NORMALIZER == "pagc"
+        and addresses
+    ):
+        normalized = address_cache.get_many(session, addresses)
+        missing = [address for address in addresses if address not in normalized]
+        if missing:
+            pagc_normalized = pagc_normalize_addresses(missing, session)
+            address_cache.set_many(session, pagc_normalized)
+            normalized.update(pagc_normalized)
+
+    for address in addresses:
+        if address not in normalized:
+            normalized[address] = normalize_address_offline(address)
+    return normalized
 
 
 class AddressRecord(SQLModelWithSnakeTableName, table=True):
@@ -75,7 +155,7 @@ class AddressRecord(SQLModelWithSnakeTableName, table=True):
     address_1: Optional[str] = Field(index=True)
     address_2: Optional[str] = Field(index=True)
     normalized_address: Optional[str] = Field(
-        index=True
+        index=True, unique=True
     )  # Deduped/normalized version of address 1 + address 2.
     city: Optional[str] = Field(index=True)
     state: Optional[str] = Field(index=True)
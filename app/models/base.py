@@ -1,18 +1,23 @@
 import re
 from datetime import datetime
 from enum import Enum
-from typing import Optional, Union
+from typing import List, Optional, Union
 
 import sqlalchemy as sa
 from sqlalchemy.orm import declared_attr
 from sqlmodel import Field, SQLModel
 
+MULTIPLE_SPACES_RE = re.compile("  +")
+NON_DIGITS_RE = re.compile("[^0-9]")
+NEWLINES_TO_SPACES = str.maketrans("\n", " ")
+
 
 def clean_string_field(value: Union[str, None]) -> Union[str, None]:
     if not value:
         return None
-    value = re.sub("  +", " ", value)
-    value = re.sub("\n", " ", value)
+    if "  " in value:
+        value = MULTIPLE_SPACES_RE.sub(" ", value)
+    value = value.translate(NEWLINES_TO_SPACES)
     value = value.strip().strip('"').strip("'").strip()
 
     if value.lower() == "n/a":
@@ -23,13 +28,41 @@ def clean_string_field(value: Union[str, None]) -> Union[str, None]:
     return value
 
 
+def clean_string_column(values: List[Union[str, None]]) -> List[Union[str, None]]:
+    """
+    Column-at-a-time equivalent of clean_string_field.
+    :param values:
+    :return:
+    """
+    sub = MULTIPLE_SPACES_RE.sub
+    output: List[Union[str, None]] = []
+    append = output.append
+    for value in values:
+        if value:
+            if "  " in value:
+                value = sub(" ", value)
+            value = (
+                value.translate(NEWLINES_TO_SPACES)
+                .strip()
+                .strip('"')
+                .strip("'")
+                .strip()
+            )
+            if not value or value.lower() == "n/a":
+                value = None
+        else:
+            value = None
+        append(value)
+    return output
+
+
 def clean_phone_field(
     value: Union[str, None], country: Union[str, None]
 ) -> Union[str, None]:
     if not value:
         return None
 
-    value = re.sub("[^0-9]", "", value)
+    value = NON_DIGITS_RE.sub("", value)
     if not value:
         return None
 
@@ -38,6 +71,33 @@ def clean_phone_field(
     return value
 
 
+def clean_phone_column(
+    values: List[Union[str, None]], countries: List[Union[str, None]]
+) -> List[Union[str, None]]:
+    """
+    Column-at-a-time equivalent of clean_phone_field.
+    :param values:
+    :param countries: country for each value
+    :return:
+    """
+    sub = NON_DIGITS_RE.sub
+    output: List[Union[str, None]] = []
+    append = output.append
+    for value, country in zip(values, countries):
+        if value:
+            value = sub("", value)
+            if not value:
+                value = None
+            elif len(value) == 10 and (
+                country is None or country == "UNITED STATES OF AMERICA"
+            ):
+                value = f"1{value}"
+        else:
+            value = None
+        append(value)
+    return output
+
+
 class DoLDataSource(str, Enum):
     scraper = "scraper"
     dol_disclosure = "DoL annual or quarterly disclosure data"
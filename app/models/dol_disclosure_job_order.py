@@ -1,6 +1,6 @@
 import re
 from datetime import date, datetime, time
-from typing import TYPE_CHECKING, List, Optional
+from typing import TYPE_CHECKING, Dict, List, Optional
 
 import sqlalchemy as sa
 from pydantic import AnyHttpUrl, condecimal, conint, constr
@@ -11,7 +11,9 @@ from app.models.base import (
     CaseStatus,
     DoLDataItem,
     DoLDataSource,
+    clean_phone_column,
     clean_phone_field,
+    clean_string_column,
     clean_string_field,
 )
 from app.models.dol_disclosure_job_order_address_record_link import (
@@ -23,8 +25,38 @@ from app.models.employer_record import EmployerRecord
 if TYPE_CHECKING:
     from app.models.address_record import AddressRecord
 
+TRADE_NAME_PREFIX_RE = re.compile(r"^(DBA|BDA|dba|dba:|d\/b\/a) ")
+FIELDS_TO_STRIP = (
+    "employer_name",
+    "employer_address_1",
+    "employer_address_2",
+    "employer_city",
+    "employer_state",
+    "employer_country",
+    "employer_postal_code",
+    "trade_name_dba",
+)
+
 
 class DolDisclosureJobOrder(DoLDataItem, table=True):
+    # Quarterly and annual disclosure files overlap, so imports merge rows on these keys.
+    __table_args__ = (
+        sa.Index(
+            "ix_dol_disclosure_job_order_case_number_visa_class",
+            "case_number",
+            "visa_class",
+            unique=True,
+        ),
+        # Rows from files without a visa class are merged on case number alone.
+        sa.Index(
+            "ix_dol_disclosure_job_order_case_number_no_visa_class",
+            "case_number",
+            unique=True,
+            postgresql_where=sa.text("visa_class IS NULL"),
+            sqlite_where=sa.text("visa_class IS NULL"),
+        ),
+    )
+
     # Relationship fields
     employer_record_id: Optional[int] = Field(
         default=None, foreign_key="employer_record.id"
@@ -51,6 +83,8 @@ class DolDisclosureJobOrder(DoLDataItem, table=True):
 
     # Additional generated fields
     visa_class: Optional[str]
+    # Hash of the row's data from the disclosure file, to tell whether a merged row has changed.
+    row_hash: Optional[str]
 
     # Fields from the DoL Spreadsheet
     case_number: Optional[str] = Field(index=True)
@@ -195,22 +229,9 @@ class DolDisclosureJobOrder(DoLDataItem, table=True):
 
     def clean(self) -> "DolDisclosureJobOrder":
         if self.trade_name_dba:
-            self.trade_name_dba = re.sub(
-                r"^(DBA|BDA|dba|dba:|d\/b\/a) ", "", self.trade_name_dba
-            )
+            self.trade_name_dba = TRADE_NAME_PREFIX_RE.sub("", self.trade_name_dba)
 
-        fields_to_strip = (
-            "employer_name",
-            "employer_address_1",
-            "employer_address_2",
-            "employer_city",
-            "employer_state",
-            "employer_country",
-            "employer_postal_code",
-            "trade_name_dba",
-        )
-
-        for c in fields_to_strip:
+        for c in FIELDS_TO_STRIP:
             setattr(self, c, clean_string_field(getattr(self, c)))
 
         if str(self.employer_state).lower() in US_STATES_TO_ABBREV:
@@ -233,3 +254,51 @@ class DolDisclosureJobOrder(DoLDataItem, table=True):
         )
 
         return self
+
+    @staticmethod
+    def clean_columns(columns: Dict[str, List]) -> Dict[str, List]:
+        """
+        Batch equivalent of clean(), for a chunk of rows held as a dict of column name => list
+        of values. Output matches calling clean() on each row. Columns are updated in place.
+        :param columns:
+        :return:
+        """
+        num_rows = max((len(v) for v in columns.values()), default=0)
+        for c in FIELDS_TO_STRIP + ("employer_phone", "phone_to_apply"):
+            if c not in columns:
+                columns[c] = [None] * num_rows
+
+        sub = TRADE_NAME_PREFIX_RE.sub
+        columns["trade_name_dba"] = [
+            sub("", v) if v else v for v in columns["trade_name_dba"]
+        ]
+
+        for c in FIELDS_TO_STRIP:
+            columns[c] = clean_string_column(columns[c])
+
+        states = [
+            (
+                US_STATES_TO_ABBREV[str(v).lower()].upper()
+                if str(v).lower() in US_STATES_TO_ABBREV
+                else v
+            )
+            for v in columns["employer_state"]
+        ]
+        columns["employer_state"] = states
+        columns["employer_country"] = [
+            (
+                "UNITED STATES OF AMERICA"
+                if not country and state and state.lower() in US_STATE_ABBREVIATIONS
+                else country
+            )
+            for country, state in zip(columns["employer_country"], states)
+        ]
+
+        columns["employer_phone"] = clean_phone_column(
+            columns["employer_phone"], columns["employer_country"]
+        )
+        columns["phone_to_apply"] = clean_phone_column(
+            columns["phone_to_apply"], columns["employer_country"]
+        )
+
+        return columns
@@ -10,8 +10,9 @@ from app.models.base import SQLModelWithSnakeTableName
 
 class ImportStatus(str, Enum):
     finished = "Finished"
-    import_running = "Import Running - Locked"  # Currently unused.
+    import_running = "Import Running - Locked"
     needs_importing = "Needs Importing"
+    duplicate = "Duplicate - Skipped"
 
 
 class ImportedDataset(SQLModelWithSnakeTableName, table=True):
@@ -19,6 +20,20 @@ class ImportedDataset(SQLModelWithSnakeTableName, table=True):
     bucket_name: Optional[str]
     object_name: Optional[str]
     import_status: Optional[ImportStatus] = Field(default=ImportStatus.needs_importing)
+    # sha256 of the file contents, set when the file is first read for import.
+    content_hash: Optional[str] = Field(index=True)
+    # For a duplicate, the import with the same contents which was imported instead.
+    duplicate_of_id: Optional[int] = Field(
+        default=None, foreign_key="imported_dataset.id"
+    )
+    # Rows inserted, updated and skipped as unchanged when the file was merged into the job orders.
+    rows_inserted: Optional[int]
+    rows_updated: Optional[int]
+    rows_skipped: Optional[int]
+    # Worker which has claimed the import, and when its claim lapses unless renewed by a heartbeat.
+    lease_owner: Optional[str]
+    lease_expires_at: Optional[datetime]
+    heartbeat_at: Optional[datetime]
     created: Optional[datetime] = Field(
         sa_column=sa.Column(sa.DateTime, default=datetime.utcnow)
     )
@@ -1,5 +1,7 @@
-from typing import TYPE_CHECKING, Dict, Optional
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Dict, Optional
 
+import sqlalchemy as sa
 from pydantic import AnyHttpUrl, constr
 from sqlalchemy import Column
 from sqlalchemy_json import mutable_json_type
@@ -18,11 +20,38 @@ if TYPE_CHECKING:
     from app.models.employer_record import EmployerRecord
 
 
+# Model defaults, for listings inserted without the ORM.
+NEW_LISTING_DEFAULTS: Dict[str, Any] = {
+    "source": DoLDataSource.scraper,
+    "scraped": False,
+    "scrape_attempts": 0,
+    "scrape_dead_letter": False,
+    "employer_country": "UNITED STATES OF AMERICA",
+}
+
+
 class SeasonalJobsJobOrder(DoLDataItem, table=True):
     """
     Job order scraped from SeasonalJobs.dol.gov
     """
 
+    # Back the scrape queue's claim queries, which take the newest unscraped listings first, then
+    # recently seen scraped listings which are due a re-scrape.
+    __table_args__ = (
+        sa.Index(
+            "ix_seasonal_jobs_job_order_unscraped_first_seen",
+            "first_seen",
+            postgresql_where=sa.text("NOT scraped AND NOT scrape_dead_letter"),
+            sqlite_where=sa.text("NOT scraped AND NOT scrape_dead_letter"),
+        ),
+        sa.Index(
+            "ix_seasonal_jobs_job_order_scraped_last_seen",
+            "last_seen",
+            postgresql_where=sa.text("scraped AND NOT scrape_dead_letter"),
+            sqlite_where=sa.text("scraped AND NOT scrape_dead_letter"),
+        ),
+    )
+
     # Relationship fields
     employer_record_id: Optional[int] = Field(
         default=None, foreign_key="employer_record.id"
@@ -38,13 +67,26 @@ class SeasonalJobsJobOrder(DoLDataItem, table=True):
     title: str = Field(index=True)
     link: Optional[AnyHttpUrl]
     description: Optional[str]
-    dol_id: Optional[str]
+    dol_id: Optional[str] = Field(index=True, unique=True)
     pub_date: Optional[str]
     scraped: bool = Field(default=False)
     scraped_data: Optional[Dict] = Field(
         sa_column=Column(mutable_json_type(nested=True))
     )
+    # Hash of scraped_data as returned by the search API (see get_scraped_data_hash), so re-scrapes
+    # can tell whether the listing has changed.
+    scraped_data_hash: Optional[str]
+    last_scraped_at: Optional[datetime]
     pdf: Optional[str]
+    # Worker which has claimed the listing for scraping, and when that claim lapses.
+    scrape_lease_owner: Optional[str]
+    scrape_lease_expires_at: Optional[datetime]
+    # Failed scrape attempts, the last failure, and when the listing may next be scraped. After
+    # SCRAPE_MAX_ATTEMPTS failures the listing is dead lettered, and no longer scraped.
+    scrape_attempts: int = Field(default=0)
+    scrape_error: Optional[str]
+    scrape_next_attempt_at: Optional[datetime]
+    scrape_dead_letter: bool = Field(default=False)
 
     employer_name: Optional[str] = Field(index=True)
     trade_name_dba: Optional[str]
@@ -19,10 +19,121 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 ROLLBAR_KEY = os.getenv("ROLLBAR_KEY", "missing_api_key")
 ENVIRONMENT = os.getenv("ENVIRONMENT", "local")
 ROWS_BEFORE_COMMIT = 100
+BULK_IMPORT_BATCH_SIZE = int(
+    os.getenv("BULK_IMPORT_BATCH_SIZE", "5000")
+)  # Rows per COPY / executemany batch when bulk importing disclosure files.
+IMPORT_WORKERS = int(
+    os.getenv("IMPORT_WORKERS", "1")
+)  # Processes importing a disclosure file in parallel. Keep at 1 on Lambda, which has no /dev/shm.
+IMPORT_PARTITION_SIZE = int(
+    os.getenv("IMPORT_PARTITION_SIZE", "50000")
+)  # Rows per partition of a disclosure file; each partition resumes from its own checkpoint.
+IMPORT_MAX_CONCURRENT = int(
+    os.getenv("IMPORT_MAX_CONCURRENT", "1")
+)  # Queued files claimed and imported at once (in threads) by each process_imports call. Above 1, IMPORT_WORKERS is ignored.
+IMPORT_LEASE_SECONDS = int(
+    os.getenv("IMPORT_LEASE_SECONDS", "300")
+)  # A claimed import whose lease isn't renewed for this long is assumed to have crashed, and is reclaimed.
+IMPORT_HEARTBEAT_SECONDS = int(
+    os.getenv("IMPORT_HEARTBEAT_SECONDS", "60")
+)  # How often a running import renews its lease.
+IMPORT_MAX_REJECTS = int(
+    os.getenv("IMPORT_MAX_REJECTS", "1000")
+)  # Rejected values kept for the import report; further rejects are only counted.
+
+# Shared HTTP client settings, see app/http_client.
+HTTP_MAX_RETRIES = int(
+    os.getenv("HTTP_MAX_RETRIES", "3")
+)  # Retries of a request after a connection error or 429/5xx response.
+HTTP_BACKOFF_FACTOR = float(
+    os.getenv("HTTP_BACKOFF_FACTOR", "0.5")
+)  # Retry n waits a random time up to HTTP_BACKOFF_FACTOR * 2 ** (n - 1) seconds.
+HTTP_MAX_BACKOFF = float(
+    os.getenv("HTTP_MAX_BACKOFF", "60")
+)  # Longest Retry-After, in seconds, which is waited for.
+HTTP_POOL_CONNECTIONS = int(
+    os.getenv("HTTP_POOL_CONNECTIONS", "4")
+)  # Hosts to keep connection pools for.
+HTTP_POOL_MAXSIZE = int(
+    os.getenv("HTTP_POOL_MAXSIZE", "16")
+)  # Connections kept alive per host. Keep at least SCRAPE_CONCURRENCY.
+
+# Listing scraper settings.
+JOBS_API_DATE_FIELD = os.getenv(
+    "JOBS_API_DATE_FIELD", "date_acceptance"
+)  # Search API date field listings are discovered by.
+DISCOVER_LOOKBACK_DAYS = int(
+    os.getenv("DISCOVER_LOOKBACK_DAYS", "30")
+)  # How far back discover_listings pages through the search API by default.
+DISCOVER_WINDOW_DAYS = int(
+    os.getenv("DISCOVER_WINDOW_DAYS", "7")
+)  # Days of listings discover_listings pages through per date window.
+DISCOVER_PAGE_SIZE = int(
+    os.getenv("DISCOVER_PAGE_SIZE", "1000")
+)  # Listings per search API page, at most 1000.
+RSS_UPSERT_BATCH_SIZE = int(
+    os.getenv("RSS_UPSERT_BATCH_SIZE", "1000")
+)  # RSS feed listings looked up and upserted per statement.
+RSS_STREAMING = (
+    os.getenv("RSS_STREAMING", "false").lower() == "true"
+)  # Parse the RSS feed as it's downloaded, writing listings in batches as they arrive.
+SCRAPE_MAX_RECORDS = int(
+    os.getenv("SCRAPE_MAX_RECORDS", "200")
+)  # Listings scraped per invocation of the scrape listings lambda.
+SCRAPE_CONCURRENCY = int(
+    os.getenv("SCRAPE_CONCURRENCY", "8")
+)  # Requests in flight at once when scraping listings.
+SCRAPE_RATE_LIMIT = float(
+    os.getenv("SCRAPE_RATE_LIMIT", "5")
+)  # Requests started per second to each host when scraping listings.
+SCRAPE_SEARCH_BATCH_SIZE = int(
+    os.getenv("SCRAPE_SEARCH_BATCH_SIZE", "50")
+)  # Listings looked up per search API request.
+JOB_ORDER_PDF_CHUNK_SIZE = int(
+    os.getenv("JOB_ORDER_PDF_CHUNK_SIZE", str(64 * 1024))
+)  # Bytes read at a time when streaming a job order PDF to storage.
+SCRAPE_LEASE_SECONDS = int(
+    os.getenv("SCRAPE_LEASE_SECONDS", "900")
+)  # How long listings claimed by a scraper are held before another may claim them. At least the lambda timeout.
+SCRAPE_MAX_ATTEMPTS = int(
+    os.getenv("SCRAPE_MAX_ATTEMPTS", "8")
+)  # Failed scrapes of a listing before it's dead lettered.
+SCRAPE_BACKOFF_SECONDS = int(
+    os.getenv("SCRAPE_BACKOFF_SECONDS", "900")
+)  # A listing is retried this long after its first failed scrape, doubling after each further failure, or after a failed search API request.
+SCRAPE_MAX_BACKOFF_SECONDS = int(
+    os.getenv("SCRAPE_MAX_BACKOFF_SECONDS", str(24 * 60 * 60))
+)  # Longest wait between scrapes of a failing listing.
+SCRAPE_REFRESH_SECONDS = int(
+    os.getenv("SCRAPE_REFRESH_SECONDS", str(3 * 24 * 60 * 60))
+)  # Scraped listings which are still active are re-scraped this long after they were last scraped.
+SCRAPE_ACTIVE_SECONDS = int(
+    os.getenv("SCRAPE_ACTIVE_SECONDS", str(2 * 24 * 60 * 60))
+)  # Listings seen in the RSS feed this recently are active.
+SCRAPE_COMMIT_BATCH_SIZE = int(
+    os.getenv("SCRAPE_COMMIT_BATCH_SIZE", "50")
+)  # Scraped listing updates per commit.
+
+# S3 transfer settings. Downloads are held in memory up to S3_SPOOL_MAX_SIZE bytes, then spooled to TMP_DIR.
+TMP_DIR = os.getenv("TMP_DIR", "/tmp")
+S3_SPOOL_MAX_SIZE = int(os.getenv("S3_SPOOL_MAX_SIZE", str(16 * 1024 * 1024)))
+S3_MULTIPART_CHUNKSIZE = int(os.getenv("S3_MULTIPART_CHUNKSIZE", str(8 * 1024 * 1024)))
+S3_MAX_CONCURRENCY = int(os.getenv("S3_MAX_CONCURRENCY", "4"))
+
+# Row-indexed caches of imported xlsx/csv files, see app/files/row_cache.py. Kept in TMP_DIR and, if a bucket
+# is set, in S3 as well so they're still available to later imports on other machines.
+IMPORT_ROW_CACHE_DIR = os.getenv("IMPORT_ROW_CACHE_DIR", f"{TMP_DIR}/row-cache")
+IMPORT_ROW_CACHE_BUCKET = os.getenv("IMPORT_ROW_CACHE_BUCKET", "")
 
 SQLITE_FILE_NAME = "test_database.db"
 DB_URL = f"sqlite:///{BASE_DIR}/../{SQLITE_FILE_NAME}"
 DB_ENGINE = os.getenv("DB_ENGINE", "sqlite")
+ADDRESS_CACHE_SIZE = int(
+    os.getenv("ADDRESS_CACHE_SIZE", "50000")
+)  # Normalized addresses held in memory, in front of the address_normalization_cache table.
+ADDRESS_NORMALIZER = os.getenv(
+    "ADDRESS_NORMALIZER", "pagc"
+)  # pagc (through the DB, on postgres) or offline (app/address_normalizer, without the DB).
 
 ALEMBIC_CONFIG_PATH = f"{BASE_DIR}/../alembic.ini"
 
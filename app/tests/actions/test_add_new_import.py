@@ -1,11 +1,17 @@
+import datetime
+import os
+import tempfile
 from unittest.mock import MagicMock
 
-from sqlmodel import select
+from sqlmodel import func, select
 
+from app import files
 from app.actions import import_disclosure
 from app.db import get_mock_engine
 from app.lambda_handlers import add_new_import
+from app.models.dol_disclosure_job_order import DolDisclosureJobOrder
 from app.models.imported_dataset import ImportedDataset, ImportStatus
+from app.tests.actions.test_import_disclosure import write_test_workbook
 from app.tests.base_test_case import BaseTestCase
 
 
@@ -83,4 +89,108 @@ class TestAddNewImport(BaseTestCase):
                 ImportedDataset.object_name)).all()))
         self.assertEqual(2, len(self.session.exec(
             select(ImportedDataset).where(ImportedDataset.import_status == ImportStatus.finished).order_by(
-                ImportedDataset.object_name)).all()))
\ No newline at end of file
+                ImportedDataset.object_name)).all()))
+
+    def test_claims_each_import_once(self):
+        import_disclosure.add_new_import(object_name='TEST_KEY', bucket_name='TEST_NAME')
+        import_disclosure.add_new_import(object_name='TEST_KEY_2', bucket_name='TEST_NAME')
+
+        first = import_disclosure.claim_import('worker-1')
+        second = import_disclosure.claim_import('worker-2')
+        self.assertIsNone(import_disclosure.claim_import('worker-3'))
+        self.assertEqual(['TEST_KEY', 'TEST_KEY_2'], [first.object_name, second.object_name])
+        self.assertEqual(ImportStatus.import_running, first.import_status)
+        self.assertEqual('worker-1', first.lease_owner)
+        self.assertGreater(first.lease_expires_at, datetime.datetime.utcnow())
+
+        self.assertTrue(import_disclosure.renew_lease(first.id, 'worker-1'))
+        self.assertFalse(import_disclosure.renew_lease(first.id, 'worker-2'))
+
+    def test_reclaims_expired_lease(self):
+        now = datetime.datetime.utcnow()
+        self.session.add(ImportedDataset(object_name='CRASHED', import_status=ImportStatus.import_running,
+                                         lease_owner='worker-1', lease_expires_at=now - datetime.timedelta(seconds=1)))
+        self.session.add(ImportedDataset(object_name='RUNNING', import_status=ImportStatus.import_running,
+                                         lease_owner='worker-2', lease_expires_at=now + datetime.timedelta(minutes=5)))
+        self.session.commit()
+
+        reclaimed = import_disclosure.claim_import('worker-3')
+        self.assertEqual('CRASHED', reclaimed.object_name)
+        self.assertEqual('worker-3', reclaimed.lease_owner)
+        self.assertIsNone(import_disclosure.claim_import('worker-3'))
+        self.assertIn("Reclaiming import of CRASHED from worker-1", self.capsys.readouterr().out)
+
+        # The crashed worker can't release an import it no longer holds.
+        import_disclosure.release_import(reclaimed, 'worker-1', finished=True)
+        self.session.expire_all()
+        self.assertEqual(ImportStatus.import_running, self.session.get(ImportedDataset, reclaimed.id).import_status)
+
+    def test_process_imports_concurrently(self):
+        mock_import_disclosure = MagicMock(return_value=True)
+        self.monkeypatch.setattr(import_disclosure, 'import_disclosure', mock_import_disclosure)
+        for i in range(3):
+            import_disclosure.add_new_import(object_name=f'TEST_KEY_{i}', bucket_name='TEST_NAME')
+
+        self.assertTrue(import_disclosure.process_imports(max_concurrent=2))
+        self.assertEqual(2, mock_import_disclosure.call_count)
+        datasets = self.session.exec(select(ImportedDataset).order_by(ImportedDataset.id)).all()
+        self.assertEqual([ImportStatus.finished, ImportStatus.finished, ImportStatus.needs_importing],
+                         [d.import_status for d in datasets])
+        self.assertEqual([None, None, None], [d.lease_owner for d in datasets])
+        # Concurrent imports don't fork worker processes of their own.
+        self.assertEqual([1, 1], [c.kwargs["workers"] for c in mock_import_disclosure.call_args_list])
+
+    def test_requeues_failed_import(self):
+        self.monkeypatch.setattr(import_disclosure, 'import_disclosure', MagicMock(side_effect=ValueError('bad file')))
+        import_disclosure.add_new_import(object_name='TEST_KEY', bucket_name='TEST_NAME')
+
+        with self.assertRaises(ValueError):
+            import_disclosure.process_imports()
+        dataset = self.session.exec(select(ImportedDataset)).one()
+        self.assertEqual(ImportStatus.needs_importing, dataset.import_status)
+        self.assertIsNone(dataset.lease_expires_at)
+
+    def test_skips_duplicate_file_contents(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.monkeypatch.setattr(import_disclosure.settings, 'IMPORT_ROW_CACHE_DIR', temp_dir.name)
+        filename = os.path.join(temp_dir.name, "H-2A_Disclosure_Data_FY2021.xlsx")
+        write_test_workbook(filename, 3)
+
+        def download_fileobj(Bucket, Key, Fileobj, Config=None):
+            with open(filename, "rb") as f:
+                Fileobj.write(f.read())
+
+        mock_s3_client = MagicMock()
+        mock_s3_client.download_fileobj.side_effect = download_fileobj
+        self.monkeypatch.setattr(import_disclosure, 's3_client', mock_s3_client)
+
+        import_disclosure.add_new_import(filename=filename)
+        import_disclosure.add_new_import(object_name='H-2A_REUPLOAD.xlsx', bucket_name='TEST_BUCKET')
+        import_disclosure.process_imports()
+        import_disclosure.process_imports()
+
+        self.assertFalse(import_disclosure.process_imports())
+        datasets = self.session.exec(select(ImportedDataset).order_by(ImportedDataset.id)).all()
+        self.assertEqual([ImportStatus.finished, ImportStatus.duplicate], [d.import_status for d in datasets])
+        self.assertEqual(files.hash_file(filename), datasets[0].content_hash)
+        self.assertEqual(datasets[0].content_hash, datasets[1].content_hash)
+        self.assertEqual(datasets[0].id, datasets[1].duplicate_of_id)
+        self.assertEqual((3, 0, 0), (datasets[0].rows_inserted, datasets[0].rows_updated, datasets[0].rows_skipped))
+        self.assertIsNone(datasets[1].rows_inserted)
+        self.assertEqual(3, self.session.exec(select(func.count(DolDisclosureJobOrder.id))).one())
+        self.assertIn("H-2A_REUPLOAD.xlsx has the same contents as", self.capsys.readouterr().out)
+        temp_dir.cleanup()
+
+    def test_earlier_upload_takes_precedence(self):
+        self.session.add(ImportedDataset(object_name='FIRST', content_hash='abc'))
+        self.session.add(ImportedDataset(object_name='SECOND', content_hash='abc'))
+        self.session.add(ImportedDataset(object_name='THIRD', content_hash='abc', import_status=ImportStatus.finished))
+        self.session.commit()
+        first, second, third = self.session.exec(select(ImportedDataset).order_by(ImportedDataset.id)).all()
+
+        self.assertEqual(third.id, import_disclosure.find_duplicate_import(self.session, first).id)
+        self.assertEqual(first.id, import_disclosure.find_duplicate_import(self.session, second).id)
+        third.import_status = ImportStatus.duplicate
+        self.session.add(third)
+        self.session.commit()
+        self.assertIsNone(import_disclosure.find_duplicate_import(self.session, first))
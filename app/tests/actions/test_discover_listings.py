@@ -0,0 +1,67 @@
+from datetime import date
+from unittest.mock import MagicMock
+
+import requests
+from sqlmodel import select
+
+from app.actions import discover_listings
+from app.db import get_mock_engine
+from app.models.dol_disclosure_job_order import DoLDataSource
+from app.models.seasonal_jobs_job_order import SeasonalJobsJobOrder
+from app.tests.base_test_case import BaseTestCase
+
+
+class FakeSearchResponse(object):
+    def __init__(self, results, status_code=200):
+        self.results = results
+        self.status_code = status_code
+
+    def json(self):
+        return {"value": self.results}
+
+
+def get_results(*numbers):
+    return [{"case_number": f"H-{n}", "job_title": f"Test title #{n}"} for n in numbers]
+
+
+class TestDiscoverListings(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.monkeypatch.setattr(discover_listings, 'get_engine', get_mock_engine)
+        self.monkeypatch.setattr(discover_listings.settings, 'DISCOVER_PAGE_SIZE', 2)
+        self.session.add(SeasonalJobsJobOrder(dol_id="H-1", title="RSS title", scraped=True, source=DoLDataSource.scraper))
+        self.session.commit()
+
+    def test_pages_through_date_windows(self):
+        mock_request_post = MagicMock(side_effect=[
+            FakeSearchResponse(get_results(1, 2)),
+            FakeSearchResponse(get_results(3)),
+            FakeSearchResponse(get_results(4, 5)),
+            FakeSearchResponse([]),
+        ])
+        self.monkeypatch.setattr(requests.Session, 'post', mock_request_post)
+
+        self.assertEqual(4, discover_listings.discover_listings(date(2022, 6, 1), date(2022, 6, 5), window_days=2))
+        payloads = [c.kwargs["json"] for c in mock_request_post.call_args_list]
+        self.assertEqual([0, 2, 0, 2], [p["skip"] for p in payloads])
+        self.assertEqual("date_acceptance ge 2022-06-03T00:00:00Z and date_acceptance lt 2022-06-05T00:00:00Z",
+                         payloads[2]["filter"])
+
+        listings = self.session.exec(select(SeasonalJobsJobOrder).order_by(SeasonalJobsJobOrder.dol_id)).all()
+        self.assertEqual(["H-1", "H-2", "H-3", "H-4", "H-5"], [l.dol_id for l in listings])
+        # Known listings are left alone, new ones are queued for scraping.
+        self.assertEqual(("RSS title", True), (listings[0].title, listings[0].scraped))
+        self.assertEqual(("Test title #2", False, 0), (listings[1].title, listings[1].scraped, listings[1].scrape_attempts))
+        # They haven't been in the RSS feed, so they aren't treated as active listings to refresh.
+        self.assertIsNotNone(listings[1].first_seen)
+        self.assertIsNone(listings[1].last_seen)
+
+    def test_continues_after_request_error(self):
+        self.monkeypatch.setattr(requests.Session, 'post', MagicMock(side_effect=[
+            requests.ConnectionError("Connection reset"),
+            FakeSearchResponse(get_results(3)),
+        ]))
+
+        self.assertEqual(1, discover_listings.discover_listings(date(2022, 6, 1), date(2022, 6, 5), window_days=2))
+        self.assertIn("Search API call failed for listings from 2022-06-01 to 2022-06-03", self.capsys.readouterr().err)
+        self.assertEqual(2, len(self.session.exec(select(SeasonalJobsJobOrder)).all()))
@@ -0,0 +1,472 @@
+import csv
+import datetime
+import io
+import os
+import tempfile
+from unittest.mock import MagicMock
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from botocore.exceptions import ClientError
+from openpyxl import Workbook, load_workbook
+from sqlmodel import Session, SQLModel, create_engine, func, select
+
+from app import files
+from app.actions import import_disclosure
+from app.db import get_mock_engine
+from app.db.decoder import RowDecoder
+from app.files import row_cache
+from app.models.dol_disclosure_job_order import DolDisclosureJobOrder
+from app.models.dol_disclosure_job_order_address_record_link import (
+    DolDisclosureJobOrderAddressRecordLink,
+)
+from app.tests.base_test_case import BaseTestCase
+
+
+def write_test_workbook(path: str, num_rows: int) -> None:
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["CASE_NUMBER", "CASE_RECEIVED_DATE", "EMPLOYER_NAME", "EMPLOYER_STATE", "EMPLOYER_PHONE", "UNKNOWN_COLUMN"])
+    for i in range(1, num_rows + 1):
+        ws.append([f"H-300-{i}", datetime.datetime(2021, 1, 1), f" Test employer {i} ", "north carolina", "919-222-2222", "x"])
+    wb.save(path)
+
+
+def write_test_csv(path: str, num_rows: int) -> None:
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["CASE_NUMBER", "CASE_RECEIVED_DATE", "EMPLOYER_NAME", "EMPLOYER_STATE", "EMPLOYER_PHONE", "TRADE_NAME_DBA"])
+        for i in range(1, num_rows + 1):
+            writer.writerow([f"H-300-{i}", "2021-01-01T00:00:00", f"Test employer\n{i}", "north carolina", "919-222-2222", ""])
+
+
+def write_test_parquet(path: str, num_rows: int, row_group_size: int) -> None:
+    table = pa.table({
+        "CASE_NUMBER": [f"H-300-{i}" for i in range(1, num_rows + 1)],
+        "CASE_RECEIVED_DATE": [datetime.datetime(2021, 1, 1)] * num_rows,
+        "EMPLOYER_NAME": [f" Test employer {i} " for i in range(1, num_rows + 1)],
+        "EMPLOYER_STATE": ["north carolina"] * num_rows,
+    })
+    pq.write_table(table, path, row_group_size=row_group_size)
+
+
+class TestImportDisclosure(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.monkeypatch.setattr(import_disclosure, 'get_engine', get_mock_engine)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.temp_dir.name, "H-2A_Disclosure_Data_FY2021.xlsx")
+        self.monkeypatch.setattr(import_disclosure.settings, 'IMPORT_ROW_CACHE_DIR', os.path.join(self.temp_dir.name, "cache"))
+
+    def tearDown(self):
+        super().tearDown()
+        self.temp_dir.cleanup()
+
+    def test_bulk_import(self):
+        write_test_workbook(self.filename, 12)
+        self.monkeypatch.setattr(import_disclosure.settings, 'BULK_IMPORT_BATCH_SIZE', 5)
+
+        self.assertTrue(import_disclosure.import_disclosure(filename=self.filename))
+
+        job_orders = self.session.exec(select(DolDisclosureJobOrder).order_by(DolDisclosureJobOrder.file_row)).all()
+        self.assertEqual(12, len(job_orders))
+        self.assertEqual([i for i in range(1, 13)], [j.file_row for j in job_orders])
+        self.assertEqual("H-300-1", job_orders[0].case_number)
+        self.assertEqual("Test employer 1", job_orders[0].employer_name)
+        self.assertEqual("NC", job_orders[0].employer_state)
+        self.assertEqual("UNITED STATES OF AMERICA", job_orders[0].employer_country)
+        self.assertEqual("19192222222", job_orders[0].employer_phone)
+        self.assertEqual("H-2A", job_orders[0].visa_class)
+        self.assertEqual(datetime.datetime(2021, 1, 1), job_orders[0].first_seen)
+        self.assertEqual(self.filename, job_orders[0].file_name)
+
+    def test_bulk_import_matches_orm_import(self):
+        write_test_workbook(self.filename, 3)
+        import_disclosure.import_disclosure(filename=self.filename, bulk=False)
+        orm_rows = [import_disclosure.job_order_to_row(j) for j in self.session.exec(
+            select(DolDisclosureJobOrder).order_by(DolDisclosureJobOrder.file_row)).all()]
+
+        self.session.exec(DolDisclosureJobOrder.__table__.delete())
+        self.session.commit()
+        import_disclosure.import_disclosure(filename=self.filename, bulk=True)
+        self.session.expire_all()
+        bulk_rows = [import_disclosure.job_order_to_row(j) for j in self.session.exec(
+            select(DolDisclosureJobOrder).order_by(DolDisclosureJobOrder.file_row)).all()]
+
+        self.assertEqual(orm_rows, bulk_rows)
+
+    def test_merges_overlapping_files(self):
+        write_test_workbook(self.filename, 5)
+        import_disclosure.import_disclosure(filename=self.filename)
+        changed = self.session.exec(select(DolDisclosureJobOrder).where(DolDisclosureJobOrder.case_number == "H-300-2")).one()
+        changed.employer_record_id = 1
+        self.session.add(changed)
+        self.session.add(DolDisclosureJobOrderAddressRecordLink(dol_disclosure_job_order_id=changed.id, address_record_id=1))
+        self.session.commit()
+
+        # The annual file repeats the quarter's cases, with one of them amended.
+        annual_filename = os.path.join(self.temp_dir.name, "H-2A_Disclosure_Data_FY2021_Annual.xlsx")
+        write_test_workbook(annual_filename, 8)
+        wb = load_workbook(annual_filename)
+        wb.active["C3"] = "Amended employer"
+        wb.save(annual_filename)
+        import_disclosure.import_disclosure(filename=annual_filename)
+        out = self.capsys.readouterr().out
+        self.assertIn("8 listings imported from file", out)
+        self.assertIn("3 inserted, 1 updated, 4 skipped", out)
+
+        self.session.expire_all()
+        job_orders = self.session.exec(select(DolDisclosureJobOrder).order_by(DolDisclosureJobOrder.case_number)).all()
+        self.assertEqual([f"H-300-{i}" for i in range(1, 9)], [j.case_number for j in job_orders])
+        # Unchanged rows record the file they were last seen in, so the annual file's progress is known.
+        self.assertEqual([annual_filename] * 8, [j.file_name for j in job_orders])
+        self.assertEqual([i for i in range(1, 9)], [j.file_row for j in job_orders])
+        self.assertEqual(changed.id, job_orders[1].id)
+        self.assertEqual("Amended employer", job_orders[1].employer_name)
+        self.assertIsNone(job_orders[1].employer_record_id)
+        self.assertEqual(0, self.session.exec(select(func.count()).select_from(DolDisclosureJobOrderAddressRecordLink)).one())
+
+        import_disclosure.import_disclosure(filename=annual_filename)
+        self.assertIn("has already been imported", self.capsys.readouterr().out)
+
+    def test_merges_overlapping_files_without_bulk(self):
+        write_test_workbook(self.filename, 5)
+        import_disclosure.import_disclosure(filename=self.filename, bulk=False)
+        annual_filename = os.path.join(self.temp_dir.name, "H-2A_Disclosure_Data_FY2021_Annual.xlsx")
+        write_test_workbook(annual_filename, 8)
+
+        import_disclosure.import_disclosure(filename=annual_filename, bulk=False)
+        self.assertIn("3 inserted, 0 updated, 5 skipped", self.capsys.readouterr().out)
+        self.assertEqual(8, self.session.exec(select(func.count(DolDisclosureJobOrder.id))).one())
+
+    def test_merges_files_without_visa_class(self):
+        filenames = []
+        for name, num_rows in (("Disclosure_Data_FY2021_Q1.xlsx", 5), ("Disclosure_Data_FY2021.xlsx", 6)):
+            filename = os.path.join(self.temp_dir.name, name)
+            write_test_workbook(filename, num_rows)
+            wb = load_workbook(filename)
+            wb.active["A6"] = None
+            wb.save(filename)
+            filenames.append(filename)
+
+        import_disclosure.import_disclosure(filename=filenames[0])
+        self.assertIn("5 inserted, 0 updated, 0 skipped", self.capsys.readouterr().out)
+
+        # Rows without a case number can't be merged, so are inserted again.
+        import_disclosure.import_disclosure(filename=filenames[1])
+        self.assertIn("2 inserted, 0 updated, 4 skipped", self.capsys.readouterr().out)
+        job_orders = self.session.exec(select(DolDisclosureJobOrder).order_by(DolDisclosureJobOrder.file_row)).all()
+        self.assertEqual(["H-300-1", "H-300-2", "H-300-3", "H-300-4", None, None, "H-300-6"],
+                         [j.case_number for j in job_orders])
+        self.assertEqual([None] * 7, [j.visa_class for j in job_orders])
+
+    def test_skips_rows_unchanged_across_formats(self):
+        wb = Workbook()
+        wb.active.append(["CASE_NUMBER", "CASE_RECEIVED_DATE", "EMPLOYER_NAME", "MONDAY_HOURS"])
+        wb.active.append(["H-300-1", datetime.datetime(2021, 1, 1), "Test employer 1", 12.5])
+        wb.save(self.filename)
+        csv_filename = os.path.join(self.temp_dir.name, "H-2A_Disclosure_Data_FY2021_Annual.csv")
+        with open(csv_filename, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["CASE_NUMBER", "CASE_RECEIVED_DATE", "EMPLOYER_NAME", "MONDAY_HOURS"])
+            writer.writerow(["H-300-1", "2021-01-01T00:00:00", "Test employer 1", "12.50"])
+
+        import_disclosure.import_disclosure(filename=self.filename)
+        import_disclosure.import_disclosure(filename=csv_filename)
+        self.assertIn("0 inserted, 0 updated, 1 skipped", self.capsys.readouterr().out)
+
+    def test_skips_unchanged_rows_imported_without_hash(self):
+        write_test_workbook(self.filename, 5)
+        import_disclosure.import_disclosure(filename=self.filename)
+        self.session.exec(DolDisclosureJobOrder.__table__.update().values(row_hash=None))
+        self.session.commit()
+
+        annual_filename = os.path.join(self.temp_dir.name, "H-2A_Disclosure_Data_FY2021_Annual.xlsx")
+        write_test_workbook(annual_filename, 5)
+        wb = load_workbook(annual_filename)
+        wb.active["C3"] = "Amended employer"
+        wb.save(annual_filename)
+        import_disclosure.import_disclosure(filename=annual_filename)
+        self.assertIn("0 inserted, 1 updated, 4 skipped", self.capsys.readouterr().out)
+        self.assertNotIn(None, self.session.exec(select(DolDisclosureJobOrder.row_hash)).all())
+
+    def test_decoder_matches_model(self):
+        col_names = import_disclosure.map_col_names([
+            "CASE_NUMBER", "CASE_STATUS", "CASE_RECEIVED_DATE", "DECISION_DATE", "EMERGENCY_FILING", "EMPLOYER_POSTAL_CODE",
+            "WAGE_OFFER", "LIFTING_AMOUNT", "HOURLY_SCHEDULE_BEGIN", "WEBSITE_TO_APPLY", "790A_ADDENDUM_A_ATTACHED"])
+        rows = [
+            ("H-300-1", "Determination Issued - Certification", datetime.datetime(2021, 1, 1), datetime.datetime(2021, 2, 1),
+             "Y", 27701, 12.5, "50", datetime.time(6), "https://example.com", "Y"),
+            (1234, "Determination Issued - Withdrawn", "2021-01-01T10:00:00", "2021-02-01", "no", "27701-1234",
+             "12.50", 50.7, "06:00", "http://example.com/apply", None),
+            ("H-300-3", "Unknown status", datetime.date(2021, 1, 1), "not a date", "maybe", "27701-12345",
+             "12.505", "50 lbs", "6am", "example.com", "N"),
+            (None, None, None, None, None, None, -1, -1, None, None, None),
+        ]
+
+        decoder = RowDecoder(DolDisclosureJobOrder, col_names)
+        for i, row in enumerate(rows, 1):
+            job_order = DolDisclosureJobOrder(**import_disclosure.row_to_dict(col_names, row))
+            self.assertEqual(import_disclosure.job_order_to_row(job_order), decoder.decode(row, i))
+
+        self.assertEqual(
+            [(3, "case_status"), (3, "received_date"), (3, "decision_date"), (3, "emergency_filing"),
+             (3, "employer_postal_code"), (3, "wage_offer"), (3, "lifting_amount"), (3, "hourly_schedule_begin"),
+             (3, "website_to_apply"), (4, "wage_offer"), (4, "lifting_amount")],
+            [(r.row, r.column) for r in decoder.rejects])
+        self.assertEqual(11, decoder.reject_count)
+
+    def test_decoder_limits_rejects_kept(self):
+        decoder = RowDecoder(DolDisclosureJobOrder, ["wage_offer", "lifting_amount"], max_rejects=3)
+        for i in range(1, 4):
+            decoder.decode(("x", "x"), i)
+
+        self.assertEqual(6, decoder.reject_count)
+        self.assertEqual([(1, "wage_offer"), (1, "lifting_amount"), (2, "wage_offer")],
+                         [(r.row, r.column) for r in decoder.rejects])
+
+    def test_bulk_import_reports_rejects(self):
+        wb = Workbook()
+        ws = wb.active
+        ws.append(["CASE_NUMBER", "WAGE_OFFER"])
+        ws.append(["H-300-1", 12.5])
+        ws.append(["H-300-2", "twelve"])
+        wb.save(self.filename)
+        mock_stderr = io.StringIO()
+        self.monkeypatch.setattr(import_disclosure, 'stderr', mock_stderr)
+        mock_report_message = MagicMock()
+        self.monkeypatch.setattr(import_disclosure.rollbar, 'report_message', mock_report_message)
+
+        self.assertTrue(import_disclosure.import_disclosure(filename=self.filename))
+
+        job_orders = self.session.exec(select(DolDisclosureJobOrder).order_by(DolDisclosureJobOrder.file_row)).all()
+        self.assertEqual(2, len(job_orders))
+        self.assertEqual(12.5, job_orders[0].wage_offer)
+        self.assertEqual("H-300-2", job_orders[1].case_number)
+        self.assertIsNone(job_orders[1].wage_offer)
+        self.assertIn("Row 2, wage_offer: 'twelve'", mock_stderr.getvalue())
+        mock_report_message.assert_called_once()
+        self.assertEqual(
+            [{"row": 2, "column": "wage_offer", "value": "twelve", "error": "value is not a valid decimal"}],
+            mock_report_message.call_args.kwargs["extra_data"]["rejects"])
+
+    def test_resumes_partial_import(self):
+        write_test_workbook(self.filename, 10)
+        for i in range(1, 5):
+            self.session.add(DolDisclosureJobOrder(file_name=self.filename, file_row=i, case_number=f"H-300-{i}"))
+        self.session.commit()
+
+        import_disclosure.import_disclosure(filename=self.filename)
+        self.assertIn("continuing partial import with row 5", self.capsys.readouterr().out)
+
+        self.assertEqual(10, self.session.exec(select(func.count(DolDisclosureJobOrder.id))).one())
+        self.assertEqual(10, self.session.exec(select(func.max(DolDisclosureJobOrder.file_row))).one())
+        self.assertEqual(1, self.session.exec(
+            select(func.count(DolDisclosureJobOrder.id)).where(DolDisclosureJobOrder.case_number == "H-300-5")).one())
+
+    def test_resumes_each_partition(self):
+        write_test_workbook(self.filename, 12)
+        self.monkeypatch.setattr(import_disclosure.settings, 'IMPORT_PARTITION_SIZE', 3)
+        for i in [1, 2, 4, 5, 6, 10]:
+            self.session.add(DolDisclosureJobOrder(file_name=self.filename, file_row=i, case_number=f"H-300-{i}"))
+        self.session.commit()
+
+        self.assertEqual([(0, 3), (3, 6), (6, 9), (9, 12)], import_disclosure.get_partitions(12))
+        import_disclosure.import_disclosure(filename=self.filename)
+
+        job_orders = self.session.exec(select(DolDisclosureJobOrder).order_by(DolDisclosureJobOrder.file_row)).all()
+        self.assertEqual([i for i in range(1, 13)], [j.file_row for j in job_orders])
+        self.assertEqual([f"H-300-{i}" for i in range(1, 13)], [j.case_number for j in job_orders])
+
+        import_disclosure.import_disclosure(filename=self.filename)
+        self.assertIn("has already been imported", self.capsys.readouterr().out)
+
+    def test_imports_past_stale_xlsx_dimensions(self):
+        write_test_workbook(self.filename, 10)
+        self.monkeypatch.setattr(import_disclosure.settings, 'IMPORT_PARTITION_SIZE', 3)
+        xlsx_init = import_disclosure.XlsxSource.__init__
+
+        def stale_init(source, file):
+            xlsx_init(source, file)
+            source.row_count = 4
+        self.monkeypatch.setattr(import_disclosure.XlsxSource, '__init__', stale_init)
+
+        import_disclosure.import_disclosure(filename=self.filename, use_row_cache=False)
+        self.assertEqual(10, self.session.exec(select(func.count(DolDisclosureJobOrder.id))).one())
+
+    def test_parallel_import(self):
+        write_test_workbook(self.filename, 20)
+        # Worker processes need a database they can all connect to.
+        engine = create_engine(f"sqlite:///{self.temp_dir.name}/test.db")
+        SQLModel.metadata.create_all(engine)
+        self.monkeypatch.setattr(import_disclosure, 'get_engine', lambda refresh=False: engine)
+        self.monkeypatch.setattr(import_disclosure.settings, 'IMPORT_PARTITION_SIZE', 4)
+        with Session(engine) as session:
+            session.add(DolDisclosureJobOrder(file_name=self.filename, file_row=9, case_number="H-300-9"))
+            session.commit()
+
+        self.assertTrue(import_disclosure.import_disclosure(filename=self.filename, workers=2))
+
+        with Session(engine) as session:
+            job_orders = session.exec(select(DolDisclosureJobOrder).order_by(DolDisclosureJobOrder.file_row)).all()
+        self.assertEqual([i for i in range(1, 21)], [j.file_row for j in job_orders])
+        self.assertEqual("Test employer 20", job_orders[19].employer_name)
+        self.assertIn("19 listings imported from file", self.capsys.readouterr().out)
+
+    def test_split_ranges(self):
+        self.assertEqual([[(0, 3), (3, 6)], [(6, 9)], [(9, 12)]],
+                         import_disclosure.split_ranges([(0, 3), (3, 6), (6, 9), (9, 12)], 3))
+
+    def test_resumes_from_row_cache(self):
+        write_test_workbook(self.filename, 5)
+        self.monkeypatch.setattr(import_disclosure.settings, 'BULK_IMPORT_BATCH_SIZE', 2)
+        merge_job_orders = import_disclosure.merge_job_orders
+
+        def interrupt(session, rows):
+            if rows[0]["file_row"] > 2:
+                raise RuntimeError("Interrupted")
+            return merge_job_orders(session, rows)
+        self.monkeypatch.setattr(import_disclosure, 'merge_job_orders', interrupt)
+        with self.assertRaises(RuntimeError):
+            import_disclosure.import_disclosure(filename=self.filename)
+        self.monkeypatch.setattr(import_disclosure, 'merge_job_orders', merge_job_orders)
+        cache_files = os.listdir(os.path.join(self.temp_dir.name, "cache"))
+        self.assertEqual(1, len(cache_files))
+        self.assertTrue(cache_files[0].endswith(".arrow"))
+
+        def fail(*args, **kwargs):
+            raise AssertionError("Workbook should not be read again")
+
+        self.monkeypatch.setattr(import_disclosure.XlsxSource, 'iter_rows', fail)
+        import_disclosure.import_disclosure(filename=self.filename)
+        self.assertIn("continuing partial import with row 3", self.capsys.readouterr().out)
+
+        job_orders = self.session.exec(select(DolDisclosureJobOrder).order_by(DolDisclosureJobOrder.file_row)).all()
+        self.assertEqual([i for i in range(1, 6)], [j.file_row for j in job_orders])
+        self.assertEqual("Test employer 5", job_orders[4].employer_name)
+        self.assertEqual(datetime.datetime(2021, 1, 1), job_orders[4].received_date)
+        # The cache is removed once the import finishes.
+        self.assertEqual([], os.listdir(os.path.join(self.temp_dir.name, "cache")))
+
+    def test_falls_back_to_importing_directly(self):
+        write_test_workbook(self.filename, 3)
+        self.monkeypatch.setattr(import_disclosure, 'write_row_cache', MagicMock(side_effect=OverflowError("int too big to convert")))
+        xlsx_close = MagicMock(wraps=import_disclosure.XlsxSource.close)
+        self.monkeypatch.setattr(import_disclosure.XlsxSource, 'close', lambda source: xlsx_close(source))
+
+        self.assertTrue(import_disclosure.import_disclosure(filename=self.filename))
+        self.assertEqual(3, len(self.session.exec(select(DolDisclosureJobOrder)).all()))
+        # Both the source opened for caching and the one imported directly are closed.
+        self.assertEqual(2, xlsx_close.call_count)
+
+    def test_stores_row_cache_in_s3(self):
+        write_test_workbook(self.filename, 3)
+        mock_s3_client = MagicMock()
+        mock_s3_client.download_file.side_effect = ClientError({"Error": {"Code": "404"}}, "HeadObject")
+        self.monkeypatch.setattr(import_disclosure, 's3_client', mock_s3_client)
+        self.monkeypatch.setattr(import_disclosure.settings, 'IMPORT_ROW_CACHE_BUCKET', 'CACHE_BUCKET')
+
+        import_disclosure.import_disclosure(filename=self.filename)
+
+        mock_s3_client.upload_file.assert_called_once()
+        path, bucket, key = mock_s3_client.upload_file.call_args.args
+        self.assertEqual('CACHE_BUCKET', bucket)
+        self.assertEqual(os.path.basename(path), key)
+        self.assertEqual(f"{files.hash_file(self.filename)}.v1.arrow", key)
+        self.assertEqual(3, len(self.session.exec(select(DolDisclosureJobOrder)).all()))
+
+    def test_row_cache_round_trip(self):
+        self.monkeypatch.setattr(row_cache, 'ROW_CACHE_BATCH_SIZE', 3)
+        path = os.path.join(self.temp_dir.name, "cache", "test.arrow")
+        header = ["CASE_NUMBER", None, 3]
+        rows = [
+            ("H-300-1", 27701, datetime.datetime(2021, 1, 1, 5)),
+            ("H-300-2", "27701-1234", datetime.date(2021, 1, 1)),
+            (None, 2.5, datetime.time(6)),
+            ("H-300-4", True, datetime.timedelta(hours=8)),
+            ("H-300-5", None),
+        ]
+
+        self.assertEqual(5, row_cache.write_row_cache(path, header, rows))
+        cache = row_cache.RowCache(path)
+        self.assertEqual(5, cache.row_count)
+        self.assertEqual(header, cache.header)
+        cached_rows = list(cache.iter_rows())
+        self.assertEqual(rows[:4] + [("H-300-5", None, None)], cached_rows)
+        self.assertEqual([type(v) for r in rows[:4] for v in r], [type(v) for r in cached_rows[:4] for v in r])
+        self.assertEqual(rows[3:4], list(cache.iter_rows(start_row=3))[:1])
+        self.assertEqual([], list(cache.iter_rows(start_row=5)))
+        cache.close()
+
+    def test_imports_from_s3(self):
+        write_test_workbook(self.filename, 3)
+
+        def download_fileobj(Bucket, Key, Fileobj, Config=None):
+            with open(self.filename, "rb") as f:
+                Fileobj.write(f.read())
+
+        mock_s3_client = MagicMock()
+        mock_s3_client.download_fileobj.side_effect = download_fileobj
+        self.monkeypatch.setattr(import_disclosure, 's3_client', mock_s3_client)
+
+        self.assertTrue(import_disclosure.import_disclosure(bucket_name='TEST_BUCKET', object_name='H-2A_TEST_KEY.xlsx'))
+        mock_s3_client.download_fileobj.assert_called_once()
+        self.assertEqual('TEST_BUCKET', mock_s3_client.download_fileobj.call_args.kwargs['Bucket'])
+        self.assertIn("Peak RSS after importing H-2A_TEST_KEY.xlsx", self.capsys.readouterr().out)
+
+        job_orders = self.session.exec(select(DolDisclosureJobOrder)).all()
+        self.assertEqual(3, len(job_orders))
+        self.assertEqual("H-2A_TEST_KEY.xlsx", job_orders[0].file_name)
+
+    def test_spool_rolls_over_to_disk(self):
+        self.monkeypatch.setattr(files.settings, 'S3_SPOOL_MAX_SIZE', 10)
+        self.monkeypatch.setattr(files.settings, 'TMP_DIR', self.temp_dir.name)
+        mock_s3_client = MagicMock()
+        mock_s3_client.download_fileobj.side_effect = lambda Bucket, Key, Fileobj, Config: Fileobj.write(b"x" * 100)
+
+        spooled_file = files.spool_s3_object(mock_s3_client, 'TEST_BUCKET', 'TEST_KEY')
+        self.assertTrue(spooled_file._rolled)
+        self.assertEqual(b"x" * 100, spooled_file.read())
+        spooled_file.close()
+
+    def test_imports_csv(self):
+        filename = os.path.join(self.temp_dir.name, "H-2A_Disclosure_Data_FY2021.csv")
+        write_test_csv(filename, 7)
+        self.monkeypatch.setattr(import_disclosure.settings, 'BULK_IMPORT_BATCH_SIZE', 3)
+
+        self.assertTrue(import_disclosure.import_disclosure(filename=filename))
+
+        job_orders = self.session.exec(select(DolDisclosureJobOrder).order_by(DolDisclosureJobOrder.file_row)).all()
+        self.assertEqual(7, len(job_orders))
+        self.assertEqual("H-300-7", job_orders[6].case_number)
+        self.assertEqual("Test employer 1", job_orders[0].employer_name)
+        self.assertIsNone(job_orders[0].trade_name_dba)
+        self.assertEqual(datetime.datetime(2021, 1, 1), job_orders[0].received_date)
+
+    def test_imports_parquet_with_resume(self):
+        filename = os.path.join(self.temp_dir.name, "H-2A_Disclosure_Data_FY2021.parquet")
+        write_test_parquet(filename, 10, row_group_size=3)
+        for i in range(1, 5):
+            self.session.add(DolDisclosureJobOrder(file_name=filename, file_row=i, case_number=f"H-300-{i}"))
+        self.session.commit()
+        self.monkeypatch.setattr(import_disclosure.settings, 'BULK_IMPORT_BATCH_SIZE', 2)
+
+        self.assertTrue(import_disclosure.import_disclosure(filename=filename))
+
+        job_orders = self.session.exec(select(DolDisclosureJobOrder).order_by(DolDisclosureJobOrder.file_row)).all()
+        self.assertEqual(10, len(job_orders))
+        self.assertEqual([f"H-300-{i}" for i in range(1, 11)], [j.case_number for j in job_orders])
+        self.assertEqual("Test employer 5", job_orders[4].employer_name)
+
+        import_disclosure.import_disclosure(filename=filename)
+        self.assertIn("has already been imported", self.capsys.readouterr().out)
+
+    def test_rejects_unsupported_format(self):
+        self.assertFalse(import_disclosure.import_disclosure(filename="H-2A_Disclosure_Data_FY2021.pdf"))
+        self.assertEqual(0, len(self.session.exec(select(DolDisclosureJobOrder)).all()))
+
+    def test_chooses_source_from_object_name(self):
+        self.assertEqual(import_disclosure.XlsxSource, import_disclosure.get_source_class("folder/H-2A_FY2021.XLSX"))
+        self.assertEqual(import_disclosure.CsvSource, import_disclosure.get_source_class("H-2A_FY2021.csv"))
+        self.assertEqual(import_disclosure.ParquetSource, import_disclosure.get_source_class("H-2A_FY2021.parquet"))
+        self.assertIsNone(import_disclosure.get_source_class("H-2A_FY2021"))
@@ -1,7 +1,15 @@
-from datetime import datetime
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime, timedelta
 from unittest.mock import MagicMock
 
+import pytest
 import requests
+from botocore.exceptions import ClientError
+from sqlalchemy import update
 from sqlmodel import Session, select
 
 from app.actions import scrape_listings
@@ -23,9 +31,22 @@ class FakeResponse(object):
     def invalid_json(self):
         raise ValueError
 
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def close(self):
+        pass
+
 
 class TestScrapeListings(BaseTestCase):
 
+    @pytest.fixture(autouse=True)
+    def temp_base_dir(self, monkeypatch, tmp_path):
+        # So that saved PDFs go in a temporary directory rather than the source tree.
+        self.base_dir = str(tmp_path)
+        self.monkeypatch.setattr(scrape_listings.settings, 'BASE_DIR', self.base_dir)
+
     def setUp(self):
         super().setUp()
 
@@ -46,7 +67,7 @@ class TestScrapeListings(BaseTestCase):
         mock_request_post = MagicMock()
         mock_request_post.return_value = FakeResponse()
         mock_request_post.return_value.status_code = 403
-        self.monkeypatch.setattr(requests, 'post', mock_request_post)
+        self.monkeypatch.setattr(requests.Session, 'post', mock_request_post)
 
         scrape_listings.scrape_listings()
         mock_request_post.assert_called_once()
@@ -60,7 +81,7 @@ class TestScrapeListings(BaseTestCase):
         mock_request_post.return_value.json = (
             mock_request_post.return_value.invalid_json
         )
-        self.monkeypatch.setattr(requests, 'post', mock_request_post)
+        self.monkeypatch.setattr(requests.Session, 'post', mock_request_post)
 
         scrape_listings.scrape_listings(1)
         mock_request_post.assert_called_once()
@@ -72,8 +93,8 @@ class TestScrapeListings(BaseTestCase):
         mock_request_get = MagicMock()
         mock_request_post.return_value = FakeResponse()
         mock_request_get.return_value = FakeResponse()
-        self.monkeypatch.setattr(requests, 'post', mock_request_post)
-        self.monkeypatch.setattr(requests, 'get', mock_request_get)
+        self.monkeypatch.setattr(requests.Session, 'post', mock_request_post)
+        self.monkeypatch.setattr(requests.Session, 'get', mock_request_get)
 
         scrape_listings.scrape_listings(max_records=1)
         mock_request_post.assert_called_once()
@@ -90,8 +111,8 @@ class TestScrapeListings(BaseTestCase):
         mock_request_get = MagicMock()
         mock_request_post.return_value = FakeResponse()
         mock_request_get.return_value = FakeResponse()
-        self.monkeypatch.setattr(requests, 'post', mock_request_post)
-        self.monkeypatch.setattr(requests, 'get', mock_request_get)
+        self.monkeypatch.setattr(requests.Session, 'post', mock_request_post)
+        self.monkeypatch.setattr(requests.Session, 'get', mock_request_get)
 
         scrape_listings.scrape_listings(max_records=1)
         mock_request_get.assert_called_once()
@@ -100,3 +121,326 @@ class TestScrapeListings(BaseTestCase):
         self.assertEqual(1, len(scraped_listings))
         l = self.session.exec(select(SeasonalJobsJobOrder).where(SeasonalJobsJobOrder.dol_id == 'H-1')).one()
         self.assertIsNotNone(l.pdf)
+
+    def test_looks_up_listings_in_batches(self):
+        for i in range(2, 21):
+            self.session.add(SeasonalJobsJobOrder(dol_id=f"H-{i}", title=f"Test title #{i}", source=DoLDataSource.scraper))
+        self.session.commit()
+        self.monkeypatch.setattr(scrape_listings.settings, 'SCRAPE_SEARCH_BATCH_SIZE', 8)
+        self.monkeypatch.setattr(scrape_listings.settings, 'SCRAPE_COMMIT_BATCH_SIZE', 3)
+        self.monkeypatch.setattr(scrape_listings.settings, 'SCRAPE_RATE_LIMIT', 0)
+        self.monkeypatch.setattr(scrape_listings, 'save_pdf', MagicMock(return_value="saved.pdf"))
+
+        def post(url, json=None, **kwargs):
+            dol_ids = json["filter"].split("'")[1].split(",")
+            response = FakeResponse()
+            # Results come back in any order, and H-7 isn't found.
+            response.json = lambda: {"value": [{"case_number": i} for i in reversed(dol_ids) if i != "H-7"]}
+            return response
+
+        lock = threading.Lock()
+        in_flight = [0, 0]  # current, max
+
+        def get(url, **kwargs):
+            with lock:
+                in_flight[0] += 1
+                in_flight[1] = max(in_flight)
+            time.sleep(0.02)
+            with lock:
+                in_flight[0] -= 1
+            return FakeResponse()
+
+        mock_request_post = MagicMock(side_effect=post)
+        self.monkeypatch.setattr(requests.Session, 'post', mock_request_post)
+        self.monkeypatch.setattr(requests.Session, 'get', MagicMock(side_effect=get))
+
+        self.assertTrue(scrape_listings.scrape_listings(max_records=20, concurrency=4))
+        self.assertEqual(3, mock_request_post.call_count)
+        self.assertEqual(8, mock_request_post.call_args_list[0].kwargs["json"]["top"])
+        self.assertLessEqual(in_flight[1], 4)
+        self.assertGreater(in_flight[1], 1)
+        self.assertIn("No search results for listing IDs H-7", self.capsys.readouterr().err)
+
+        self.session.expire_all()
+        scraped_listings = self.session.exec(select(SeasonalJobsJobOrder).where(SeasonalJobsJobOrder.scraped == True)).all()
+        self.assertEqual(19, len(scraped_listings))
+        self.assertNotIn("H-7", [l.dol_id for l in scraped_listings])
+        self.assertTrue(all(l.scraped_data["case_number"] == l.dol_id for l in scraped_listings))
+        self.assertEqual({"saved.pdf"}, {l.pdf for l in self.session.exec(select(SeasonalJobsJobOrder)).all()})
+
+    def test_stores_identical_pdfs_once(self):
+        self.session.add(SeasonalJobsJobOrder(dol_id="H-2", title="Test title #2", source=DoLDataSource.scraper))
+        self.session.commit()
+        self.monkeypatch.setattr(scrape_listings.settings, 'JOB_ORDER_PDF_CHUNK_SIZE', 4)
+        self.monkeypatch.setattr(requests.Session, 'post', MagicMock(return_value=FakeResponse()))
+        mock_request_get = MagicMock(return_value=FakeResponse())
+        self.monkeypatch.setattr(requests.Session, 'get', mock_request_get)
+
+        scrape_listings.scrape_listings(max_records=2)
+        self.assertTrue(mock_request_get.call_args.kwargs["stream"])
+        saved_pdf = f"{self.base_dir}/job-order-pdfs/{hashlib.sha256(FakeResponse.content).hexdigest()}.pdf"
+        self.assertEqual([saved_pdf, saved_pdf], [l.pdf for l in self.session.exec(select(SeasonalJobsJobOrder)).all()])
+        self.assertEqual([os.path.basename(saved_pdf)], os.listdir(f"{self.base_dir}/job-order-pdfs"))
+        with open(saved_pdf, "rb") as f:
+            self.assertEqual(FakeResponse.content, f.read())
+
+    def test_uploads_identical_pdfs_once(self):
+        self.session.add(SeasonalJobsJobOrder(dol_id="H-2", title="Test title #2", source=DoLDataSource.scraper))
+        self.session.add(SeasonalJobsJobOrder(dol_id="H-3", title="Test title #3", source=DoLDataSource.scraper))
+        self.session.commit()
+        self.monkeypatch.setattr(scrape_listings.settings, 'JOB_ORDER_PDF_DESTINATION', 'pdf-bucket')
+        self.monkeypatch.setattr(scrape_listings, 'stored_pdf_hashes', set())
+        mock_s3_client = MagicMock()
+        mock_s3_client.head_object.side_effect = ClientError({"Error": {"Code": "404"}}, "HeadObject")
+        uploads = []
+        mock_s3_client.upload_fileobj.side_effect = lambda f, bucket, key, Config=None: uploads.append((key, f.read()))
+        self.monkeypatch.setattr(scrape_listings, 's3_client', mock_s3_client)
+        self.monkeypatch.setattr(requests.Session, 'post', MagicMock(return_value=FakeResponse()))
+        self.monkeypatch.setattr(requests.Session, 'get', MagicMock(return_value=FakeResponse()))
+
+        scrape_listings.scrape_listings(max_records=3, concurrency=1)
+        content_hash = hashlib.sha256(FakeResponse.content).hexdigest()
+        self.assertEqual([(f"{content_hash}.pdf", FakeResponse.content)], uploads)
+        mock_s3_client.head_object.assert_called_once_with(Bucket='pdf-bucket', Key=f"{content_hash}.pdf")
+        self.assertEqual({f"https://pdf-bucket.s3.us-east-2.amazonaws.com/{content_hash}.pdf"},
+                         {l.pdf for l in self.session.exec(select(SeasonalJobsJobOrder)).all()})
+
+    def test_concurrent_scrapers_split_listings(self):
+        for i in range(2, 6):
+            self.session.add(SeasonalJobsJobOrder(dol_id=f"H-{i}", title=f"Test title #{i}", source=DoLDataSource.scraper,
+                                                  first_seen=datetime(2022, 1, i)))
+        self.session.add(SeasonalJobsJobOrder(dol_id="H-6", title="Test title #6", source=DoLDataSource.scraper, first_seen=datetime(2022, 1, 10),
+                                              scrape_lease_owner="crashed", scrape_lease_expires_at=datetime.utcnow() - timedelta(seconds=1)))
+        self.session.add(SeasonalJobsJobOrder(dol_id="H-7", title="Test title #7", source=DoLDataSource.scraper,
+                                              scrape_lease_owner="running", scrape_lease_expires_at=datetime.utcnow() + timedelta(minutes=5)))
+        self.session.commit()
+        session = Session(get_mock_engine(), expire_on_commit=False)
+
+        first = scrape_listings.claim_listings(session, 4, "worker-1")
+        second = scrape_listings.claim_listings(session, 4, "worker-2")
+        # Newest first, including the listing whose lease expired, but not the one still claimed.
+        self.assertEqual(["H-1", "H-6", "H-5", "H-4"], [l.dol_id for l in first])
+        self.assertEqual(["H-3", "H-2"], [l.dol_id for l in second])
+        self.assertEqual({"worker-1"}, {l.scrape_lease_owner for l in first})
+
+        scrape_listings.release_listings(session, first, "worker-1")
+        scrape_listings.release_listings(session, second, "worker-1")
+        self.session.expire_all()
+        self.assertEqual(["H-2", "H-3", "H-7"], [l.dol_id for l in self.session.exec(
+            select(SeasonalJobsJobOrder).where(SeasonalJobsJobOrder.scrape_lease_owner != None).order_by(SeasonalJobsJobOrder.dol_id)).all()])
+        session.close()
+
+    def test_releases_listings_after_scraping(self):
+        self.monkeypatch.setattr(requests.Session, 'post', MagicMock(return_value=FakeResponse()))
+        self.monkeypatch.setattr(requests.Session, 'get', MagicMock(return_value=FakeResponse()))
+        self.monkeypatch.setattr(scrape_listings, 'save_pdf', MagicMock(return_value="saved.pdf"))
+
+        scrape_listings.scrape_listings(max_records=1)
+        self.session.expire_all()
+        listing = self.session.exec(select(SeasonalJobsJobOrder)).one()
+        self.assertTrue(listing.scraped)
+        self.assertIsNone(listing.scrape_lease_owner)
+        self.assertIsNone(listing.scrape_lease_expires_at)
+        self.assertFalse(scrape_listings.scrape_listings(max_records=1))
+
+    def test_search_payload(self):
+        self.assertEqual(
+            {"search": "*", "filter": "search.in(case_number, 'H-1,H-2', ',')", "top": 2},
+            scrape_listings.get_search_payload(["H-1", "H-2"]))
+
+    def test_continues_after_request_error(self):
+        self.session.add(SeasonalJobsJobOrder(dol_id="H-2", title="Test title #2", source=DoLDataSource.scraper))
+        self.session.commit()
+        self.monkeypatch.setattr(scrape_listings.settings, 'SCRAPE_SEARCH_BATCH_SIZE', 1)
+        self.monkeypatch.setattr(scrape_listings, 'save_pdf', MagicMock(return_value="saved.pdf"))
+
+        def post(url, json=None, **kwargs):
+            if "H-2" in json["filter"]:
+                raise requests.ConnectionError("Connection reset")
+            return FakeResponse()
+
+        self.monkeypatch.setattr(requests.Session, 'post', MagicMock(side_effect=post))
+        self.monkeypatch.setattr(requests.Session, 'get', MagicMock(return_value=FakeResponse()))
+
+        scrape_listings.scrape_listings(max_records=2)
+        self.assertIn("API call failed for listings, ConnectionError", self.capsys.readouterr().err)
+        self.session.expire_all()
+        self.assertEqual(["H-1"], [l.dol_id for l in self.session.exec(
+            select(SeasonalJobsJobOrder).where(SeasonalJobsJobOrder.scraped == True)).all()])
+
+    def test_backs_off_failed_listings(self):
+        mock_request_post = MagicMock(return_value=FakeResponse())
+        mock_request_post.return_value.json = lambda: {"value": []}
+        self.monkeypatch.setattr(requests.Session, 'post', mock_request_post)
+        self.monkeypatch.setattr(requests.Session, 'get', MagicMock(return_value=FakeResponse()))
+
+        start = datetime.utcnow()
+        scrape_listings.scrape_listings()
+        self.session.expire_all()
+        listing = self.session.exec(select(SeasonalJobsJobOrder)).one()
+        self.assertEqual(1, listing.scrape_attempts)
+        self.assertEqual("No search result", listing.scrape_error)
+        self.assertGreaterEqual(listing.scrape_next_attempt_at, start + timedelta(seconds=900))
+        self.assertFalse(listing.scrape_dead_letter)
+
+        # Not due again yet.
+        scrape_listings.scrape_listings()
+        mock_request_post.assert_called_once()
+
+        listing.scrape_next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+        self.session.add(listing)
+        self.session.commit()
+        scrape_listings.scrape_listings()
+        self.session.expire_all()
+        self.assertEqual(2, listing.scrape_attempts)
+        self.assertGreaterEqual(listing.scrape_next_attempt_at, start + timedelta(seconds=1800))
+
+    def test_defers_listings_after_failed_search(self):
+        self.monkeypatch.setattr(scrape_listings.settings, 'SCRAPE_MAX_ATTEMPTS', 1)
+        mock_request_post = MagicMock(return_value=FakeResponse())
+        mock_request_post.return_value.status_code = 503
+        self.monkeypatch.setattr(requests.Session, 'post', mock_request_post)
+
+        start = datetime.utcnow()
+        scrape_listings.scrape_listings()
+        self.session.expire_all()
+        listing = self.session.exec(select(SeasonalJobsJobOrder)).one()
+        # The search API being down doesn't count against the listing.
+        self.assertEqual(0, listing.scrape_attempts)
+        self.assertFalse(listing.scrape_dead_letter)
+        self.assertIn("status code 503", listing.scrape_error)
+        self.assertGreaterEqual(listing.scrape_next_attempt_at, start + timedelta(seconds=900))
+        self.assertIsNone(listing.scrape_lease_owner)
+
+    def test_backs_off_failed_pdf_requests(self):
+        mock_request_get = MagicMock(return_value=FakeResponse())
+        mock_request_get.return_value.status_code = 404
+        self.monkeypatch.setattr(requests.Session, 'post', MagicMock(return_value=FakeResponse()))
+        self.monkeypatch.setattr(requests.Session, 'get', mock_request_get)
+
+        scrape_listings.scrape_listings()
+        self.session.expire_all()
+        listing = self.session.exec(select(SeasonalJobsJobOrder)).one()
+        self.assertTrue(listing.scraped)
+        self.assertIsNone(listing.pdf)
+        self.assertEqual(1, listing.scrape_attempts)
+        self.assertEqual("PDF request failed, status code 404", listing.scrape_error)
+        self.assertIsNotNone(listing.scrape_next_attempt_at)
+
+    def test_dead_letters_listings_after_max_attempts(self):
+        self.monkeypatch.setattr(scrape_listings.settings, 'SCRAPE_MAX_ATTEMPTS', 2)
+        self.monkeypatch.setattr(requests.Session, 'post', MagicMock(return_value=FakeResponse()))
+        self.monkeypatch.setattr(requests.Session, 'get', MagicMock(return_value=FakeResponse()))
+        self.monkeypatch.setattr(scrape_listings, 'save_pdf', MagicMock(return_value="saved.pdf"))
+        self.session.add(SeasonalJobsJobOrder(dol_id="H-404", title="Test title #404", source=DoLDataSource.scraper,
+                                              scrape_attempts=1, scrape_next_attempt_at=datetime.utcnow() - timedelta(seconds=1)))
+        self.session.commit()
+
+        scrape_listings.scrape_listings(max_records=2)
+        self.assertIn("Dead lettered listing ID H-404 after 2 failed scrapes", self.capsys.readouterr().out)
+        self.session.expire_all()
+        listing = self.session.exec(select(SeasonalJobsJobOrder).where(SeasonalJobsJobOrder.dol_id == "H-404")).one()
+        self.assertTrue(listing.scrape_dead_letter)
+        self.assertEqual("No search result", listing.scrape_error)
+        self.assertIsNone(listing.scrape_next_attempt_at)
+        self.assertEqual([], scrape_listings.claim_listings(self.session, 2, "worker-1"))
+
+    def test_retries_dead_letters(self):
+        for i in range(2, 4):
+            self.session.add(SeasonalJobsJobOrder(dol_id=f"H-{i}", title=f"Test title #{i}", source=DoLDataSource.scraper,
+                                                  scrape_attempts=8, scrape_dead_letter=True, scrape_error="No search result"))
+        self.session.commit()
+
+        self.assertEqual(1, scrape_listings.retry_dead_letters(["H-2"]))
+        self.assertEqual(["H-1", "H-2"], sorted(l.dol_id for l in scrape_listings.claim_listings(self.session, 5, "worker-1")))
+        self.assertEqual(1, scrape_listings.retry_dead_letters())
+        self.session.expire_all()
+        listing = self.session.exec(select(SeasonalJobsJobOrder).where(SeasonalJobsJobOrder.dol_id == "H-3")).one()
+        self.assertFalse(listing.scrape_dead_letter)
+        self.assertEqual(0, listing.scrape_attempts)
+
+    def mark_scraped(self, scraped_data, **kwargs):
+        listing = self.session.exec(select(SeasonalJobsJobOrder)).one()
+        listing.scraped = True
+        listing.scraped_data = scraped_data
+        listing.pdf = "old.pdf"
+        listing.last_scraped_at = datetime.utcnow() - timedelta(days=4)
+        for k, v in kwargs.items():
+            setattr(listing, k, v)
+        self.session.add(listing)
+        self.session.commit()
+        return listing
+
+    def test_skips_unchanged_listings(self):
+        # Same data as FakeResponse, apart from the search score.
+        listing = self.mark_scraped({"a_key": "a value", "case_number": "H-1", "@search.score": 2.0},
+                                    employer_name="Not cleaned", last_seen=datetime.now())
+        last_seen = listing.last_seen
+        mock_request_get = MagicMock(return_value=FakeResponse())
+        self.monkeypatch.setattr(requests.Session, 'post', MagicMock(return_value=FakeResponse()))
+        self.monkeypatch.setattr(requests.Session, 'get', mock_request_get)
+
+        self.assertTrue(scrape_listings.scrape_listings())
+        mock_request_get.assert_not_called()
+        self.session.expire_all()
+        self.assertEqual("Not cleaned", listing.employer_name)
+        self.assertEqual("old.pdf", listing.pdf)
+        self.assertGreater(listing.last_scraped_at, datetime.utcnow() - timedelta(minutes=1))
+        self.assertEqual(last_seen, listing.last_seen)
+        self.assertIsNone(listing.scrape_lease_owner)
+        self.assertFalse(scrape_listings.scrape_listings())
+
+    def test_rescrapes_changed_listings(self):
+        listing = self.mark_scraped({"a_key": "an old value", "case_number": "H-1"}, last_seen=datetime.now())
+        last_seen = listing.last_seen
+        self.monkeypatch.setattr(requests.Session, 'post', MagicMock(return_value=FakeResponse()))
+        self.monkeypatch.setattr(requests.Session, 'get', MagicMock(return_value=FakeResponse()))
+        self.monkeypatch.setattr(scrape_listings, 'save_pdf', MagicMock(return_value="new.pdf"))
+
+        self.assertTrue(scrape_listings.scrape_listings())
+        self.session.expire_all()
+        self.assertEqual("a value", listing.scraped_data["a_key"])
+        self.assertEqual(scrape_listings.get_scraped_data_hash(FakeResponse().json()["value"][0]),
+                         listing.scraped_data_hash)
+        self.assertEqual("new.pdf", listing.pdf)
+        self.assertEqual(last_seen, listing.last_seen)
+
+    def test_keeps_last_seen_from_rss_feed(self):
+        listing = self.mark_scraped({"a_key": "an old value", "case_number": "H-1"}, last_seen=datetime.now() - timedelta(days=1))
+        seen_during_scrape = datetime.now().replace(microsecond=0)
+
+        def post(url, **kwargs):
+            # The RSS feed sees the listing while it's being scraped.
+            self.session.execute(update(SeasonalJobsJobOrder).values(last_seen=seen_during_scrape))
+            self.session.commit()
+            return FakeResponse()
+
+        self.monkeypatch.setattr(requests.Session, 'post', MagicMock(side_effect=post))
+        self.monkeypatch.setattr(requests.Session, 'get', MagicMock(return_value=FakeResponse()))
+        self.monkeypatch.setattr(scrape_listings, 'save_pdf', MagicMock(return_value="new.pdf"))
+
+        self.assertTrue(scrape_listings.scrape_listings())
+        self.session.expire_all()
+        self.assertEqual("a value", listing.scraped_data["a_key"])
+        self.assertEqual(seen_during_scrape, listing.last_seen)
+
+    def test_only_rescrapes_active_listings(self):
+        self.mark_scraped({"a_key": "an old value", "case_number": "H-1"}, last_seen=datetime.now() - timedelta(days=3))
+        self.session.add(SeasonalJobsJobOrder(dol_id="H-2", title="Test title #2", source=DoLDataSource.scraper, scraped=True,
+                                              last_seen=datetime.now(), last_scraped_at=datetime.utcnow() - timedelta(hours=1)))
+        self.session.add(SeasonalJobsJobOrder(dol_id="H-3", title="Test title #3", source=DoLDataSource.scraper, scraped=True,
+                                              last_seen=datetime.now(), first_seen=datetime(2022, 1, 1)))
+        self.session.add(SeasonalJobsJobOrder(dol_id="H-4", title="Test title #4", source=DoLDataSource.scraper))
+        self.session.commit()
+
+        # Unscraped listings first, then active listings which haven't been scraped recently.
+        self.assertEqual(["H-4", "H-3"], [l.dol_id for l in scrape_listings.claim_listings(self.session, 5, "worker-1")])
+
+    def test_rate_limiter_spaces_requests(self):
+        async def wait_all():
+            rate_limiter = scrape_listings.RateLimiter(50)
+            start = time.perf_counter()
+            await asyncio.gather(*(rate_limiter.wait() for _ in range(5)))
+            return time.perf_counter() - start
+
+        self.assertGreaterEqual(asyncio.run(wait_all()), 0.075)
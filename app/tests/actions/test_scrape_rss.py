@@ -1,22 +1,58 @@
+import gzip
+import io
 import time
 from typing import Union
 from unittest import TestCase
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 import pytest
+import requests
 from sqlmodel import Session, select
+from urllib3 import HTTPResponse
 
 from app.actions import scrape_rss
 from app.db import drop_all_models, get_mock_engine
+from app.models.base import DoLDataSource
 from app.models.seasonal_jobs_job_order import SeasonalJobsJobOrder
 from app.models.static_value import StaticValue
 from app.tests.base_test_case import BaseTestCase
 
 
+class FakeFeedResponse(object):
+    def __init__(self, status_code=200, headers=None, content=b"<rss></rss>", gzipped=False):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = content
+        self.raw = HTTPResponse(
+            body=io.BytesIO(gzip.compress(content) if gzipped else content),
+            headers={"Content-Encoding": "gzip"} if gzipped else {},
+            preload_content=False,
+        )
+
+    def close(self):
+        pass
+
+
+def get_feed_xml(*numbers, title="Test title"):
+    items = "".join(
+        f"""<item>
+            <title>{title} #{n}</title>
+            <link>http://seasonaljobs.dol.gov/jobs/H-{n}</link>
+            <description>Test description</description>
+            <pubDate>Fri, 11 Jun 2022 23:00:34 GMT</pubDate>
+        </item>"""
+        for n in numbers
+    )
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+        <rss version="2.0"><channel><title>Jobs</title>{items}</channel></rss>""".encode()
+
+
 class TestScrapeRSS(BaseTestCase):
     def setUp(self):
         super().setUp()
         self.monkeypatch.setattr(scrape_rss, 'get_engine', get_mock_engine)
+        self.mock_request_get = MagicMock(return_value=FakeFeedResponse())
+        self.monkeypatch.setattr(requests.Session, 'get', self.mock_request_get)
 
     def test_fails_on_bozo_error(self):
         with patch("feedparser.parse") as mock_parse:
@@ -30,11 +66,10 @@ class TestScrapeRSS(BaseTestCase):
                 )
 
     def test_fails_on_invalid_status_code(self):
+        self.mock_request_get.return_value = FakeFeedResponse(status_code=403)
         with patch("feedparser.parse") as mock_parse:
-            mock_parse.return_value = {
-                "status": 403,
-            }
             scrape_rss.scrape_rss()
+            mock_parse.assert_not_called()
             self.assertIn("403", self.capsys.readouterr().err)
             self.assertEqual(0,
                 len(self.session.exec(select(SeasonalJobsJobOrder)).all()),
@@ -77,14 +112,108 @@ class TestScrapeRSS(BaseTestCase):
                 len(self.session.exec(select(SeasonalJobsJobOrder)).all()),
                 )
 
+    def get_feed(self, *numbers, title="Test title"):
+        return {
+            "status": 200,
+            "version": "test",
+            "entries": [
+                {
+                    "link": f"http://seasonaljobs.dol.gov/jobs/H-{n}",
+                    "title": f"{title} #{n}",
+                    "description": "Test description",
+                    "published_parsed": time.localtime(),
+                }
+                for n in numbers
+            ],
+        }
+
+    def test_updates_existing_entries(self):
+        self.session.add(SeasonalJobsJobOrder(dol_id="H-1", title="Old title", scraped=True, scraped_data={"a_key": "a value"},
+                                              source=DoLDataSource.scraper))
+        self.session.commit()
+        self.monkeypatch.setattr(scrape_rss, 'RSS_UPSERT_BATCH_SIZE', 2)
+
+        with patch("feedparser.parse") as mock_parse:
+            # H-1 is in the feed twice, the later entry wins.
+            mock_parse.return_value = self.get_feed(1, 2, 1, 3, title="New title")
+            mock_parse.return_value["entries"][2]["title"] = "Newest title"
+            self.assertTrue(scrape_rss.scrape_rss())
+
+        output = self.capsys.readouterr().out
+        self.assertIn("Updated entry with title Newest title and id H-1", output)
+        self.assertIn("Created entry with title New title #3 and id H-3", output)
+        self.session.expire_all()
+        listings = self.session.exec(select(SeasonalJobsJobOrder).order_by(SeasonalJobsJobOrder.dol_id)).all()
+        self.assertEqual(["H-1", "H-2", "H-3"], [l.dol_id for l in listings])
+        self.assertEqual("Newest title", listings[0].title)
+        self.assertTrue(listings[0].scraped)
+        self.assertEqual({"a_key": "a value"}, listings[0].scraped_data)
+        self.assertEqual([False, 0, False, DoLDataSource.scraper],
+                         [listings[1].scraped, listings[1].scrape_attempts, listings[1].scrape_dead_letter, listings[1].source])
+
+    def test_skips_updating_existing_entries(self):
+        self.session.add(SeasonalJobsJobOrder(dol_id="H-1", title="Old title", source=DoLDataSource.scraper))
+        self.session.commit()
+
+        with patch("feedparser.parse") as mock_parse:
+            mock_parse.return_value = self.get_feed(1, 2)
+            scrape_rss.scrape_rss(skip_update=True)
+
+        self.assertIn("skipped updating entry with title Test title #1 and id H-1", self.capsys.readouterr().out)
+        self.session.expire_all()
+        self.assertEqual(["Old title", "Test title #2"], [l.title for l in self.session.exec(
+            select(SeasonalJobsJobOrder).order_by(SeasonalJobsJobOrder.dol_id)).all()])
+
+    def test_streams_gzipped_feed(self):
+        self.monkeypatch.setattr(scrape_rss, 'RSS_UPSERT_BATCH_SIZE', 2)
+        self.mock_request_get.return_value = FakeFeedResponse(
+            content=get_feed_xml(1, 2, 3, 4, 5), gzipped=True, headers={"ETag": "6c132-941-ad7e3080"})
+
+        with patch("feedparser.parse") as mock_parse:
+            self.assertTrue(scrape_rss.scrape_rss(streaming=True))
+            mock_parse.assert_not_called()
+        self.assertTrue(self.mock_request_get.call_args.kwargs["stream"])
+        self.assertEqual("gzip", self.mock_request_get.call_args.kwargs["headers"]["Accept-Encoding"])
+        self.assertIn("Created entry with title Test title #5 and id H-5", self.capsys.readouterr().out)
+        listings = self.session.exec(select(SeasonalJobsJobOrder).order_by(SeasonalJobsJobOrder.dol_id)).all()
+        self.assertEqual(["H-1", "H-2", "H-3", "H-4", "H-5"], [l.dol_id for l in listings])
+        self.assertEqual("2022-06-11", listings[0].pub_date)
+        self.assertEqual("http://seasonaljobs.dol.gov/jobs/H-1", listings[0].link)
+        etag = self.session.exec(select(StaticValue).where(StaticValue.key == 'jobs_rss__etag')).one()
+        self.assertEqual("6c132-941-ad7e3080", etag.value)
+
+    def test_streaming_stops_at_known_entries(self):
+        self.monkeypatch.setattr(scrape_rss, 'RSS_UPSERT_BATCH_SIZE', 2)
+        self.mock_request_get.return_value = FakeFeedResponse(content=get_feed_xml(3, 4))
+        scrape_rss.scrape_rss(streaming=True)
+
+        # H-1 and H-2 are new, H-3 and H-4 are known and unchanged, so H-5 isn't read.
+        self.mock_request_get.return_value = FakeFeedResponse(content=get_feed_xml(1, 2, 3, 4, 5))
+        self.assertTrue(scrape_rss.scrape_rss(streaming=True, stop_at_known=True))
+        self.assertIn("already known and unchanged", self.capsys.readouterr().out)
+        self.assertEqual(["H-1", "H-2", "H-3", "H-4"], [l.dol_id for l in self.session.exec(
+            select(SeasonalJobsJobOrder).order_by(SeasonalJobsJobOrder.dol_id)).all()])
+
+    def test_streaming_fails_on_invalid_feed(self):
+        self.mock_request_get.return_value = FakeFeedResponse(content=get_feed_xml(1, 2)[:-20])
+        self.assertFalse(scrape_rss.scrape_rss(streaming=True))
+        self.assertIn("Error pulling RSS Feed ParseError", self.capsys.readouterr().err)
+        self.assertEqual(0, len(self.session.exec(select(StaticValue)).all()))
+
+        self.mock_request_get.return_value = FakeFeedResponse(content=b"<html></html>")
+        self.assertFalse(scrape_rss.scrape_rss(streaming=True))
+        self.assertIn("no new entries", self.capsys.readouterr().out)
+
     def test_saves_modified_date_and_etag(self):
+        self.mock_request_get.return_value = FakeFeedResponse(headers={
+            "ETag": "6c132-941-ad7e3080",
+            "Last-Modified": "Fri, 11 Jun 2012 23:00:34 GMT",
+        })
         with patch("feedparser.parse") as mock_parse:
             mock_parse.return_value = {
                 "status": 200,
                 "version": "test",
                 "entries": [],
-                "etag": "6c132-941-ad7e3080",
-                "modified": "Fri, 11 Jun 2012 23:00:34 GMT",
             }
             scrape_rss.scrape_rss()
             self.assertEqual(0,
@@ -94,3 +223,16 @@ class TestScrapeRSS(BaseTestCase):
             modified = self.session.exec(select(StaticValue).where(StaticValue.key == 'jobs_rss__modified')).one()
             self.assertEqual(etag.value, "6c132-941-ad7e3080")
             self.assertEqual(modified.value, "Fri, 11 Jun 2012 23:00:34 GMT")
+
+    def test_sends_saved_etag_and_modified_date(self):
+        self.session.add(StaticValue(key='jobs_rss__etag', value="6c132-941-ad7e3080"))
+        self.session.add(StaticValue(key='jobs_rss__modified', value="Fri, 11 Jun 2012 23:00:34 GMT"))
+        self.session.commit()
+        self.mock_request_get.return_value = FakeFeedResponse(status_code=304)
+
+        with patch("feedparser.parse") as mock_parse:
+            self.assertFalse(scrape_rss.scrape_rss())
+            mock_parse.assert_not_called()
+        self.assertEqual({"If-None-Match": "6c132-941-ad7e3080", "If-Modified-Since": "Fri, 11 Jun 2012 23:00:34 GMT"},
+                         self.mock_request_get.call_args.kwargs["headers"])
+        self.assertIn("no new entries", self.capsys.readouterr().out)
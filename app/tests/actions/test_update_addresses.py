@@ -8,7 +8,10 @@ from app.models.address_record import AddressRecord
 from app.models.base import DoLDataSource
 from app.models.dol_disclosure_job_order import DolDisclosureJobOrder
 from app.models.employer_record import EmployerRecord
-from app.models.employer_record_address_link import AddressType
+from app.models.employer_record_address_link import (
+    AddressType,
+    EmployerRecordAddressLink,
+)
 from app.tests.base_test_case import BaseTestCase
 
 
@@ -122,3 +125,40 @@ class TestUpdateAddresses(BaseTestCase):
         self.assertEqual(3, len(all_addresses))
         self.session.refresh(employer_2)
         self.assertEqual(datetime.datetime(2007, 1, 1), employer_2.address_record_links[0].last_seen)
+
+    def test_saves_each_normalized_address_once(self):
+        existing = AddressRecord(address_1="1 Main St", normalized_address="1 MAIN ST")
+        self.session.add(existing)
+        self.session.commit()
+
+        address_ids = update_addresses.save_addresses(self.session, [
+            AddressRecord(address_1="1 Main Street", normalized_address="1 MAIN ST"),
+            AddressRecord(address_1="2 Oak Ave", normalized_address="2 OAK AVE"),
+            AddressRecord(address_1="2 Oak Avenue", normalized_address="2 OAK AVE"),
+        ])
+        self.session.commit()
+
+        addresses = self.session.exec(select(AddressRecord).order_by(AddressRecord.id)).all()
+        self.assertEqual(["1 Main St", "2 Oak Ave"], [a.address_1 for a in addresses])
+        self.assertEqual({"1 MAIN ST": existing.id, "2 OAK AVE": addresses[1].id}, address_ids)
+
+    def test_widens_employer_address_link_dates(self):
+        def link(first_seen, last_seen, address_type=AddressType.office):
+            return {"employer_record_id": 1, "address_record_id": 1, "address_type": address_type,
+                    "first_seen": first_seen, "last_seen": last_seen, "source": DoLDataSource.dol_disclosure}
+
+        update_addresses.link_addresses_to_employers(self.session, [
+            link(None, datetime.datetime(2002, 1, 1)),
+            link(datetime.datetime(2001, 1, 1), None),
+            link(datetime.datetime(2003, 1, 1), datetime.datetime(2003, 1, 1), AddressType.jobsite),
+        ])
+        update_addresses.link_addresses_to_employers(self.session, [
+            link(datetime.datetime(1999, 1, 1), datetime.datetime(2000, 1, 1)),
+            link(None, None, AddressType.jobsite),
+        ])
+        self.session.commit()
+
+        links = self.session.exec(select(EmployerRecordAddressLink).order_by(EmployerRecordAddressLink.address_type)).all()
+        self.assertEqual([(AddressType.jobsite, datetime.datetime(2003, 1, 1), datetime.datetime(2003, 1, 1)),
+                          (AddressType.office, datetime.datetime(1999, 1, 1), datetime.datetime(2002, 1, 1))],
+                         [(l.address_type, l.first_seen, l.last_seen) for l in links])
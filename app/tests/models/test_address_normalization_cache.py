@@ -0,0 +1,73 @@
+from unittest.mock import MagicMock
+
+from sqlmodel import select
+
+from app.models import address_record
+from app.models.address_normalization_cache import (
+    AddressCache,
+    AddressNormalizationCache,
+)
+from app.models.address_record import normalize_address, normalize_addresses
+from app.tests.base_test_case import BaseTestCase
+
+
+class TestAddressNormalizationCache(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.pagc_normalize_address = MagicMock(side_effect=lambda address, session: address.upper())
+        self.monkeypatch.setattr(address_record, 'pagc_normalize_address', self.pagc_normalize_address)
+        self.monkeypatch.setattr(address_record, 'DB_ENGINE', 'postgres')
+        self.monkeypatch.setattr(address_record, 'address_cache', AddressCache(2))
+
+    def test_caches_normalized_addresses(self):
+        self.assertEqual("1 MAIN ST", normalize_address("1 Main St", self.session))
+        self.assertEqual("1 MAIN ST", normalize_address("1 Main St", self.session))
+        self.session.commit()
+        self.pagc_normalize_address.assert_called_once()
+        self.assertEqual({"memory_hits": 1, "table_hits": 0, "misses": 1}, address_record.address_cache.get_stats())
+
+        # A new process finds it in the table.
+        self.monkeypatch.setattr(address_record, 'address_cache', AddressCache(2))
+        self.assertEqual("1 MAIN ST", normalize_address("1 Main St", self.session))
+        self.pagc_normalize_address.assert_called_once()
+        self.assertEqual({"memory_hits": 0, "table_hits": 1, "misses": 0}, address_record.address_cache.get_stats())
+        self.assertEqual(["1 Main St"], [c.address for c in self.session.exec(select(AddressNormalizationCache)).all()])
+
+    def test_doesnt_cache_failures(self):
+        self.pagc_normalize_address.side_effect = None
+        self.pagc_normalize_address.return_value = None
+        self.assertEqual("1 MAIN ST", normalize_address("1 Main Street", self.session))
+        self.assertEqual("1 MAIN ST", normalize_address("1 Main Street", self.session))
+        self.assertEqual(2, self.pagc_normalize_address.call_count)
+        self.assertEqual([], self.session.exec(select(AddressNormalizationCache)).all())
+
+    def test_normalizes_batches_of_addresses(self):
+        pagc_normalize_addresses = MagicMock(side_effect=lambda addresses, session: {a: a.upper() for a in addresses})
+        self.monkeypatch.setattr(address_record, 'pagc_normalize_addresses', pagc_normalize_addresses)
+        self.assertEqual("1 MAIN ST", normalize_address("1 Main St", self.session))
+
+        self.assertEqual({"1 Main St": "1 MAIN ST", "2 Oak Ave": "2 OAK AVE", "3 Elm Rd": "3 ELM RD"},
+                         normalize_addresses(["1 Main St", "2 Oak Ave", None, "", "3 Elm Rd", "2 Oak Ave"], self.session))
+        # Only the addresses which weren't cached, in one batch.
+        pagc_normalize_addresses.assert_called_once_with(["2 Oak Ave", "3 Elm Rd"], self.session)
+        self.assertEqual(3, len(self.session.exec(select(AddressNormalizationCache)).all()))
+
+    def test_batch_falls_back_to_offline_normalizer(self):
+        self.monkeypatch.setattr(address_record, 'pagc_normalize_addresses', MagicMock(return_value={"1 MAIN ST": "1 MAIN ST"}))
+        self.assertEqual({"1 MAIN ST": "1 MAIN ST", "2 OAK AVENUE": "2 OAK AVE"},
+                         normalize_addresses(["1 MAIN ST", "2 OAK AVENUE"], self.session))
+
+    def test_offline_normalizer_skips_db(self):
+        self.monkeypatch.setattr(address_record, 'ADDRESS_NORMALIZER', 'offline')
+        self.assertEqual("1 MAIN ST", normalize_address("1 Main Street", self.session))
+        self.assertEqual({"2 Oak Avenue": "2 OAK AVE"}, normalize_addresses(["2 Oak Avenue"], self.session))
+        self.pagc_normalize_address.assert_not_called()
+        self.assertEqual([], self.session.exec(select(AddressNormalizationCache)).all())
+
+    def test_evicts_least_recently_used(self):
+        cache = AddressCache(2)
+        cache.remember("a", "A")
+        cache.remember("b", "B")
+        cache.get(self.session, "a")
+        cache.remember("c", "C")
+        self.assertEqual(["a", "c"], list(cache.entries.keys()))
@@ -1,3 +1,5 @@
+import random
+
 from app.models.dol_disclosure_job_order import DolDisclosureJobOrder
 from app.tests.base_test_case import BaseTestCase
 
@@ -37,3 +39,41 @@ class TestDolDisclosureJobOrder(BaseTestCase):
         )
         test_listing.clean()
         self.assertEqual(test_listing.employer_phone, '19192222222')
+
+    def test_clean_columns_matches_clean(self):
+        rng = random.Random(1234)
+        string_values = [
+            None, "", " ", "N/A", " n/a ", '"Quoted name"', "'single'", "  multiple   spaces ",
+            "line\nbreak", "line \n  break", "DBA Test business", "dba: test", "d/b/a test", "BDA  test ",
+            "Test business", "california", "North Carolina", "nc", "NC", "TX", "ontario", "UNITED STATES OF AMERICA",
+            "CANADA", "27701", " 27701-1234 ",
+        ]
+        phone_values = [None, "", "N/A", "919-222-2222", "1-919-222+2222", "(919) 222 2222 ext 3", "+52 55 1234 5678", "abc"]
+        fields = (
+            "employer_name", "trade_name_dba", "employer_address_1", "employer_address_2", "employer_city",
+            "employer_state", "employer_country", "employer_postal_code",
+        )
+
+        rows = []
+        for _ in range(2000):
+            row = {f: rng.choice(string_values) for f in fields}
+            row["employer_postal_code"] = rng.choice([None, "27701", " 27701 ", "N/A", ""])
+            row["employer_phone"] = rng.choice(phone_values)
+            row["phone_to_apply"] = rng.choice(phone_values)
+            rows.append(row)
+
+        expected = []
+        for row in rows:
+            job_order = DolDisclosureJobOrder(**row).clean()
+            expected.append({k: getattr(job_order, k) for k in row.keys()})
+
+        columns = DolDisclosureJobOrder.clean_columns({k: [r[k] for r in rows] for k in rows[0].keys()})
+        actual = [dict(zip(columns.keys(), values)) for values in zip(*columns.values())]
+
+        self.assertEqual(expected, actual)
+
+    def test_clean_columns_fills_missing_columns(self):
+        columns = DolDisclosureJobOrder.clean_columns({"employer_state": ["north carolina", None]})
+        self.assertEqual(["NC", None], columns["employer_state"])
+        self.assertEqual(["UNITED STATES OF AMERICA", None], columns["employer_country"])
+        self.assertEqual([None, None], columns["employer_phone"])
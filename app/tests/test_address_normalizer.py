@@ -0,0 +1,47 @@
+from unittest.mock import MagicMock
+
+from app.actions import check_address_normalizer_parity
+from app.address_normalizer import normalize_address_offline
+from app.tests.base_test_case import BaseTestCase
+
+
+class TestAddressNormalizer(BaseTestCase):
+    use_session = False
+
+    def test_abbreviates_suffixes_directionals_and_units(self):
+        self.assertEqual("123 N MAIN ST STE 4, RALEIGH, NC 27601",
+                         normalize_address_offline("123 North Main Street Suite 4, Raleigh, NC 27601"))
+        self.assertEqual("500 W OAK AVE # 12, YUMA, AZ 85364", normalize_address_offline("500 W. Oak Ave. #12, Yuma, AZ 85364"))
+        self.assertEqual("1 SOUTHERN PKWY SW APT 2", normalize_address_offline("1 Southern Parkway Southwest Apartment 2"))
+        self.assertEqual("HWY 17 S, KINSTON, NC 28501", normalize_address_offline("Highway 17 South, Kinston, NC 28501"))
+        # A directional which is the street name isn't abbreviated.
+        self.assertEqual("2 EAST ST", normalize_address_offline("2 East Street"))
+
+    def test_normalizes_states_zip_codes_and_countries(self):
+        self.assertEqual("1 MAIN ST, NEW YORK, NY 10001",
+                         normalize_address_offline("1 Main St, New York, New York 10001-1234 UNITED STATES OF AMERICA"))
+        self.assertEqual("1 MAIN ST, CITY, NC 27701", normalize_address_offline("1 Main St, City, NC 27701 USA"))
+        self.assertEqual("1 MAIN ST, NC 27701", normalize_address_offline("1 Main St, north carolina 27701"))
+        self.assertEqual("1 MAIN ST, CITY 27701", normalize_address_offline("1 Main St, City 27701"))
+        self.assertEqual("", normalize_address_offline(", USA"))
+        self.assertEqual("", normalize_address_offline(None))
+
+    def test_checks_parity_with_pagc(self):
+        self.monkeypatch.setattr(check_address_normalizer_parity, 'pagc_normalize_addresses', MagicMock(return_value={
+            "1 Main Street, City, NC 27701": "1 MAIN ST, CITY, NC 27701",
+            "2 Camino Real, City, NC 27701": "2 CAMINO REAL, CITY, NC 27701",
+        }))
+        mismatches = check_address_normalizer_parity.get_mismatches(
+            ["1 Main Street, City, NC 27701", "2 Camino Real, City, NC 27701", "3 Failed Rd"], None)
+        self.assertEqual([], mismatches)
+
+        check_address_normalizer_parity.pagc_normalize_addresses.return_value["1 Main Street, City, NC 27701"] = "1 MAIN, CITY, NC 27701"
+        mismatches = check_address_normalizer_parity.get_mismatches(["1 Main Street, City, NC 27701"], None)
+        self.assertEqual([("1 Main Street, City, NC 27701", "1 MAIN, CITY, NC 27701", "1 MAIN ST, CITY, NC 27701")],
+                         mismatches)
+
+        # The normalized addresses are stored as they are, so a difference in case is a mismatch.
+        check_address_normalizer_parity.pagc_normalize_addresses.return_value["1 Main Street, City, NC 27701"] = "1 Main St, City, NC 27701"
+        mismatches = check_address_normalizer_parity.get_mismatches(["1 Main Street, City, NC 27701"], None)
+        self.assertEqual([("1 Main Street, City, NC 27701", "1 Main St, City, NC 27701", "1 MAIN ST, CITY, NC 27701")],
+                         mismatches)
@@ -0,0 +1,67 @@
+from unittest.mock import MagicMock
+
+from sqlalchemy.dialects import postgresql
+from sqlmodel import select
+
+from app.db.bulk import bulk_insert, bulk_upsert
+from app.models.base import CaseStatus, DoLDataSource
+from app.models.dol_disclosure_job_order import DolDisclosureJobOrder
+from app.tests.base_test_case import BaseTestCase
+
+table = DolDisclosureJobOrder.__table__  # type: ignore
+
+
+class TestBulk(BaseTestCase):
+    rows = [
+        {
+            "case_number": "H-300-1",
+            "visa_class": "H-2A",
+            "source": DoLDataSource.dol_disclosure,
+            "case_status": CaseStatus.certified,
+        },
+        {
+            "case_number": "H-300-2",
+            "visa_class": "H-2A",
+            "source": DoLDataSource.scraper,
+            "case_status": CaseStatus.withdrawn,
+        },
+    ]
+
+    def get_copied_rows(self, write) -> list:
+        """
+        Run write against a fake Postgres connection.
+        :param write: function of the connection
+        :return: rows of the COPY FROM STDIN text
+        """
+        copied: list = []
+        connection = MagicMock()
+        connection.dialect = postgresql.dialect()  # type: ignore
+        connection.connection.cursor.return_value.copy_expert.side_effect = (
+            lambda sql, f: copied.extend(line.split("\t") for line in f.read().splitlines())
+        )
+        write(connection)
+        return copied
+
+    def assert_enums_saved(self, rows):
+        saved = self.session.exec(select(DolDisclosureJobOrder).order_by(DolDisclosureJobOrder.case_number)).all()
+        self.assertEqual([(r["source"], r["case_status"]) for r in rows], [(j.source, j.case_status) for j in saved])
+
+    def test_inserts_enums(self):
+        bulk_insert(self.session.connection(), table, self.rows)
+        self.session.commit()
+        self.assert_enums_saved(self.rows)
+
+    def test_upserts_enums(self):
+        connection = self.session.connection()
+        bulk_insert(connection, table, self.rows[:1])
+        updated = [dict(row, case_status=CaseStatus.withdrawn) for row in self.rows]
+        bulk_upsert(connection, table, updated, ["case_number", "visa_class"], ["case_status"])
+        self.session.commit()
+        self.assert_enums_saved(updated)
+
+    def test_copies_enum_values(self):
+        expected = [[row["case_number"], row["visa_class"], row["source"].value, row["case_status"].value]
+                    for row in self.rows]
+        self.assertEqual(expected, self.get_copied_rows(lambda c: bulk_insert(c, table, self.rows)))
+        self.assertEqual(expected, self.get_copied_rows(
+            lambda c: bulk_upsert(c, table, self.rows, ["case_number", "visa_class"], ["case_status"])))
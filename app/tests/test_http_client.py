@@ -0,0 +1,69 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+from urllib3.util.retry import RequestHistory
+
+from app import http_client
+from app.tests.base_test_case import BaseTestCase
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    # Status codes to respond with, in order, then 200.
+    statuses: List[int] = []
+
+    def do_GET(self):
+        status = self.statuses.pop(0) if self.statuses else 200
+        self.send_response(status)
+        if status == 429:
+            self.send_header("Retry-After", "0")
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+class TestHttpClient(BaseTestCase):
+    use_session = False
+
+    def setUp(self):
+        super().setUp()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/"
+        self.host = f"127.0.0.1:{self.server.server_port}"
+        self.monkeypatch.setattr(http_client.settings, 'HTTP_BACKOFF_FACTOR', 0.01)
+        self.http = http_client.get_http_session(refresh=True)
+
+    def tearDown(self):
+        super().tearDown()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_retries_server_errors(self):
+        FlakyHandler.statuses = [503, 429, 502]
+
+        response = self.http.get(self.url, timeout=5)
+        self.assertEqual(200, response.status_code)
+        metrics = http_client.get_request_metrics(self.host)[self.host]
+        self.assertEqual(1, metrics["requests"])
+        self.assertEqual(3, metrics["retries"])
+        self.assertEqual(0, metrics["errors"])
+
+    def test_returns_last_response_when_retries_run_out(self):
+        self.monkeypatch.setattr(http_client.settings, 'HTTP_MAX_RETRIES', 1)
+        self.http = http_client.get_http_session(refresh=True)
+        FlakyHandler.statuses = [500, 500, 500]
+
+        self.assertEqual(500, self.http.get(self.url, timeout=5).status_code)
+        self.assertEqual(1, http_client.get_request_metrics(self.host)[self.host]["errors"])
+        FlakyHandler.statuses = []
+
+    def test_backoff_is_jittered(self):
+        retry = http_client.get_retry().new(history=(RequestHistory("GET", "/", None, 503, None),) * 4)
+        backoffs = {retry.get_backoff_time() for _ in range(10)}
+        self.assertEqual(10, len(backoffs))
+        self.assertTrue(all(0 <= b <= 0.01 * 2 ** 3 for b in backoffs))
+        self.assertEqual(http_client.settings.HTTP_MAX_BACKOFF, retry.parse_retry_after("86400"))